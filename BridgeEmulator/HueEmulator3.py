@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-from flask import Flask
+from flask import Flask, request, make_response, jsonify
 from flask_cors import CORS
 from flask_restful import Api
 from werkzeug.security import check_password_hash
@@ -13,6 +13,7 @@ import time
 
 import configManager
 import logManager
+from HueObjects import bumpStateVersion
 import flask_login
 from flaskUI.core import User  # dummy import for flask_login module
 from flaskUI.restful import (
@@ -23,6 +24,8 @@ from flaskUI.v2restapi import AuthV1, ClipV2, ClipV2Resource, ClipV2ResourceId
 from flaskUI.espDevices import Switch
 from flaskUI.Credits import Credits
 from functions.daylightSensor import daylightSensor
+from functions.jsonEncoder import dumps
+from functions.rateLimiter import rateLimiter
 
 # Initialize configurations and logging
 bridgeConfig = configManager.bridgeConfig.yaml_config
@@ -33,7 +36,37 @@ app = Flask(__name__, template_folder='flaskUI/templates', static_url_path="/ass
 api = Api(app)
 cors = CORS(app, resources={r"*": {"origins": "*"}})
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24))  # Load from environment variable or generate a random key
-api.app.config['RESTFUL_JSON'] = {'ensure_ascii': False}
+
+@api.representation('application/json')
+def output_json(data, code, headers=None):
+    # encode every flask-restful response with the fast encoder, non ascii characters are kept as UTF-8
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+@app.before_request
+def throttle_api_keys():
+    # token bucket per API key, a client hammering the API is answered before any handler runs
+    if request.remote_addr == "127.0.0.1":
+        return None
+    key = request.headers.get("hue-application-key") or (request.view_args or {}).get("username")
+    if key not in bridgeConfig["apiUsers"] or rateLimiter.allow(key):
+        return None
+    if request.path.startswith("/clip/v2"):
+        response = jsonify({"errors": [{"description": "too many requests"}], "data": []})
+    else:
+        response = jsonify([{"error": {"type": 901, "address": request.path, "description": "too many requests"}}])
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, round(rateLimiter.retryAfter(key))))
+    return response
+
+@app.after_request
+def invalidate_response_cache(response):
+    # writes through the APIs or the web UI change the state served from the response cache
+    if request.method not in ["GET", "HEAD", "OPTIONS"]:
+        bumpStateVersion()
+    return response
 
 # Initialize Flask-Login
 login_manager = flask_login.LoginManager()
@@ -1,12 +1,36 @@
 from datetime import datetime, timezone
+from time import monotonic, time
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+NEVER_USED = float("-inf")  # last_use of a key that made no request yet, idle for the state sync
 
 class ApiUser():
-    def __init__(self, username, name, client_key, create_date=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"), last_use_date=datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")):
+    def __init__(self, username, name, client_key, create_date=None, last_use_date=None):
         self.username = username
         self.name = name
         self.client_key = client_key
-        self.create_date = create_date
-        self.last_use_date = last_use_date
+        self.create_date = create_date or datetime.now(timezone.utc).strftime(DATE_FORMAT)
+        self.last_use = NEVER_USED  # monotonic clock, formatted only when serialised
+        if last_use_date is not None:
+            self.last_use_date = last_use_date
+
+    @property
+    def last_use_date(self):
+        if self.last_use == NEVER_USED:
+            return self.create_date
+        return datetime.fromtimestamp(round(time() - (monotonic() - self.last_use)), timezone.utc).strftime(DATE_FORMAT)
+
+    @last_use_date.setter
+    def last_use_date(self, value):
+        try:
+            lastUse = datetime.strptime(value, DATE_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            return  # not a proper datetime, keep the current value
+        self.last_use = monotonic() - (time() - lastUse)
+
+    def touch(self):
+        """Record a request made with this key."""
+        self.last_use = monotonic()
 
     def getV1Api(self):
         return {"name": self.name, "create date": self.create_date, "last use date": self.last_use_date}
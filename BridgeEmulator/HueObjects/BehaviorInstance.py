@@ -1,6 +1,6 @@
 import uuid
 import logManager
-from HueObjects import genV2Uuid, StreamEvent
+from HueObjects import genV2Uuid, StreamEvent, invalidateBehaviorIndex
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
 
@@ -16,15 +16,20 @@ class BehaviorInstance:
         self.enabled: bool = data.get("enabled", False)
         self.active: bool = data.get("active", False)
         self.script_id: str = data.get("script_id", "")
+        self.routine: Optional[Dict[str, Any]] = data.get("routine")
 
+        invalidateBehaviorIndex()
         self._send_stream_event(self.getV2Api(), "add")
 
     def __del__(self) -> None:
+        invalidateBehaviorIndex()
         self._send_stream_event({"id": self.id_v2, "type": "behavior_instance"}, "delete")
         logging.info(f"{self.name} behaviour instance was destroyed.")
 
     def activate(self, data: Dict[str, Any]) -> None:
         if "recall" in data and data["recall"].get("action") == "deactive":
+            from functions.routines import routineRunner
+            routineRunner.cancel(self.id_v2, "deactivated")
             self.active = False
 
     def getV2Api(self) -> Dict[str, Any]:
@@ -68,6 +73,10 @@ class BehaviorInstance:
                 setattr(self, key, updateAttribute)
             else:
                 setattr(self, key, value)
+        if newdata.get("enabled") is False:
+            from functions.routines import routineRunner
+            routineRunner.cancel(self.id_v2, "disabled")
+        invalidateBehaviorIndex()
         self._send_stream_event(self.getV2Api(), "update")
 
     def _send_stream_event(self, data: Dict[str, Any], event_type: str) -> None:
@@ -80,7 +89,7 @@ class BehaviorInstance:
         StreamEvent(streamMessage)
 
     def save(self) -> Dict[str, Any]:
-        return {
+        result: Dict[str, Any] = {
             "id": self.id_v2,
             "metadata": {"name": self.name},
             "configuration": self.configuration,
@@ -88,3 +97,6 @@ class BehaviorInstance:
             "active": self.active,
             "script_id": self.script_id
         }
+        if self.routine:
+            result["routine"] = self.routine
+        return result
@@ -2,7 +2,7 @@ import uuid
 import logManager
 import weakref
 from datetime import datetime, timezone
-from HueObjects import genV2Uuid, v1StateToV2, v2StateToV1, setGroupAction, StreamEvent
+from HueObjects import genV2Uuid, v1StateToV2, v2StateToV1, setGroupAction, StreamEvent, invalidateBehaviorIndex, registerV2Ids, derivedV2Id, lightGroups, addMembership, removeMembership
 from typing import Dict, Any, List, Optional, Union
 
 logging = logManager.logger.get_logger(__name__)
@@ -24,16 +24,33 @@ class EntertainmentConfiguration:
         self.state: Dict[str, bool] = {"all_on": False, "any_on": False}
         self.dxState: Dict[str, Optional[bool]] = {"all_on": None, "any_on": None}
 
+        registerV2Ids(self, ["entertainment_configuration"], "grouped_light")
+        invalidateBehaviorIndex()
         self._send_stream_event(self.getV2Api(), "add")
 
     def __del__(self):
+        invalidateBehaviorIndex()
         self._send_stream_event({"id": self.id_v2, "type": "grouped_light"}, "delete")
-        self._send_stream_event({"id": self.getV2Api()["id"], "type": "entertainment_configuration"}, "delete")
+        self._send_stream_event({"id": derivedV2Id(self, 'entertainment_configuration'), "type": "entertainment_configuration"}, "delete")
         logging.info(f"{self.name} entertainment area was destroyed.")
 
     def add_light(self, light: Any) -> None:
+        if self in lightGroups.get(light, ()):
+            return  # already a member
         self.lights.append(weakref.ref(light))
         self.locations[light] = [{"x": 0, "y": 0, "z": 0}]
+        addMembership(lightGroups, light, self)
+
+    def remove_light(self, light: Any) -> None:
+        self.lights[:] = [light_ref for light_ref in self.lights if light_ref() is not None and light_ref() is not light]
+        self.locations.pop(light, None)
+        removeMembership(lightGroups, light, self)
+
+    def clear_lights(self) -> None:
+        for light_ref in self.lights:
+            if light_ref():
+                removeMembership(lightGroups, light_ref(), self)
+        self.lights = []
 
     def update_attr(self, newdata: Dict[str, Any]) -> None:
         newdata.pop("lights", None)
@@ -98,13 +115,13 @@ class EntertainmentConfiguration:
             "stream_proxy": {
                 "mode": "auto",
                 "node": {
-                    "rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.lights[0]().id_v2 + 'entertainment')) if self.lights else None,
+                    "rid": derivedV2Id(self.lights[0](), 'entertainment') if self.lights else None,
                     "rtype": "entertainment"
                 }
             },
             "light_services": [],
             "channels": [],
-            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'entertainment_configuration')),
+            "id": derivedV2Id(self, 'entertainment_configuration'),
             "type": "entertainment_configuration",
             "name": self.name,
             "status": "active" if self.stream["active"] else "inactive"
@@ -115,7 +132,7 @@ class EntertainmentConfiguration:
         for light in self.lights:
             if light():
                 result["light_services"].append({"rtype": "light", "rid": light().id_v2})
-                entertainmentUuid = str(uuid.uuid5(uuid.NAMESPACE_URL, light().id_v2 + 'entertainment'))
+                entertainmentUuid = derivedV2Id(light(), 'entertainment')
                 result["locations"]["service_locations"].append({
                     "equalization_factor": 1,
                     "positions": self.locations[light()],
@@ -1,7 +1,7 @@
 import uuid
 import logManager
 from datetime import datetime, timezone
-from HueObjects import genV2Uuid, StreamEvent
+from HueObjects import genV2Uuid, StreamEvent, registerV2Ids, derivedV2Id
 from typing import Dict, Any, Optional
 
 logging = logManager.logger.get_logger(__name__)
@@ -13,6 +13,7 @@ class GeofenceClient:
         self.is_at_home: bool = data.get('is_at_home', False)
         self.id_v1: Optional[str] = data.get("id_v1")
 
+        registerV2Ids(self, ["geofence_client"])
         self._send_stream_event(self.getV2GeofenceClient(), "add")
 
     def __del__(self) -> None:
@@ -42,7 +43,7 @@ class GeofenceClient:
 
     def getV2GeofenceClient(self) -> Dict[str, str]:
         return {
-            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'geofence_client')),
+            "id": derivedV2Id(self, 'geofence_client'),
             "name": self.name,
             "type": "geofence_client"
         }
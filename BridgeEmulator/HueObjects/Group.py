@@ -1,9 +1,10 @@
 import uuid
 import logManager
 import weakref
+from threading import Lock
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Union
-from HueObjects import genV2Uuid, v1StateToV2, v2StateToV1, setGroupAction, StreamEvent
+from typing import Any, Dict, List, Optional, Tuple, Union
+from HueObjects import genV2Uuid, v1StateToV2, v2StateToV1, setGroupAction, StreamEvent, invalidateBehaviorIndex, registerV2Ids, derivedV2Id, lightGroups, addMembership, removeMembership, lightContribution
 
 logging = logManager.logger.get_logger(__name__)
 
@@ -22,7 +23,13 @@ class Group:
         self.type: str = data.get("type", "LightGroup")
         self.state: Dict[str, bool] = {"all_on": False, "any_on": False}
         self.dxState: Dict[str, Optional[bool]] = {"all_on": None, "any_on": None}
+        # per light contribution (on, brightness sum, lights with brightness) and their running totals
+        self.memberStates: Dict[weakref.ReferenceType, Tuple[int, int, int]] = {}
+        self.aggregate: List[int] = [0, 0, 0]
+        self._aggregateLock = Lock()
 
+        registerV2Ids(self, ["room", "zone", "bridge_home"], "grouped_light")
+        invalidateBehaviorIndex()
         self._send_stream_event(self._get_v2_group(), "add")
 
     def groupZeroStream(self, rooms: List[str], lights: List[str]) -> None:
@@ -34,7 +41,7 @@ class Group:
             lights (List[str]): List of light IDs.
         """
         streamMessage = {
-            "data": [{"children": [], "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'bridge_home')), "id_v1": "/groups/0", "type": "bridge_home"}],
+            "data": [{"children": [], "id": derivedV2Id(self, 'bridge_home'), "id_v1": "/groups/0", "type": "bridge_home"}],
         }
         for room in rooms:
             streamMessage["data"][0]["children"].append({"rid": room, "rtype": "room"})
@@ -46,6 +53,7 @@ class Group:
         """
         Destructor for the Group class. Sends a delete stream event and logs the destruction.
         """
+        invalidateBehaviorIndex()
         self._send_stream_event({"id": self.id_v2, "id_v1": f"/groups/{self.id_v1}", "type": "grouped_light"}, "delete")
         element = self._get_v2_group()
         self._send_stream_event({"id": element["id"], "id_v1": f"/groups/{self.id_v1}", "type": element["type"]}, "delete")
@@ -58,12 +66,76 @@ class Group:
         Args:
             light (Any): The light object to add.
         """
-        self.lights.append(weakref.ref(light))
+        if self in lightGroups.get(light, ()):
+            return  # already a member
+        groupRef = weakref.ref(self)
+
+        def dropped(light_ref: weakref.ReferenceType) -> None:
+            group = groupRef()
+            if group is not None:
+                group._set_member(light_ref, None)
+
+        light_ref = weakref.ref(light, dropped)
+        self.lights.append(light_ref)
+        self._set_member(light_ref, lightContribution(light.state), add=True)
+        addMembership(lightGroups, light, self)
         element = self._get_v2_group()
         self._send_stream_event({"alert": {"action_values": ["breathe"]}, "id": self.id_v2, "id_v1": f"/groups/{self.id_v1}", "on": {"on": self.action["on"]}, "type": "grouped_light"}, "add")
         self._send_stream_event({"grouped_services": [{"rid": self.id_v2, "rtype": "grouped_light"}], "id": element["id"], "id_v1": f"/groups/{self.id_v1}", "type": element["type"]}, "update")
         self._update_group_children_and_services(element)
 
+    def remove_light(self, light: Any) -> None:
+        """
+        Removes a light from the group and sends the updated children and services.
+
+        Args:
+            light (Any): The light object to remove.
+        """
+        self.lights[:] = [light_ref for light_ref in self.lights if light_ref() is not None and light_ref() is not light]
+        self._set_member(weakref.ref(light), None)
+        removeMembership(lightGroups, light, self)
+        self._update_group_children_and_services(self._get_v2_group())
+
+    def clear_lights(self) -> None:
+        """
+        Removes all lights from the group, the previous list stays with the scenes sharing it.
+        """
+        for light_ref in self.lights:
+            light_instance = light_ref()
+            if light_instance:
+                removeMembership(lightGroups, light_instance, self)
+        self.lights = []
+        with self._aggregateLock:
+            self.memberStates = {}
+            self.aggregate = [0, 0, 0]
+
+    def updateMember(self, light: Any, contribution: Tuple[int, int, int]) -> None:
+        """
+        Applies the new on/brightness contribution of a member light to the group aggregates.
+
+        Args:
+            light (Any): The light whose state changed.
+            contribution (Tuple[int, int, int]): The light's on flag, brightness and brightness count.
+        """
+        self._set_member(weakref.ref(light), contribution)
+
+    def _set_member(self, light_ref: weakref.ReferenceType, contribution: Optional[Tuple[int, int, int]], add: bool = False) -> None:
+        # weak references compare equal while the light lives, so a fresh ref finds the stored entry
+        with self._aggregateLock:
+            if contribution is None:
+                previous = self.memberStates.pop(light_ref, None)
+                if previous is None:
+                    return
+                contribution = (0, 0, 0)
+            else:
+                previous = self.memberStates.get(light_ref)
+                if previous is None:
+                    if not add:
+                        return  # not a member (any more)
+                    previous = (0, 0, 0)
+                self.memberStates[light_ref] = contribution
+            self.aggregate = [total + new - old for total, new, old in zip(self.aggregate, contribution, previous)]
+
     def add_sensor(self, sensor: Any) -> None:
         """
         Adds a sensor to the group.
@@ -91,6 +163,7 @@ class Group:
                 setattr(self, key, updateAttribute)
             else:
                 setattr(self, key, value)
+        invalidateBehaviorIndex()
         self._send_stream_event(self._get_v2_group(), "update")
 
     def update_state(self) -> Dict[str, Union[bool, int]]:
@@ -100,24 +173,15 @@ class Group:
         Returns:
             Dict[str, Union[bool, int]]: Dictionary containing the updated state.
         """
-        all_on = True
-        any_on = False
-        bri = 0
-        lights_on = 0
-        if not self.lights:
-            all_on = False
-        for light_ref in self.lights:
-            light_instance = light_ref()
-            if light_instance:
-                if light_instance.state["on"]:
-                    any_on = True
-                    if "bri" in light_instance.state:
-                        bri += light_instance.state["bri"]
-                        lights_on += 1
-                else:
-                    all_on = False
+        with self._aggregateLock:
+            members = len(self.memberStates)
+            on, bri, lights_on = self.aggregate
+        all_on = members > 0 and on == members
+        any_on = on > 0
         if any_on:
             bri = (((bri / lights_on) / 254) * 100) if bri > 0 else 0
+        else:
+            bri = 0
         return {"all_on": all_on, "any_on": any_on, "avr_bri": int(bri)}
 
     def setV2Action(self, state: Dict[str, Any]) -> None:
@@ -158,28 +222,38 @@ class Group:
                 streamMessage["data"].insert(num, {
                     "id": light_instance.id_v2,
                     "id_v1": f"/lights/{light_instance.id_v1}",
-                    "owner": {"rid": light_instance.getDevice()["id"], "rtype": "device"},
+                    "owner": {"rid": derivedV2Id(light_instance, 'device'), "rtype": "device"},
                     "service_id": light_instance.protocol_cfg.get("light_nr", 1) - 1,
                     "type": "light"
                 })
                 streamMessage["data"][num].update(v2State)
         self._send_stream_event(streamMessage["data"], "update")
+        self._send_stream_event(self.getV2GroupedLightStreamData(v2State), "update")
 
+    def getV2GroupedLightStreamData(self, v2State: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns the grouped light stream event data for the provided V2 state.
+
+        Args:
+            v2State (Dict[str, Any]): The V2 state, the average brightness is added when it switches the group.
+
+        Returns:
+            Dict[str, Any]: The grouped light stream event data.
+        """
         if "on" in v2State:
             v2State["dimming"] = {"brightness": self.update_state()["avr_bri"]}
-        streamMessage = {
-            "data": [{
-                "id": self.id_v2,
-                "id_v1": f"/groups/{self.id_v1}",
-                "type": "grouped_light",
-                "owner": {
-                    "rid": self._get_v2_group()["id"],
-                    "rtype": self._get_v2_group()["type"]
-                }
-            }]
+        element = self._get_v2_group()
+        result = {
+            "id": self.id_v2,
+            "id_v1": f"/groups/{self.id_v1}",
+            "type": "grouped_light",
+            "owner": {
+                "rid": element["id"],
+                "rtype": element["type"]
+            }
         }
-        streamMessage["data"][0].update(v2State)
-        self._send_stream_event(streamMessage["data"][0], "update")
+        result.update(v2State)
+        return result
 
     def _send_stream_event(self, data: Dict[str, Any], event_type: str) -> None:
         """
@@ -252,8 +326,8 @@ class Group:
         for light_ref in self.lights:
             light_instance = light_ref()
             if light_instance:
-                result["children"].append({"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, light_instance.id_v2 + 'device')), "rtype": "device"})
-        result["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'room'))
+                result["children"].append({"rid": derivedV2Id(light_instance, 'device'), "rtype": "device"})
+        result["id"] = derivedV2Id(self, 'room')
         result["id_v1"] = f"/groups/{self.id_v1}"
         result["metadata"] = {"archetype": self.icon_class.replace(" ", "_").replace("'", "").lower(), "name": self.name}
         for light_ref in self.lights:
@@ -275,7 +349,7 @@ class Group:
             light_instance = light_ref()
             if light_instance:
                 result["children"].append({"rid": light_instance.id_v2, "rtype": "light"})
-        result["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zone'))
+        result["id"] = derivedV2Id(self, 'zone')
         result["id_v1"] = f"/groups/{self.id_v1}"
         result["metadata"] = {"archetype": self.icon_class.replace(" ", "_").replace("'", "").lower(), "name": self.name}
         for light_ref in self.lights:
@@ -350,7 +424,7 @@ class Group:
         for light_ref in self.lights:
             light_instance = light_ref()
             if light_instance:
-                groupChildren.append({"rid": light_instance.getDevice()["id"], "rtype": "device"})
+                groupChildren.append({"rid": derivedV2Id(light_instance, 'device'), "rtype": "device"})
                 groupServices.append({"rid": light_instance.id_v2, "rtype": "light"})
         groupServices.append({"rid": self.id_v2, "rtype": "grouped_light"})
         self._send_stream_event({"children": groupChildren, "id": element["id"], "id_v1": f"/groups/{self.id_v1}", "services": groupServices, "type": element["type"]}, "update")
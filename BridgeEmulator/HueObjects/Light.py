@@ -2,14 +2,79 @@ import uuid
 import logManager
 from lights.light_types import lightTypes, archetype
 from lights.protocols import protocols
-from HueObjects import genV2Uuid, incProcess, v1StateToV2, generate_unique_id, v2StateToV1, StreamEvent
+from functions.fadeEngine import fadeEngine
+from HueObjects import genV2Uuid, incProcess, v1StateToV2, generate_unique_id, v2StateToV1, StreamEvent, bumpStateVersion, invalidateBehaviorIndex, invalidateDeviceIndex, registerV2Ids, derivedV2Id, groupsOfLight, lightContribution
 from datetime import datetime, timezone
+import weakref
 from copy import deepcopy
+from functools import cached_property
 from time import sleep
 from typing import Dict, Any, List, Optional
 
 logging = logManager.logger.get_logger(__name__)
 
+class LightState(dict):
+    """
+    The state dict of a light, pushing on/brightness changes to the aggregates of the groups containing the light.
+
+    Any change bumps the state version, so the cached API responses follow the protocol services that write
+    the state directly.
+    """
+    def __init__(self, light: "Light", data: Dict[str, Any]) -> None:
+        super().__init__(data)
+        self._light = weakref.ref(light)
+        self._contribution = lightContribution(self)
+
+    def _push(self, force: bool = False) -> None:
+        contribution = lightContribution(self)
+        if contribution == self._contribution and not force:
+            return
+        self._contribution = contribution
+        light = self._light()
+        if light is not None:
+            for group in groupsOfLight(light):
+                if hasattr(group, "updateMember"):
+                    group.updateMember(light, contribution)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self or self[key] != value:
+            bumpStateVersion()
+        super().__setitem__(key, value)
+        if key in ("on", "bri"):
+            self._push()
+
+    def __delitem__(self, key: str) -> None:
+        super().__delitem__(key)
+        bumpStateVersion()
+        self._push()
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        data = dict(*args, **kwargs)
+        if any(key not in self or self[key] != value for key, value in data.items()):
+            bumpStateVersion()
+        super().update(data)
+        self._push()
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            bumpStateVersion()
+        value = super().setdefault(key, default)
+        self._push()
+        return value
+
+    def pop(self, *args: Any) -> Any:
+        if args and args[0] in self:
+            bumpStateVersion()
+        value = super().pop(*args)
+        self._push()
+        return value
+
+    def __copy__(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> Dict[str, Any]:
+        return deepcopy(dict(self), memo)
+
 class Light:
     def __init__(self, data: Dict[str, Any]) -> None:
         self.name: str = data["name"]
@@ -27,8 +92,19 @@ class Light:
         self.function: str = data.get("function", "mixed")
         self.controlled_service: str = data.get("controlled_service", "manual")
 
+        registerV2Ids(self, ["device", "zigbee_connectivity", "entertainment"], "light")
+        invalidateBehaviorIndex()
         self._initialize_stream_events()
 
+    @property
+    def state(self) -> LightState:
+        return self._state
+
+    @state.setter
+    def state(self, value: Dict[str, Any]) -> None:
+        self._state = LightState(self, value)
+        self._state._push(force=True)
+
     def _initialize_stream_events(self) -> None:
         self._send_stream_event(self.getV2Entertainment(), "add")
         self._send_stream_event(self.getZigBee(), "add")
@@ -36,10 +112,11 @@ class Light:
         self._send_stream_event(self.getDevice(), "add")
 
     def __del__(self) -> None:
+        invalidateDeviceIndex()
         self._send_stream_event({"id": self.id_v2, "type": "light"}, "delete")
-        self._send_stream_event({"id": self.getDevice()["id"], "type": "device"}, "delete")
-        self._send_stream_event({"id": self.getZigBee()["id"], "type": "zigbee_connectivity"}, "delete")
-        self._send_stream_event({"id": self.getV2Entertainment()["id"], "type": "entertainment"}, "delete")
+        self._send_stream_event({"id": derivedV2Id(self, 'device'), "type": "device"}, "delete")
+        self._send_stream_event({"id": derivedV2Id(self, 'zigbee_connectivity'), "type": "zigbee_connectivity"}, "delete")
+        self._send_stream_event({"id": derivedV2Id(self, 'entertainment'), "type": "entertainment"}, "delete")
         logging.info(f"{self.name} light was destroyed.")
 
     def update_attr(self, newdata: Dict[str, Any]) -> None:
@@ -50,10 +127,15 @@ class Light:
                 setattr(self, key, updateAttribute)
             else:
                 setattr(self, key, value)
+        if "modelid" in newdata:
+            self.__dict__.pop("v2Static", None)
+        if "protocol" in newdata or "protocol_cfg" in newdata:
+            invalidateDeviceIndex()
         self._send_stream_event(self.getDevice(), "update")
 
     def getV1Api(self) -> Dict[str, Any]:
-        result = deepcopy(lightTypes[self.modelid]["v1_static"])
+        # the nested static fragments are shared between lights, they must be treated as read only
+        result = dict(lightTypes[self.modelid]["v1_static"])
         result["config"] = self.config
         result["state"] = {"on": self.state["on"]}
         if "bri" in self.state and self.modelid not in ["LOM001", "LOM004", "LOM010"]:
@@ -86,6 +168,7 @@ class Light:
             self.state["colormode"] = "hs"
 
     def setV1State(self, state: Dict[str, Any], advertise: bool = True) -> None:
+        fadeEngine.interrupt(self, state)
         if "lights" not in state:
             state = incProcess(self.state, state)
             self.updateLightState(state)
@@ -108,6 +191,22 @@ class Light:
                 if "max_bri" in self.protocol_cfg and self.protocol_cfg["max_bri"] < state["bri"]:
                     state["bri"] = self.protocol_cfg["max_bri"]
 
+        if not fadeEngine.start(self, state):
+            self.applyProtocolState(state)
+        if advertise:
+            if "lights" in state:
+                for item in state["lights"]:
+                    light_state = state["lights"][item]
+                    v2State = v1StateToV2(light_state)
+                    self.genStreamEvent(v2State)
+
+    def applyProtocolState(self, state: Dict[str, Any]) -> None:
+        """
+        Send a v1 state to the device through its protocol, without touching the stored state.
+
+        Args:
+            state (Dict[str, Any]): The state to send.
+        """
         if self.protocol not in ["dummy"]:
             for protocol in protocols:
                 if "lights.protocols." + self.protocol == protocol.__name__:
@@ -117,14 +216,22 @@ class Light:
                     except Exception as e:
                         self.state["reachable"] = False
                         logging.warning(f"{self.name} light error, details: {e}")
-        if advertise:
-            if "lights" in state:
-                for item in state["lights"]:
-                    light_state = state["lights"][item]
-                    v2State = v1StateToV2(light_state)
-                    self.genStreamEvent(v2State)
 
     def setV2State(self, state: Dict[str, Any]) -> None:
+        v1State = self.v2ToV1State(state)
+        self.setV1State(v1State, advertise=False)
+        self.genStreamEvent(state)
+
+    def v2ToV1State(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convert a v2 light state to v1, applying the effect, dynamics speed and controlled service on the way.
+
+        Args:
+            state (Dict[str, Any]): The v2 state, controlled_service is removed from it.
+
+        Returns:
+            Dict[str, Any]: The v1 state.
+        """
         v1State = v2StateToV1(state)
         if "effects_v2" in state and "action" in state["effects_v2"]:
             v1State["effect"] = state["effects_v2"]["action"]["effect"]
@@ -144,19 +251,19 @@ class Light:
         if "controlled_service" in state:
             self.controlled_service = state["controlled_service"]
             del state["controlled_service"]
-        self.setV1State(v1State, advertise=False)
-        self.genStreamEvent(state)
+        return v1State
 
     def genStreamEvent(self, v2State: Dict[str, Any]) -> None:
-        streamMessage = {
-            "data": [{"id": self.id_v2, "id_v1": f"/lights/{self.id_v1}", "type": "light"}],
-        }
-        streamMessage["data"][0].update(v2State)
-        streamMessage["data"][0].update({"owner": {"rid": self.getDevice()["id"], "rtype": "device"}})
-        streamMessage["data"][0].update({"service_id": self.protocol_cfg.get("light_nr", 1) - 1})
-        self._send_stream_event(streamMessage["data"][0], "update")
+        self._send_stream_event(self.getV2StreamData(v2State), "update")
         self._send_stream_event(self.getDevice(), "update")
 
+    def getV2StreamData(self, v2State: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"id": self.id_v2, "id_v1": f"/lights/{self.id_v1}", "type": "light"}
+        result.update(v2State)
+        result.update({"owner": {"rid": derivedV2Id(self, 'device'), "rtype": "device"}})
+        result.update({"service_id": self.protocol_cfg.get("light_nr", 1) - 1})
+        return result
+
     def _send_stream_event(self, data: Dict[str, Any], event_type: str) -> None:
         streamMessage = {
             "creationtime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -169,7 +276,7 @@ class Light:
 
     def getDevice(self) -> Dict[str, Any]:
         result = {
-            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device')),
+            "id": derivedV2Id(self, 'device'),
             "id_v1": f"/lights/{self.id_v1}",
             "identify": {},
             "metadata": {
@@ -180,8 +287,8 @@ class Light:
             "service_id": self.protocol_cfg.get("light_nr", 1) - 1,
             "services": [
                 {"rid": self.id_v2, "rtype": "light"},
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')), "rtype": "zigbee_connectivity"},
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'entertainment')), "rtype": "entertainment"}
+                {"rid": derivedV2Id(self, 'zigbee_connectivity'), "rtype": "zigbee_connectivity"},
+                {"rid": derivedV2Id(self, 'entertainment'), "rtype": "entertainment"}
             ],
             "type": "device"
         }
@@ -190,10 +297,10 @@ class Light:
 
     def getZigBee(self) -> Dict[str, Any]:
         return {
-            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')),
+            "id": derivedV2Id(self, 'zigbee_connectivity'),
             "id_v1": f"/lights/{self.id_v1}",
             "mac_address": self.uniqueid[:23],
-            "owner": {"rid": self.getDevice()["id"], "rtype": "device"},
+            "owner": {"rid": derivedV2Id(self, 'device'), "rtype": "device"},
             "status": "connected" if self.state["reachable"] else "connectivity_issue",
             "type": "zigbee_connectivity"
         }
@@ -217,7 +324,7 @@ class Light:
             "metadata": {"name": self.name, "function": self.function, "archetype": archetype[self.config["archetype"]]},
             "mode": "streaming" if self.state.get("mode") == "streaming" else "normal",
             "on": {"on": self.state["on"]},
-            "owner": {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device')), "rtype": "device"},
+            "owner": {"rid": derivedV2Id(self, 'device'), "rtype": "device"},
             "product_data": {"function": "mixed"},
             "signaling": {"signal_values": ["no_signal", "on_off"]},
             "powerup": {
@@ -238,15 +345,10 @@ class Light:
             }
             result["gradient"] = {"points": self.state["gradient"]["points"], "points_capable": self.protocol_cfg["points_capable"]}
 
-        if self.modelid in ["LST002", "LCT001", "LCT015", "LCX002", "915005987201", "LCX004", "LCX006", "LCA005", "LLC010"]:
-            colorgamut = lightTypes[self.modelid]["v1_static"]["capabilities"]["control"]["colorgamut"]
+        if "gamut" in self.v2Static:
             result["color"] = {
-                "gamut": {
-                    "blue": {"x": colorgamut[2][0], "y": colorgamut[2][1]},
-                    "green": {"x": colorgamut[1][0], "y": colorgamut[1][1]},
-                    "red": {"x": colorgamut[0][0], "y": colorgamut[0][1]}
-                },
-                "gamut_type": lightTypes[self.modelid]["v1_static"]["capabilities"]["control"]["colorgamuttype"],
+                "gamut": self.v2Static["gamut"],
+                "gamut_type": self.v2Static["gamut_type"],
                 "xy": {"x": self.state["xy"][0], "y": self.state["xy"][1]}
             }
 
@@ -269,18 +371,37 @@ class Light:
         return result
 
     def getV2Entertainment(self) -> Dict[str, Any]:
-        entertainmenUuid = str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'entertainment'))
+        entertainmenUuid = derivedV2Id(self, 'entertainment')
         result = {
             "equalizer": True,
             "id": entertainmenUuid,
             "id_v1": f"/lights/{self.id_v1}",
-            "proxy": lightTypes[self.modelid]["v1_static"]["capabilities"]["streaming"]["proxy"],
-            "renderer": lightTypes[self.modelid]["v1_static"]["capabilities"]["streaming"]["renderer"],
+            "proxy": self.v2Static["proxy"],
+            "renderer": self.v2Static["renderer"],
             "renderer_reference": {"rid": self.id_v2, "rtype": "light"},
-            "owner": {"rid": self.getDevice()["id"], "rtype": "device"},
-            "segments": {"configurable": False},
+            "owner": {"rid": derivedV2Id(self, 'device'), "rtype": "device"},
+            "segments": self.v2Static["segments"],
             "type": "entertainment"
         }
+        return result
+
+    @cached_property
+    def v2Static(self) -> Dict[str, Any]:
+        """Model dependent fragments of the v2 resources, built once. Treat them as read only."""
+        capabilities = lightTypes[self.modelid]["v1_static"]["capabilities"]
+        result = {
+            "proxy": capabilities["streaming"]["proxy"],
+            "renderer": capabilities["streaming"]["renderer"],
+            "segments": {"configurable": False}
+        }
+        if self.modelid in ["LST002", "LCT001", "LCT015", "LCX002", "915005987201", "LCX004", "LCX006", "LCA005", "LLC010"]:
+            colorgamut = capabilities["control"]["colorgamut"]
+            result["gamut"] = {
+                "blue": {"x": colorgamut[2][0], "y": colorgamut[2][1]},
+                "green": {"x": colorgamut[1][0], "y": colorgamut[1][1]},
+                "red": {"x": colorgamut[0][0], "y": colorgamut[0][1]}
+            }
+            result["gamut_type"] = capabilities["control"]["colorgamuttype"]
 
         if self.modelid == "LCX002":
             result["segments"]["max_segments"] = 7
@@ -303,7 +424,6 @@ class Light:
         else:
             result["segments"]["max_segments"] = 1
             result["segments"]["segments"] = [{"length": 1, "start": 0}]
-
         return result
 
     def getObjectPath(self) -> Dict[str, str]:
@@ -354,5 +474,5 @@ class Light:
 
     def save(self) -> Dict[str, Any]:
         result = {"id_v2": self.id_v2, "name": self.name, "modelid": self.modelid, "uniqueid": self.uniqueid, "function": self.function,
-                  "state": self.state, "config": self.config, "protocol": self.protocol, "protocol_cfg": self.protocol_cfg}
+                  "state": dict(self.state), "config": self.config, "protocol": self.protocol, "protocol_cfg": self.protocol_cfg}
         return result
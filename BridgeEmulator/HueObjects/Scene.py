@@ -3,8 +3,9 @@ import logManager
 import weakref
 from threading import Thread
 from datetime import datetime, timezone
-from typing import Dict, List, Optional, Union, Any
-from HueObjects import genV2Uuid, StreamEvent
+from typing import Callable, Dict, List, Optional, Union, Any
+from functions.fadeEngine import fadeEngine
+from HueObjects import genV2Uuid, StreamEvent, registerV2Ids, derivedV2Id, lightScenes, groupScenes, addMembership, removeMembership
 
 logging = logManager.logger.get_logger(__name__)
 
@@ -31,6 +32,8 @@ class Scene:
         if "group" in data:
             self.storelightstate()
             self.lights = self.group().lights
+        self._index_members(addMembership)
+        registerV2Ids(self, [], "scene")
         self._send_stream_event(self.getV2Api(), "add")
 
     def __del__(self):
@@ -47,8 +50,26 @@ class Scene:
         }
         StreamEvent(streamMessage)
 
+    def _index_members(self, update: Callable[[Any, Any, Any], None]) -> None:
+        # group scenes follow the lights of their group, light scenes are indexed per light
+        if self.group is not None:
+            if self.group():
+                update(groupScenes, self.group(), self)
+        else:
+            for light in self.lights:
+                if light():
+                    update(lightScenes, light(), self)
+
     def add_light(self, light: weakref.ref) -> None:
         self.lights.append(light)
+        if self.group is None and light():
+            addMembership(lightScenes, light(), self)
+
+    def remove_light(self, light: Any) -> None:
+        if self.group is None:
+            self.lights = [light_ref for light_ref in self.lights if light_ref() is not None and light_ref() is not light]
+            removeMembership(lightScenes, light, self)
+        self.lightstates.pop(light, None)
 
     def activate(self, data: Dict[str, Any]) -> None:
         if "recall" in data:
@@ -72,14 +93,16 @@ class Scene:
     def _activate_static_scene(self, data: Dict[str, Any]) -> None:
         queueState = {}
         self.status = data["recall"]["action"]
-        for light, state in self.lightstates.items():
-            logging.debug(state)
-            light.state.update(state)
+        for light, sceneState in self.lightstates.items():
+            logging.debug(sceneState)
+            state = dict(sceneState)  # the transition time of a recall is not stored in the scene
+            self._update_transition_time(state, data)
+            fadeEngine.interrupt(light, state)  # the fade origin is captured before the light state is overwritten
+            light.state.update(sceneState)
             light.updateLightState(state)
             if light.dynamics["status"] == "dynamic_palette":
                 light.dynamics["status"] = "none"
                 logging.debug(f"Stop Dynamic scene play for {light.name}")
-            self._update_transition_time(state, data)
             light.controlled_service = data.get("controlled_service", {"rid": self.id_v2, "rtype": "scene"})
 
             if light.protocol in ["native_multi", "mqtt"]:
@@ -161,7 +184,7 @@ class Scene:
 
         if self.type == "GroupScene" and self.group():
             result["group"] = {
-                "rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.group().id_v2 + self.group().type.lower())),
+                "rid": derivedV2Id(self.group(), self.group().type.lower()),
                 "rtype": self.group().type.lower()
             }
         result["metadata"] = {"name": self.name}
@@ -201,6 +224,9 @@ class Scene:
         if newdata.get("storelightstate"):
             self.storelightstate()
             return
+        reindex = "lights" in newdata or "group" in newdata
+        if reindex:
+            self._index_members(removeMembership)
         for key, value in newdata.items():
             updateAttribute = getattr(self, key)
             if isinstance(updateAttribute, dict):
@@ -208,6 +234,8 @@ class Scene:
                 setattr(self, key, updateAttribute)
             else:
                 setattr(self, key, value)
+        if reindex:
+            self._index_members(addMembership)
 
     def getObjectPath(self) -> Dict[str, str]:
         return {"resource": "scenes", "id": self.id_v1}
@@ -5,7 +5,7 @@ from typing import Any, Dict, Optional
 
 import logManager
 from sensors.sensor_types import sensorTypes
-from HueObjects import genV2Uuid, StreamEvent
+from HueObjects import genV2Uuid, StreamEvent, registerV2Ids, derivedV2Id, invalidateDeviceIndex
 
 logging = logManager.logger.get_logger(__name__)
 
@@ -39,6 +39,7 @@ class Sensor:
         self.recycle = data.get("recycle", False)
         self.uniqueid = data.get("uniqueid")
 
+        registerV2Ids(self, ["device", "zigbee_connectivity", "device_power", "motion", "light_level", "temperature", "relative_rotary", "contact", "button1", "button2", "button3", "button4"])
         if self.getDevice() is not None:
             streamMessage = {
                 "creationtime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -50,6 +51,7 @@ class Sensor:
             StreamEvent(streamMessage)
 
     def __del__(self) -> None:
+        invalidateDeviceIndex()
         if self.modelid in ["SML001", "RWL022"]:
             streamMessage = {
                 "creationtime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -109,11 +111,11 @@ class Sensor:
                     "software_version": "1.1.27575"
                 },
                 "services": [
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'motion')), "rtype": "motion"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device_power')), "rtype": "device_power"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')), "rtype": "zigbee_connectivity"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'light_level')), "rtype": "light_level"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'temperature')), "rtype": "temperature"}
+                    {"rid": derivedV2Id(self, 'motion'), "rtype": "motion"},
+                    {"rid": derivedV2Id(self, 'device_power'), "rtype": "device_power"},
+                    {"rid": derivedV2Id(self, 'zigbee_connectivity'), "rtype": "zigbee_connectivity"},
+                    {"rid": derivedV2Id(self, 'light_level'), "rtype": "light_level"},
+                    {"rid": derivedV2Id(self, 'temperature'), "rtype": "temperature"}
                 ]
             }
         elif self.modelid in ["RWL022", "RWL021", "RWL020"]:
@@ -133,28 +135,28 @@ class Sensor:
                     "hardware_platform_type": "100b-119"
                 },
                 "services": [
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button1')), "rtype": "button"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button2')), "rtype": "button"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button3')), "rtype": "button"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button4')), "rtype": "button"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device_power')), "rtype": "device_power"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')), "rtype": "zigbee_connectivity"}
+                    {"rid": derivedV2Id(self, 'button1'), "rtype": "button"},
+                    {"rid": derivedV2Id(self, 'button2'), "rtype": "button"},
+                    {"rid": derivedV2Id(self, 'button3'), "rtype": "button"},
+                    {"rid": derivedV2Id(self, 'button4'), "rtype": "button"},
+                    {"rid": derivedV2Id(self, 'device_power'), "rtype": "device_power"},
+                    {"rid": derivedV2Id(self, 'zigbee_connectivity'), "rtype": "zigbee_connectivity"}
                 ]
             }
         elif self.modelid == "RDM002":
             services = [
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button1')), "rtype": "button"},
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button2')), "rtype": "button"},
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button3')), "rtype": "button"},
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'button4')), "rtype": "button"},
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device_power')), "rtype": "device_power"},
-                {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')), "rtype": "zigbee_connectivity"}
+                {"rid": derivedV2Id(self, 'button1'), "rtype": "button"},
+                {"rid": derivedV2Id(self, 'button2'), "rtype": "button"},
+                {"rid": derivedV2Id(self, 'button3'), "rtype": "button"},
+                {"rid": derivedV2Id(self, 'button4'), "rtype": "button"},
+                {"rid": derivedV2Id(self, 'device_power'), "rtype": "device_power"},
+                {"rid": derivedV2Id(self, 'zigbee_connectivity'), "rtype": "zigbee_connectivity"}
             ]
             if self.type == "ZLLRelativeRotary":
                 services = [
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'relative_rotary')), "rtype": "relative_rotary"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device_power')), "rtype": "device_power"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')), "rtype": "zigbee_connectivity"}
+                    {"rid": derivedV2Id(self, 'relative_rotary'), "rtype": "relative_rotary"},
+                    {"rid": derivedV2Id(self, 'device_power'), "rtype": "device_power"},
+                    {"rid": derivedV2Id(self, 'zigbee_connectivity'), "rtype": "zigbee_connectivity"}
                 ]
             return {
                 "id": self.id_v2,
@@ -190,9 +192,9 @@ class Sensor:
                     "hardware_platform_type": "100b-125"
                 },
                 "services": [
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'contact')), "rtype": "contact"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device_power')), "rtype": "device_power"},
-                    {"rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')), "rtype": "zigbee_connectivity"}
+                    {"rid": derivedV2Id(self, 'contact'), "rtype": "contact"},
+                    {"rid": derivedV2Id(self, 'device_power'), "rtype": "device_power"},
+                    {"rid": derivedV2Id(self, 'zigbee_connectivity'), "rtype": "zigbee_connectivity"}
                 ]
             }
         return None
@@ -201,7 +203,7 @@ class Sensor:
         if self.modelid == "SML001" and self.type == "ZLLPresence":
             return {
                 "enabled": self.config["on"],
-                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'motion')),
+                "id": derivedV2Id(self, 'motion'),
                 "id_v1": "/sensors/" + self.id_v1,
                 "motion": {
                     "motion_report": {
@@ -215,7 +217,7 @@ class Sensor:
                     "sensitivity_max": 2
                 },
                 "owner": {
-                    "rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device')),
+                    "rid": derivedV2Id(self, 'device'),
                     "rtype": "device"
                 },
                 "type": "motion"
@@ -226,7 +228,7 @@ class Sensor:
         if self.modelid == "SML001" and self.type == "ZLLTemperature":
             return {
                 "enabled": self.config["on"],
-                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'temperature')),
+                "id": derivedV2Id(self, 'temperature'),
                 "id_v1": "/sensors/" + self.id_v1,
                 "temperature": {
                     "temperature_report": {
@@ -235,7 +237,7 @@ class Sensor:
                     }
                 },
                 "owner": {
-                    "rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device')),
+                    "rid": derivedV2Id(self, 'device'),
                     "rtype": "device"
                 },
                 "type": "temperature"
@@ -246,7 +248,7 @@ class Sensor:
         if self.modelid == "SML001" and self.type == "ZLLLightLevel":
             return {
                 "enabled": self.config["on"],
-                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'light_level')),
+                "id": derivedV2Id(self, 'light_level'),
                 "id_v1": "/sensors/" + self.id_v1,
                 "light": {
                     "light_level_report": {
@@ -255,7 +257,7 @@ class Sensor:
                     }
                 },
                 "owner": {
-                    "rid": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device')),
+                    "rid": derivedV2Id(self, 'device'),
                     "rtype": "device"
                 },
                 "type": "light_level"
@@ -268,7 +270,7 @@ class Sensor:
         if not self.uniqueid:
             return None
         return {
-            "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'zigbee_connectivity')),
+            "id": derivedV2Id(self, 'zigbee_connectivity'),
             "id_v1": "/sensors/" + self.id_v1,
             "owner": {"rid": self.id_v2, "rtype": "device"},
             "type": "zigbee_connectivity",
@@ -280,7 +282,7 @@ class Sensor:
         if self.modelid in ["RWL022", "RWL021", "RWL020", "RDM002"] and self.type != "ZLLRelativeRotary":
             return [
                 {
-                    "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + f'button{button + 1}')),
+                    "id": derivedV2Id(self, f'button{button + 1}'),
                     "id_v1": "/sensors/" + self.id_v1,
                     "owner": {"rid": self.id_v2, "rtype": "device"},
                     "metadata": {"control_id": button + 1},
@@ -307,7 +309,7 @@ class Sensor:
     def getRotary(self) -> Optional[Dict[str, Any]]:
         if self.modelid == "RDM002" and self.type == "ZLLRelativeRotary":
             return {
-                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'relative_rotary')),
+                "id": derivedV2Id(self, 'relative_rotary'),
                 "id_v1": "/sensors/" + self.id_v1,
                 "owner": {"rid": self.id_v2, "rtype": "device"},
                 "relative_rotary": {
@@ -328,7 +330,7 @@ class Sensor:
     def getDevicePower(self) -> Optional[Dict[str, Any]]:
         if "battery" in self.config:
             return {
-                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'device_power')),
+                "id": derivedV2Id(self, 'device_power'),
                 "id_v1": "/sensors/" + self.id_v1,
                 "owner": {"rid": self.id_v2, "rtype": "device"},
                 "power_state": {
@@ -342,7 +344,7 @@ class Sensor:
     def getContact(self) -> Optional[Dict[str, Any]]:
         if self.modelid == "SOC001":
             return {
-                "id": str(uuid.uuid5(uuid.NAMESPACE_URL, self.id_v2 + 'contact')),
+                "id": derivedV2Id(self, 'contact'),
                 "id_v1": "/sensors/" + self.id_v1,
                 "owner": {"rid": self.id_v2, "rtype": "device"},
                 "contact_report": {
@@ -369,6 +371,8 @@ class Sensor:
                 setattr(self, key, updateAttribute)
             else:
                 setattr(self, key, value)
+        if "protocol" in newdata or "protocol_cfg" in newdata:
+            invalidateDeviceIndex()
         streamMessage = {
             "creationtime": datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
             "data": [self.getButtons()],
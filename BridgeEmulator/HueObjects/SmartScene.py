@@ -2,7 +2,7 @@ import uuid
 import logManager
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
-from HueObjects import genV2Uuid, StreamEvent
+from HueObjects import genV2Uuid, StreamEvent, registerV2Ids
 
 logging = logManager.logger.get_logger(__name__)
 
@@ -25,6 +25,7 @@ class SmartScene:
         self.state: str = data.get("state", "inactive")
         self.active_timeslot: int = data.get("active_timeslot", 0)
 
+        registerV2Ids(self, [], "smart_scene")
         self._send_stream_event(self.getV2Api(), "add")
 
     def __del__(self) -> None:
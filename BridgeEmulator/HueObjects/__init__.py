@@ -1,13 +1,120 @@
 import uuid
+import weakref
 import logManager
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 logging = logManager.logger.get_logger(__name__)
 
 eventstream = []
+behaviorIndexDirty = True
+stateVersion = 0  # bumped on every mutation, keys the API response cache
+deviceIndexVersion = 0  # bumped when lights or sensors are added, removed or readdressed
+v2IdIndex = {}  # every v2 id (own and derived) -> (weakref of the owning object, resource type or None for any)
+lightGroups = weakref.WeakKeyDictionary()  # light -> groups containing it
+lightScenes = weakref.WeakKeyDictionary()  # light -> light scenes listing it
+groupScenes = weakref.WeakKeyDictionary()  # group -> group scenes recalling it
+dispatchPool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="lightDispatch")
 
 def StreamEvent(message):
     eventstream.append(message)
+    bumpStateVersion()
+
+def bumpStateVersion():
+    """Mark the bridge state as changed so cached API responses are rebuilt."""
+    global stateVersion
+    stateVersion += 1
+
+def invalidateBehaviorIndex():
+    """Mark the behavior instance dispatch index as stale so it is rebuilt on the next event."""
+    global behaviorIndexDirty
+    behaviorIndexDirty = True
+
+def invalidateDeviceIndex():
+    """Mark the protocol device lookup indexes (friendly names, topics) as stale so they are rebuilt."""
+    global deviceIndexVersion
+    deviceIndexVersion += 1
+
+def derivedV2Id(obj, suffix):
+    """Return the v2 id derived from the id_v2 of an object, memoised on the object as it never changes."""
+    v2Ids = obj.__dict__.setdefault("v2Ids", {})
+    if suffix not in v2Ids:
+        v2Ids[suffix] = str(uuid.uuid5(uuid.NAMESPACE_URL, obj.id_v2 + suffix))
+    return v2Ids[suffix]
+
+def registerV2Ids(obj, suffixes, rtype=None):
+    """
+    Index the id_v2 of an object and the ids derived from it, entries are dropped when the object is destroyed.
+
+    The id_v2 is served as rtype (None when the object serves it under several types), a derived id as the
+    resource type it is derived for, the suffix without a trailing number (button1 is a button).
+    """
+    v2Ids = [(obj.id_v2, rtype)] + [(derivedV2Id(obj, suffix), suffix.rstrip("0123456789")) for suffix in suffixes]
+
+    def unregister(ref):
+        for v2Id, idType in v2Ids:
+            entries = v2IdIndex.get(v2Id)
+            if entries is not None and (ref, idType) in entries:
+                entries.remove((ref, idType))
+                if not entries:
+                    del v2IdIndex[v2Id]
+
+    ref = weakref.ref(obj, unregister)
+    for v2Id, idType in v2Ids:
+        v2IdIndex.setdefault(v2Id, []).append((ref, idType))
+
+def getV2Object(v2Id, rtype=None):
+    """Return the object owning a v2 id as resource type rtype (any type when None), or None."""
+    for ref, idType in v2IdIndex.get(v2Id, []):
+        if rtype is not None and idType is not None and idType != rtype:
+            continue
+        obj = ref()
+        if obj is not None:
+            return obj
+    return None
+
+def addMembership(index, owner, member):
+    """Record member under owner in one of the membership indexes, entries vanish with either object."""
+    members = index.get(owner)
+    if members is None:
+        members = index[owner] = weakref.WeakSet()
+    members.add(member)
+
+def removeMembership(index, owner, member):
+    """Drop member from owner in one of the membership indexes."""
+    members = index.get(owner)
+    if members is not None:
+        members.discard(member)
+
+def groupsOfLight(light):
+    """Return the groups (including group 0 and entertainment areas) containing a light."""
+    return list(lightGroups.get(light, ()))
+
+def scenesOfGroup(group):
+    """Return the group scenes recalling a group."""
+    return list(groupScenes.get(group, ()))
+
+def scenesOfLight(light):
+    """Return the scenes containing a light, directly or through one of its groups."""
+    scenes = set(lightScenes.get(light, ()))
+    for group in groupsOfLight(light):
+        scenes.update(groupScenes.get(group, ()))
+    return list(scenes)
+
+def lightContribution(state):
+    """Return what a light state adds to the group aggregates: (on, brightness sum, lights with brightness)."""
+    if not state.get("on"):
+        return (0, 0, 0)
+    if "bri" in state:
+        return (1, state["bri"] or 0, 1)
+    return (1, 0, 0)
+
+def detachLight(light):
+    """Remove a light from all its groups and scenes, used before the light is deleted."""
+    for scene in scenesOfLight(light):
+        scene.remove_light(light)
+    for group in groupsOfLight(light):
+        group.remove_light(light)
 
 def v1StateToV2(v1State):
     v2State = {}
@@ -47,6 +154,15 @@ def generate_unique_id():
     return "00:17:88:01:00:%02x:%02x:%02x-0b" % tuple(rand_bytes)
 
 def setGroupAction(group, state, scene=None):
+    if state.get("on") is False:
+        from functions.routines import routineRunner
+        routineRunner.switchedOff([light() for light in group.lights if light()])
+    lightsState = groupLightsState(group, state, scene)
+    dispatchLightsState([(light(), lightsState[light().id_v1]) for light in group.lights if light() and light().id_v1 in lightsState])
+    group.state = group.update_state()
+
+def groupLightsState(group, state, scene=None):
+    """Return the v1 state of every light (by id_v1) for a group action or scene recall, updating the group action."""
     lightsState = {}
     if scene is not None:
         sceneStates = list(scene.lightstates.items())
@@ -65,19 +181,36 @@ def setGroupAction(group, state, scene=None):
             group.state["any_on"] = state["on"]
             group.state["all_on"] = state["on"]
         group.action.update(state)
+    return lightsState
+
+def dispatchLightsState(lightsState):
+    """
+    Store and send v1 states to many lights at once, stream events are left to the caller.
 
+    Lights behind one multi light device (native_multi, mqtt) share a single request, the other devices
+    are set in parallel while lights sharing a protocol address stay sequential.
+
+    Args:
+        lightsState (List[Tuple[Light, Dict]]): The lights and their v1 states.
+    """
     queueState = {}
-    for light in group.lights:
-        if light() and light().id_v1 in lightsState:
-            updateLightState(light, lightsState[light().id_v1])
-            if light().protocol in ["native_multi", "mqtt"]:
-                addToQueueState(queueState, light, lightsState[light().id_v1])
-            else:
-                light().setV1State(lightsState[light().id_v1])
-    for device, state in queueState.items():
-        state["object"].setV1State(state)
+    devices = {}
+    for light, state in lightsState:
+        light_ref = weakref.ref(light)
+        updateLightState(light_ref, state)
+        if light.protocol in ["native_multi", "mqtt"]:
+            addToQueueState(queueState, light_ref, state)
+        else:
+            devices.setdefault((light.protocol, light.protocol_cfg.get("ip")), []).append((light, state))
+    jobs = [[(device["object"], device)] for device in queueState.values()] + list(devices.values())
+    if len(jobs) == 1:
+        sendLightsState(jobs[0])
+    elif jobs:
+        list(dispatchPool.map(sendLightsState, jobs))
 
-    group.state = group.update_state()
+def sendLightsState(job):
+    for light, state in job:
+        light.setV1State(state, advertise=False)
 
 def updateGroupActionColormode(group, state):
     if "xy" in state:
@@ -88,6 +221,8 @@ def updateGroupActionColormode(group, state):
         group.action["colormode"] = "hs"
 
 def updateLightState(light, state):
+    from functions.fadeEngine import fadeEngine
+    fadeEngine.interrupt(light(), state)
     for key, value in state.items():
         if key in light().state:
             light().state[key] = value
@@ -8,7 +8,7 @@ import yaml
 import uuid
 import weakref
 from copy import deepcopy
-from HueObjects import Light, Group, EntertainmentConfiguration, Scene, ApiUser, Rule, ResourceLink, Schedule, Sensor, BehaviorInstance, SmartScene
+from HueObjects import invalidateDeviceIndex, Light, Group, EntertainmentConfiguration, Scene, ApiUser, Rule, ResourceLink, Schedule, Sensor, BehaviorInstance, SmartScene
 from typing import Any, Dict, Optional, Union
 
 try:
@@ -77,6 +77,7 @@ class Config:
                 "SUB_IP_RANGE_END": int(self.argsDict["HOST_IP"].split('.')[2])
             },
             "scanonhostip": False,
+            "scanparallelism": 256,
             "factorynew": True,
             "mqtt":{"enabled":False},
             "deconz":{"enabled":False},
@@ -157,6 +158,7 @@ class Config:
         for light, data in lights.items():
             data["id_v1"] = light
             self.yaml_config["lights"][light] = Light.Light(data)
+        invalidateDeviceIndex()
 
     def _load_groups(self) -> None:
         """
@@ -249,6 +251,7 @@ class Config:
             data = {"modelid": "PHDL00", "name": "Daylight", "type": "Daylight", "id_v1": "1"}
             self.yaml_config["sensors"]["1"] = Sensor.Sensor(data)
             self.yaml_config["groups"]["0"].add_sensor(self.yaml_config["sensors"]["1"])
+        invalidateDeviceIndex()
 
     def _load_resourcelinks(self) -> None:
         """
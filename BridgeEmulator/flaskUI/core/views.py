@@ -3,12 +3,12 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flaskUI.core.forms import LoginForm
 import flask_login
 import uuid
-import json
 import configManager
 from HueObjects import ApiUser
 from flaskUI.core import User
 from lights.light_types import lightTypes
-from subprocess import check_output
+from functions import metrics as componentMetrics
+from services import tradfri
 from pprint import pprint
 import os
 import sys
@@ -141,11 +141,7 @@ def pairTradfri() -> Dict[str, Any]:
     try:
         data = request.get_json(force=True)
         pprint(data)
-        cmd = [
-            "coap-client-gnutls", "-m", "post", "-u", "Client_identity", "-k", data["tradfriCode"],
-            "-e", "{\"9090\":\"" + data["identity"] + "\"}", "coaps://" + data["tradfriGwIp"] + ":5684/15011/9063"
-        ]
-        registration = json.loads(check_output(cmd).decode('utf-8').rstrip('\n').split("\n")[-1])
+        registration = tradfri.pair(data["tradfriGwIp"], data["tradfriCode"], data["identity"])
         if "9091" in registration:
             bridgeConfig["config"]["tradfri"] = {
                 "psk": registration["9091"],
@@ -294,6 +290,16 @@ def info() -> Dict[str, str]:
         "webui": subprocess.run("stat -c %y flaskUI/templates/index.html", shell=True, capture_output=True, text=True).stdout.strip()
     }
 
+@core.route('/metrics')
+def metrics() -> Dict[str, Any]:
+    """
+    Get the queue depths and message counters of the ingestion pipelines and device clients.
+
+    Returns:
+        Dict[str, Any]: The metrics per component.
+    """
+    return componentMetrics.collect()
+
 @core.route('/login', methods=['GET', 'POST'])
 def login() -> Union[str, Response]:
     """
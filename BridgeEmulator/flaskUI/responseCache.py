@@ -0,0 +1,82 @@
+import hashlib
+import HueObjects
+import logManager
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Optional, Tuple
+from flask import Response, request
+from functions.jsonEncoder import dumps
+
+logging = logManager.logger.get_logger(__name__)
+
+MAX_AGE = 5  # seconds, bounds staleness for the few mutations that do not bump the state version (light states always do)
+
+def etagOf(body: bytes) -> str:
+    """Return the entity tag of an encoded response, a digest of the bytes sent."""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+class ResponseCache:
+    """
+    Encoded API responses, valid as long as the global state version (HueObjects.stateVersion) is unchanged.
+    """
+    def __init__(self, maxAge: float = MAX_AGE) -> None:
+        self.maxAge = maxAge
+        self.entries: Dict[str, Tuple[int, float, bytes, str]] = {}  # key -> (state version, built at, body, etag)
+        self._lock = Lock()
+
+    def encoded(self, key: str, build: Callable[[], Any]) -> Tuple[str, bytes]:
+        """
+        Return the JSON encoded result of build, reusing the cached bytes when the state did not change.
+
+        Args:
+            key (str): The cache key, usually the API path.
+            build (Callable[[], Any]): Builds the response data on a cache miss.
+
+        Returns:
+            Tuple[str, bytes]: The entity tag and the encoded response.
+        """
+        version = HueObjects.stateVersion
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is not None and entry[0] == version and monotonic() - entry[1] < self.maxAge:
+            return entry[3], entry[2]
+        body = dumps(build())
+        etag = etagOf(body)
+        with self._lock:
+            self.entries[key] = (version, monotonic(), body, etag)
+        logging.debug(f"Response cache miss for {key} at version {version}")
+        return etag, body
+
+    def respond(self, key: str, build: Callable[[], Any]) -> Response:
+        """
+        Serve a cached response with an ETag, answering 304 when the client copy is current.
+
+        Args:
+            key (str): The cache key, usually the API path.
+            build (Callable[[], Any]): Builds the response data on a cache miss.
+
+        Returns:
+            Response: The flask response.
+        """
+        etag, body = self.encoded(key, build)
+        return jsonResponse(body, etag)
+
+def jsonResponse(body: bytes, etag: Optional[str] = None) -> Response:
+    """
+    Wrap encoded JSON in a conditional response tagged with a digest of its bytes.
+
+    The tag only matches when the client holds exactly these bytes, also for bodies rebuilt after MAX_AGE
+    under the same state version and for bodies combining cached and freshly built parts.
+
+    Args:
+        body (bytes): The encoded JSON.
+        etag (Optional[str]): The entity tag of body when already known.
+
+    Returns:
+        Response: The flask response, 304 without body if If-None-Match matches.
+    """
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag or etagOf(body))
+    return response.make_conditional(request)
+
+responseCache = ResponseCache()
@@ -1,6 +1,6 @@
 import configManager
 import logManager
-from HueObjects import ApiUser, Group, EntertainmentConfiguration, Scene, Rule, ResourceLink, Sensor, Schedule
+from HueObjects import ApiUser, Group, EntertainmentConfiguration, Scene, Rule, ResourceLink, Sensor, Schedule, scenesOfGroup, detachLight, invalidateDeviceIndex
 import weakref
 import uuid
 import json
@@ -12,6 +12,9 @@ from lights.discover import scanForLights, manualAddLight
 from functions.core import capabilities, staticConfig, nextFreeId
 from flask_restful import Resource
 from flask import request
+from flaskUI.responseCache import responseCache, jsonResponse
+from functions.jsonEncoder import dumps
+from functions.routines import routineRunner
 from functions.rules import rulesProcessor
 from services.entertainment import entertainmentService
 from services.updateManager import githubCheck, versionCheck, githubInstall
@@ -49,8 +52,7 @@ def authorize(username, resource='', resourceId='', resourceParam=''):
         logging.debug(str(resourceId) + " has no attribute " + str(resourceParam))
         return [{"error": {"type": 3, "address": "/" + resource + "/" + resourceId + "/" + resourceParam, "description": "resource, " + resource + "/" + resourceId + "/" + resourceParam + ", not available"}}]
     if request.remote_addr != "127.0.0.1":
-        bridgeConfig["apiUsers"][username].last_use_date = datetime.now(timezone.utc).strftime(
-            "%Y-%m-%dT%H:%M:%S")
+        bridgeConfig["apiUsers"][username].touch()
     return ["success"]
 
 
@@ -112,19 +114,25 @@ class ShortConfig(Resource):
         return {"apiversion": config["apiversion"], "bridgeid": config["bridgeid"], "datastoreversion": staticConfig()["datastoreversion"], "factorynew": config["factorynew"], "mac": config["mac"], "modelid": "BSB002", "name": config["name"], "replacesbridgeid": None, "starterkitid": "", "swversion": config["swversion"]}
 
 
+def buildV1Resources():
+    result = {}
+    for resource in ["lights", "groups", "scenes", "rules", "resourcelinks", "schedules", "sensors"]:
+        result[resource] = {}
+        for resource_id in bridgeConfig[resource]:
+            if resource_id != "0":
+                result[resource][resource_id] = bridgeConfig[resource][resource_id].getV1Api().copy()
+    return result
+
+
 class EntireConfig(Resource):
     def get(self, username):
         authorisation = authorize(username)
         if "success" not in authorisation:
             return authorisation
-        result = {}
-        result["config"] = buildConfig()
-        for resource in ["lights", "groups", "scenes", "rules", "resourcelinks", "schedules", "sensors"]:
-            result[resource] = {}
-            for resource_id in bridgeConfig[resource]:
-                if resource_id != "0":
-                    result[resource][resource_id] = bridgeConfig[resource][resource_id].getV1Api().copy()
-        return result
+        # config holds clocks and last use dates, only the resources are served from the cache
+        _, resources = responseCache.encoded("/api/", buildV1Resources)
+        config = dumps({"config": buildConfig()})
+        return jsonResponse(config[:-1] + b"," + resources[1:])  # tagged by the bytes, config changes between versions
 
 
 class ResourceElements(Resource):
@@ -135,7 +143,9 @@ class ResourceElements(Resource):
                 return capabilities()
             else:
                 response = {}
-                if resource in ["lights", "groups", "scenes", "rules", "resourcelinks", "schedules", "sensors", "apiUsers"]:
+                if resource in ["lights", "groups", "scenes", "rules", "resourcelinks", "schedules", "sensors"]:
+                    return responseCache.respond("/api/" + resource, lambda: {object: bridgeConfig[resource][object].getV1Api().copy() for object in bridgeConfig[resource]})
+                elif resource == "apiUsers":
                     for object in bridgeConfig[resource]:
                         response[object] = bridgeConfig[resource][object].getV1Api().copy()
                 elif resource == "config":
@@ -263,6 +273,7 @@ class ResourceElements(Resource):
         elif resource == "sensors":
             v2Resource = "device"
             bridgeConfig[resource][new_object_id] = Sensor.Sensor(postDict)
+            invalidateDeviceIndex()
         elif resource == "schedules":
             bridgeConfig[resource][new_object_id] = Schedule.Schedule(postDict)
         newObject = bridgeConfig[resource][new_object_id]
@@ -389,7 +400,7 @@ class Element(Resource):
                 bridgeConfig["sensors"][resourceid].dxState["lastupdated"] = currentTime
         elif resource == "groups":
             if "lights" in putDict:
-                bridgeConfig["groups"][resourceid].lights = [] #empty the list
+                bridgeConfig["groups"][resourceid].clear_lights() #empty the list
                 for light in putDict["lights"]:
                     bridgeConfig["groups"][resourceid].add_light(bridgeConfig["lights"][light])
             if "stream" in putDict:
@@ -405,10 +416,8 @@ class Element(Resource):
                 bridgeConfig["groups"][resourceid].dxState["any_on"] = currentTime
             # lights where removed from group, delete scenes
             if "lights" in putDict and len(putDict["lights"]) == 0:
-                for scene in list(bridgeConfig["scenes"].keys()):
-                    if bridgeConfig["scenes"][scene].type == "GroupScene":
-                        if bridgeConfig["scenes"][scene].group().id_v1 == resourceid:
-                            del bridgeConfig["scenes"][scene]
+                for scene in scenesOfGroup(bridgeConfig["groups"][resourceid]):
+                    del bridgeConfig["scenes"][scene.id_v1]
             if "locations" in putDict:
                 for light, location in putDict["locations"].items():
                     bridgeConfig["groups"][resourceid].locations[bridgeConfig["lights"][light]] = [{"x": location[0], "y": location[1], "z": location[2]}]
@@ -435,14 +444,15 @@ class Element(Resource):
             for sensor in list(bridgeConfig["sensors"].keys()):
                 if bridgeConfig["sensors"][sensor].uniqueid != None and bridgeConfig["sensors"][sensor].uniqueid[:-1] == bridgeConfig["sensors"][resourceid].uniqueid[:-1] and bridgeConfig["sensors"][sensor].id_v1 != resourceid:
                     del bridgeConfig["sensors"][sensor]
-        # delete the object
-        del bridgeConfig[resource][resourceid]
         # clean scenes
         if resource == "groups":
-            for scene in list(bridgeConfig["scenes"].keys()):
-                if bridgeConfig["scenes"][scene].type == "GroupScene":
-                    if bridgeConfig["scenes"][scene].group().id_v1 == resourceid:
-                        del bridgeConfig["scenes"][scene]
+            for scene in scenesOfGroup(bridgeConfig["groups"][resourceid]):
+                del bridgeConfig["scenes"][scene.id_v1]
+        # remove the light from its groups and scenes
+        if resource == "lights":
+            detachLight(bridgeConfig["lights"][resourceid])
+        # delete the object
+        del bridgeConfig[resource][resourceid]
         if resource in ["groups", "lights"]:
             GroupZeroMessage() # trigger stream messages
         if resource == "lights":
@@ -469,6 +479,8 @@ class ElementParam(Resource):
         if resource == "lights" and param == "state":  # state is applied to a light
             if "alert" in putDict and putDict["alert"] not in ["select", "none"]:
                 putDict["alert"] = "select"
+            if putDict.get("on") is False:
+                routineRunner.switchedOff([bridgeConfig[resource][resourceid]])
             bridgeConfig[resource][resourceid].setV1State(putDict)
         elif param == "action":  # state is applied to a light
             if "scene" in putDict:
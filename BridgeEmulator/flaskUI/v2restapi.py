@@ -1,6 +1,6 @@
 import configManager
 import logManager
-from HueObjects import Group, EntertainmentConfiguration, Scene, BehaviorInstance, GeofenceClient, SmartScene, StreamEvent
+from HueObjects import Group, EntertainmentConfiguration, Scene, BehaviorInstance, GeofenceClient, SmartScene, StreamEvent, getV2Object, derivedV2Id, scenesOfGroup, detachLight, v2StateToV1, groupLightsState, dispatchLightsState
 import uuid
 import json
 import weakref
@@ -13,6 +13,8 @@ from time import sleep
 from functions.core import nextFreeId
 from datetime import datetime, timezone
 from functions.scripts import behaviorScripts
+from functions.routines import routineRunner
+from flaskUI.responseCache import responseCache
 from lights.discover import scanForLights
 from functions.daylightSensor import daylightSensor
 
@@ -20,48 +22,19 @@ logging = logManager.logger.get_logger(__name__)
 
 bridgeConfig = configManager.bridgeConfig.yaml_config
 
-v2Resources = {"light": {}, "scene": {}, "smart_scene": {}, "grouped_light": {}, "room": {}, "zone": {
-}, "entertainment": {}, "entertainment_configuration": {}, "zigbee_connectivity": {}, "zigbee_device_discovery": {}, "device": {}, "device_power": {},
-"geofence_client": {}, "motion": {}, "light_level": {}, "temperature": {}, "relative_rotary": {}, "button": {}}
-
-
 def getObject(element, v2uuid):
     if element in ["behavior_instance"]:
         return bridgeConfig[element][v2uuid]
-    elif element in v2Resources and v2uuid in v2Resources[element]:
-        logging.debug("Cache Hit for " + element)
-        return v2Resources[element][v2uuid]()
-    elif element in ["light", "scene", "grouped_light", "smart_scene"]:
-        for v1Element in ["lights", "groups", "scenes", "smart_scene"]:
-            for key, obj in bridgeConfig[v1Element].items():
-                if obj.id_v2 == v2uuid:
-                    v2Resources[element][v2uuid] = weakref.ref(obj)
-                    logging.debug("Cache Miss " + element)
-                    return obj
-    elif element in ["entertainment"]:
-        for key, obj in bridgeConfig["lights"].items():
-            if str(uuid.uuid5(uuid.NAMESPACE_URL, obj.id_v2 + 'entertainment')) == v2uuid:
-                v2Resources[element][v2uuid] = weakref.ref(obj)
-                return obj
-    else:
-        for v1Element in ["lights", "groups", "scenes", "sensors", "geofence_clients"]:
-            for key, obj in bridgeConfig[v1Element].items():
-                if str(uuid.uuid5(uuid.NAMESPACE_URL, obj.id_v2 + element)) == v2uuid:
-                    logging.debug("Cache Miss " + element)
-                    v2Resources[element][v2uuid] = weakref.ref(obj)
-                    return obj
-                elif obj.id_v2 == v2uuid:
-                    logging.debug("Cache Miss " + element)
-                    v2Resources[element][v2uuid] = weakref.ref(obj)
-                    return obj
+    obj = getV2Object(v2uuid, element)
+    if obj is not None:
+        return obj
     logging.info("element not found!")
     return False
 
 
 def authorizeV2(headers):
     if "hue-application-key" in headers and headers["hue-application-key"] in bridgeConfig["apiUsers"]:
-        bridgeConfig["apiUsers"][headers["hue-application-key"]
-                                 ].last_use_date = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        bridgeConfig["apiUsers"][headers["hue-application-key"]].touch()
         return {"user": bridgeConfig["apiUsers"][headers["hue-application-key"]]}
     return []
 
@@ -147,17 +120,16 @@ def v2BridgeHome():
     #        "rid": bridgeConfig["groups"]["0"].id_v2,
     #        "rtype": "grouped_light"
     #    })
-    result["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL,
-                                  bridgeConfig["groups"]["0"].id_v2 + 'bridge_home'))
+    result["id"] = derivedV2Id(bridgeConfig["groups"]["0"], 'bridge_home')
     result["id_v1"] = "/groups/0"
     result["services"] = []
     result["type"] = "bridge_home"
     for key, light in bridgeConfig["lights"].items():
         result["services"].append(light.getBridgeHome())
-        result["children"].append({"rid": light.getDevice()["id"], "rtype": "device"})
+        result["children"].append({"rid": derivedV2Id(light, 'device'), "rtype": "device"})
     for key, group in bridgeConfig["groups"].items():
         if group.type == "Room":
-            result["children"].append({"rid": group.getV2Room()["id"], "rtype": "room"})
+            result["children"].append({"rid": derivedV2Id(group, 'room'), "rtype": "room"})
     for key, sensor in bridgeConfig["sensors"].items():
         if sensor.getBridgeHome():
             result["services"].append(sensor.getBridgeHome())
@@ -235,89 +207,437 @@ class AuthV1(Resource):
             return '', 403
 
 
+def buildV2Resources():
+    data = []
+    # homekit
+    data.append(v2HomeKit())
+    # device
+    data.append(v2BridgeDevice())
+    for key, light in bridgeConfig["lights"].items():
+        data.append(light.getDevice())
+    for key, sensor in bridgeConfig["sensors"].items():
+        if sensor.getDevice() is not None:
+            data.append(sensor.getDevice())
+    # bridge
+    data.append(v2Bridge())
+    data.append(v2DiyHueBridge())
+    # zigbee
+    data.append(v2BridgeZigBee())
+    for key, light in bridgeConfig["lights"].items():
+        data.append(light.getZigBee())
+    for key, sensor in bridgeConfig["sensors"].items():
+        if sensor.getZigBee() is not None:
+            data.append(sensor.getZigBee())
+    data.append(v2BridgeZigBeeDiscovery())
+    # entertainment
+    data.append(v2BridgeEntertainment())
+    for key, light in bridgeConfig["lights"].items():
+        data.append(light.getV2Entertainment())
+    # scenes
+    for key, scene in bridgeConfig["scenes"].items():
+        data.append(scene.getV2Api())
+    # smart_scene
+    for key, smartscene in bridgeConfig["smart_scene"].items():
+        data.append(smartscene.getV2Api())
+    # lights
+    for key, light in bridgeConfig["lights"].items():
+        data.append(light.getV2Api())
+    # room
+    for key, group in bridgeConfig["groups"].items():
+        if group.type == "Room":
+            data.append(group.getV2Room())
+        elif group.type == "Zone":
+            data.append(group.getV2Zone())
+    # behavior_instance
+    for key, instance in bridgeConfig["behavior_instance"].items():
+        data.append(instance.getV2Api())
+    # entertainment_configuration
+    for key, group in bridgeConfig["groups"].items():
+        if group.type == "Entertainment":
+            data.append(group.getV2Api())
+    # group
+        else:
+            data.append(group.getV2GroupedLight())
+    # bridge home
+    data.append(v2BridgeHome())
+    data.append(v2GeofenceClient())
+    data.append(geoLocation())
+    for script in behaviorScripts():
+        data.append(script)
+    for key, sensor in bridgeConfig["sensors"].items():
+        motion = sensor.getMotion()
+        if motion is not None:
+            data.append(motion)
+        buttons = sensor.getButtons()
+        if buttons is not None:
+            for button in buttons:
+                data.append(button)
+        power = sensor.getDevicePower()
+        if power is not None:
+            data.append(power)
+        rotarys = sensor.getRotary()
+        if rotarys is not None:
+            data.append(rotarys)
+        temperature = sensor.getTemperature()
+        if temperature is not None:
+            data.append(temperature)
+        lightlevel = sensor.getLightlevel()
+        if lightlevel is not None:
+            data.append(lightlevel)
+
+    return {"errors": [], "data": data}
+
+
 class ClipV2(Resource):
     def get(self):
         authorisation = authorizeV2(request.headers)
         if "user" not in authorisation:
             return "", 403
+        if request.args:
+            return queryV2Resource(None, request.args)
+        return responseCache.respond("/clip/v2/resource", buildV2Resources)
+
+    def put(self):
+        """
+        Batch write: apply a list of {"target": {"rid", "rtype"}, "state": {...}} items in one request.
+
+        Items are validated first, the valid ones are dispatched together and announced in one stream event.
+        The response data holds one result per item, in request order.
+        """
+        authorisation = authorizeV2(request.headers)
+        if "user" not in authorisation:
+            return "", 403
+        putDict = request.get_json(force=True)
+        items = putDict.get("data", []) if isinstance(putDict, dict) else putDict
+        if not isinstance(items, list):
+            return {"errors": [{"description": "expected a list of items"}], "data": []}, 400
+        logging.info(f"batch write of {len(items)} items")
+        logging.debug(items)
+        results = []
+        errors = []
+        targets = []
+        for index, item in enumerate(items):
+            obj, error = validateBatchItem(item)
+            if error:
+                errors.append({"description": f"item {index}: {error}"})
+                results.append({"error": error})
+            else:
+                targets.append((obj, item["target"]["rtype"], item["state"]))
+                results.append({"rid": item["target"]["rid"], "rtype": item["target"]["rtype"]})
+        applyBatch(targets)
+        return {"errors": errors, "data": results}
+
+
+V2_BATCH_STATE_KEYS = ["on", "dimming", "color", "color_temperature", "dynamics", "gradient", "effects", "effects_v2", "alert", "signaling"]
+
+def validateBatchItem(item):
+    """
+    Check one batch write item.
+
+    Args:
+        item (Dict[str, Any]): The {"target": {"rid", "rtype"}, "state": {...}} item.
+
+    Returns:
+        The target light or group and None, or None and the error description.
+    """
+    if not isinstance(item, dict) or not isinstance(item.get("target"), dict) or not isinstance(item.get("state"), dict):
+        return None, "expected {target: {rid, rtype}, state: {...}}"
+    rtype = item["target"].get("rtype")
+    obj = getV2Object(item["target"].get("rid"))
+    if rtype == "light":
+        if obj is None or not hasattr(obj, "getObjectPath") or obj.getObjectPath()["resource"] != "lights" or obj.id_v2 != item["target"]["rid"]:
+            return None, "light not found"
+    elif rtype == "grouped_light":
+        if obj is None or not hasattr(obj, "setV2Action") or obj.id_v2 != item["target"]["rid"]:
+            return None, "grouped_light not found"
+    else:
+        return None, f"unsupported rtype {rtype}"
+    state = item["state"]
+    for key in state:
+        if key not in V2_BATCH_STATE_KEYS:
+            return None, f"unsupported state attribute {key}"
+    if "on" in state and not isinstance(state["on"].get("on") if isinstance(state["on"], dict) else None, bool):
+        return None, "on.on must be a boolean"
+    if "dimming" in state:
+        brightness = state["dimming"].get("brightness") if isinstance(state["dimming"], dict) else None
+        if isinstance(brightness, bool) or not isinstance(brightness, (int, float)) or not 0 <= brightness <= 100:
+            return None, "dimming.brightness must be between 0 and 100"
+    if "color_temperature" in state:
+        mirek = state["color_temperature"].get("mirek") if isinstance(state["color_temperature"], dict) else None
+        if isinstance(mirek, bool) or not isinstance(mirek, int) or not 153 <= mirek <= 500:
+            return None, "color_temperature.mirek must be between 153 and 500"
+    if "color" in state:
+        xy = state["color"].get("xy") if isinstance(state["color"], dict) else None
+        if not isinstance(xy, dict) or not all(isinstance(xy.get(axis), (int, float)) and not isinstance(xy.get(axis), bool) for axis in ["x", "y"]):
+            return None, "color.xy must hold x and y"
+    return obj, None
+
+def applyBatch(targets):
+    """
+    Apply validated batch items: all light states are handed to the dispatcher together and one stream event
+    carries the updates of every light and grouped light.
+
+    A light targeted both by a grouped_light item and by its own light item gets the group state with the
+    attributes of the light item on top, whatever the item order: the explicit light wins. Between several
+    grouped_light items covering the same light, the later item wins.
+
+    Args:
+        targets (List[Tuple[Any, str, Dict[str, Any]]]): The target objects, their rtype and v2 state.
+    """
+    lightsState = {}
+    lightsV2State = {}
+    groups = []
+    for obj, rtype, state in targets:
+        if rtype == "grouped_light":
+            groupState = groupLightsState(obj, v2StateToV1(state))
+            for light_ref in obj.lights:
+                light = light_ref()
+                if light and light.id_v1 in groupState:
+                    lightsState[light] = groupState[light.id_v1]
+                    lightsV2State[light] = state
+            groups.append((obj, state))
+    for obj, rtype, state in targets:
+        if rtype == "light":
+            state["controlled_service"] = "manual"
+            lightsState[obj] = {**lightsState.get(obj, {}), **obj.v2ToV1State(state)}
+            lightsV2State[obj] = {**lightsV2State.get(obj, {}), **state}
+    if not lightsState and not groups:
+        return
+    dispatchLightsState(list(lightsState.items()))
+    data = [light.getV2StreamData(dict(v2State)) for light, v2State in lightsV2State.items()]
+    for group, state in groups:
+        group.state = group.update_state()
+        data.append(group.getV2GroupedLightStreamData(dict(state)))
+    StreamEvent({
+        "creationtime": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "data": data,
+        "id": str(uuid.uuid4()),
+        "type": "update"
+    })
+
+
+# light services that can be built for a subset of lights selected through the indexes
+LIGHT_SERVICES = {"light": "getV2Api", "device": "getDevice", "zigbee_connectivity": "getZigBee", "entertainment": "getV2Entertainment"}
+
+def queryV2Resource(resource, args):
+    """
+    Filter, project and paginate a v2 resource listing.
+
+    Lights of a room or zone, the lights of an owner device and the scenes of a room or zone are selected
+    through the object indexes, only the selected objects are serialised.
+
+    Args:
+        resource (Optional[str]): The v2 resource type, None for all resources.
+        args (Dict[str, str]): The query parameters: owner, room, zone, type, reachable, fields, limit and cursor.
+
+    Returns:
+        The response body and the status code.
+    """
+    groups = []
+    for param, groupType in [("room", "Room"), ("zone", "Zone")]:
+        if param in args:
+            group = getV2Object(args[param])
+            if group is None or getattr(group, "type", None) != groupType:
+                return {"errors": [{"description": f"{param} {args[param]} not found"}], "data": []}, 404
+            groups.append(group)
+    owner = getV2Object(args["owner"]) if "owner" in args else None
+    ownerLight = owner is not None and hasattr(owner, "getObjectPath") and owner.getObjectPath()["resource"] == "lights"
+
+    if resource in LIGHT_SERVICES and (groups or ownerLight):
+        lights = {owner} if ownerLight else None
+        for group in groups:
+            members = {light_ref() for light_ref in group.lights if light_ref()}
+            lights = members if lights is None else lights & members
         data = []
-        # homekit
-        data.append(v2HomeKit())
-        # device
-        data.append(v2BridgeDevice())
-        for key, light in bridgeConfig["lights"].items():
-            data.append(light.getDevice())
-        for key, sensor in bridgeConfig["sensors"].items():
-            if sensor.getDevice() is not None:
-                data.append(sensor.getDevice())
-        # bridge
-        data.append(v2Bridge())
-        data.append(v2DiyHueBridge())
-        # zigbee
-        data.append(v2BridgeZigBee())
-        for key, light in bridgeConfig["lights"].items():
-            data.append(light.getZigBee())
-        for key, sensor in bridgeConfig["sensors"].items():
-            if sensor.getZigBee() is not None:
-                data.append(sensor.getZigBee())
-        data.append(v2BridgeZigBeeDiscovery())
-        # entertainment
-        data.append(v2BridgeEntertainment())
-        for key, light in bridgeConfig["lights"].items():
-            data.append(light.getV2Entertainment())
-        # scenes
+        for light in sorted(lights, key=lambda light: int(light.id_v1)):
+            item = getattr(light, LIGHT_SERVICES[resource])()
+            if item is not None:
+                data.append(item)
+        return queryV2Data(data, args, [], ownerDone=ownerLight)
+    if resource == "scene" and len(groups) == 1:
+        return queryV2Data([scene.getV2Api() for scene in scenesOfGroup(groups[0])], args, [])
+    if resource is None:
+        if "type" in args:
+            # only build the requested resource types
+            data = []
+            for resourceType in args["type"].split(","):
+                data.extend(buildV2Resource(resourceType).get("data", []))
+        else:
+            data = buildV2Resources()["data"]
+        return queryV2Data(data, args, groups)
+    response = buildV2Resource(resource)
+    if "data" not in response:
+        return response, 404
+    return queryV2Data(response["data"], args, groups)
+
+def queryV2Data(data, args, groups, ownerDone=False):
+    """
+    Apply the generic filters, the field projection and the cursor pagination to v2 items.
+
+    Args:
+        data (List[Dict[str, Any]]): The v2 items.
+        args (Dict[str, str]): The query parameters.
+        groups (List[Any]): Rooms and zones the items must belong to, not yet applied.
+        ownerDone (bool): The owner filter was already applied through the index.
+
+    Returns:
+        The response body and the status code.
+    """
+    if "owner" in args and not ownerDone:
+        data = [item for item in data if item.get("owner", {}).get("rid") == args["owner"]]
+    for group in groups:
+        # the ids of the group and of its member lights and devices
+        ids = {group.id_v2, derivedV2Id(group, group.type.lower())}
+        for light_ref in group.lights:
+            if light_ref():
+                ids.update([light_ref().id_v2, derivedV2Id(light_ref(), "device")])
+        data = [item for item in data if item.get("id") in ids or item.get("owner", {}).get("rid") in ids or item.get("group", {}).get("rid") in ids]
+    if "type" in args:
+        types = args["type"].split(",")
+        data = [item for item in data if item.get("type") in types]
+    if "reachable" in args:
+        reachable = args["reachable"].lower() in ["true", "1"]
+        data = [item for item in data if isReachable(item) == reachable]
+
+    nextCursor = None
+    if "cursor" in args:
+        ids = [item.get("id") for item in data]
+        if args["cursor"] not in ids:
+            return {"errors": [{"description": f"invalid cursor {args['cursor']}"}], "data": []}, 400
+        data = data[ids.index(args["cursor"]) + 1:]
+    if "limit" in args:
+        if not args["limit"].isdigit() or int(args["limit"]) == 0:
+            return {"errors": [{"description": f"invalid limit {args['limit']}"}], "data": []}, 400
+        limit = int(args["limit"])
+        if len(data) > limit:
+            data = data[:limit]
+            nextCursor = data[-1].get("id")
+    if "fields" in args:
+        fields = ["id", "type"] + args["fields"].split(",")
+        data = [{key: item[key] for key in fields if key in item} for item in data]
+
+    response = {"errors": [], "data": data}
+    if nextCursor is not None:
+        response["next_cursor"] = nextCursor
+    return response, 200
+
+def isReachable(item):
+    """Return the reachability of the light or sensor behind a v2 item, bridge services are always reachable."""
+    obj = getV2Object(item.get("id"))
+    if obj is None:
+        return True
+    for attribute in ["state", "config"]:
+        values = getattr(obj, attribute, None)
+        if isinstance(values, dict) and "reachable" in values:
+            return bool(values["reachable"])
+    return True
+
+
+def buildV2Resource(resource):
+    response = {"data": [], "errors": []}
+    if resource == "scene":
         for key, scene in bridgeConfig["scenes"].items():
-            data.append(scene.getV2Api())
-        # smart_scene
+            response["data"].append(scene.getV2Api())
+    elif resource == "smart_scene":
         for key, smartscene in bridgeConfig["smart_scene"].items():
-            data.append(smartscene.getV2Api())
-        # lights
+            response["data"].append(smartscene.getV2Api())
+    elif resource == "light":
         for key, light in bridgeConfig["lights"].items():
-            data.append(light.getV2Api())
-        # room
+            response["data"].append(light.getV2Api())
+    elif resource == "room":
         for key, group in bridgeConfig["groups"].items():
             if group.type == "Room":
-                data.append(group.getV2Room())
-            elif group.type == "Zone":
-                data.append(group.getV2Zone())
-        # behavior_instance
-        for key, instance in bridgeConfig["behavior_instance"].items():
-            data.append(instance.getV2Api())
-        # entertainment_configuration
+                response["data"].append(group.getV2Room())
+    elif resource == "zone":
+        for key, group in bridgeConfig["groups"].items():
+            if group.type == "Zone":
+                response["data"].append(group.getV2Zone())
+    elif resource == "grouped_light":
+        for key, group in bridgeConfig["groups"].items():
+            response["data"].append(group.getV2GroupedLight())
+    elif resource == "zigbee_connectivity":
+        for key, light in bridgeConfig["lights"].items():
+            zigbee = light.getZigBee()
+            if zigbee is not None:
+                response["data"].append(zigbee)
+        for key, sensor in bridgeConfig["sensors"].items():
+            zigbee = sensor.getZigBee()
+            if zigbee is not None:
+                response["data"].append(zigbee)
+        response["data"].append(v2BridgeZigBee())  # the bridge
+    elif resource == "entertainment":
+        for key, light in bridgeConfig["lights"].items():
+            response["data"].append(light.getV2Entertainment())
+        response["data"].append(v2BridgeEntertainment())
+    elif resource == "entertainment_configuration":
         for key, group in bridgeConfig["groups"].items():
             if group.type == "Entertainment":
-                data.append(group.getV2Api())
-        # group
-            else:
-                data.append(group.getV2GroupedLight())
-        # bridge home
-        data.append(v2BridgeHome())
-        data.append(v2GeofenceClient())
-        data.append(geoLocation())
+                response["data"].append(group.getV2Api())
+    elif resource == "device":
+        for key, light in bridgeConfig["lights"].items():
+            response["data"].append(light.getDevice())
+        for key, sensor in bridgeConfig["sensors"].items():
+            device = sensor.getDevice()
+            if device is not None:
+                response["data"].append(device)
+        response["data"].append(v2BridgeDevice())  # the bridge
+    elif resource == "zigbee_device_discovery":
+        response["data"].append(v2BridgeZigBeeDiscovery())
+    elif resource == "bridge":
+        response["data"].append(v2Bridge())
+    elif resource == "diyhue":
+        response["data"].append(v2DiyHueBridge())
+    elif resource == "routine":
+        response["data"] = routineRunner.activeRoutines()
+    elif resource == "bridge_home":
+        response["data"].append(v2BridgeHome())
+    elif resource == "homekit":
+        response["data"].append(v2HomeKit())
+    elif resource == "geolocation":
+        response["data"].append(geoLocation())
+    elif resource == "behavior_instance":
+        for key, instance in bridgeConfig["behavior_instance"].items():
+            response["data"].append(instance.getV2Api())
+    elif resource == "geofence_client":
+        response["data"].append(v2GeofenceClient())
+    elif resource == "behavior_script":
         for script in behaviorScripts():
-            data.append(script)
+            response["data"].append(script)
+    elif resource == "motion":
         for key, sensor in bridgeConfig["sensors"].items():
             motion = sensor.getMotion()
             if motion is not None:
-                data.append(motion)
+                response["data"].append(motion)
+    elif resource == "device_power":
+        for key, sensor in bridgeConfig["sensors"].items():
+            power = sensor.getDevicePower()
+            if power is not None:
+                response["data"].append(power)
+    elif resource == "button":
+        for key, sensor in bridgeConfig["sensors"].items():
             buttons = sensor.getButtons()
             if buttons is not None:
                 for button in buttons:
-                    data.append(button)
-            power = sensor.getDevicePower()
-            if power is not None:
-                data.append(power)
+                    response["data"].append(button)
+    elif resource == "relative_rotary":
+        for key, sensor in bridgeConfig["sensors"].items():
             rotarys = sensor.getRotary()
             if rotarys is not None:
-                data.append(rotarys)
+                response["data"].append(rotarys)
+    elif resource == "temperature":
+        for key, sensor in bridgeConfig["sensors"].items():
             temperature = sensor.getTemperature()
             if temperature is not None:
-                data.append(temperature)
+                response["data"].append(temperature)
+    elif resource == "light_level":
+        for key, sensor in bridgeConfig["sensors"].items():
             lightlevel = sensor.getLightlevel()
             if lightlevel is not None:
-                data.append(lightlevel)
-
-        return {"errors": [], "data": data}
+                response["data"].append(lightlevel)
+    else:
+        response["errors"].append({"description": "Not Found"})
+        del response["data"]
+    return response
 
 
 class ClipV2Resource(Resource):
@@ -326,109 +646,11 @@ class ClipV2Resource(Resource):
         authorisation = authorizeV2(request.headers)
         if "user" not in authorisation:
             return "", 403
-        response = {"data": [], "errors": []}
-        if resource == "scene":
-            for key, scene in bridgeConfig["scenes"].items():
-                response["data"].append(scene.getV2Api())
-        elif resource == "smart_scene":
-            for key, smartscene in bridgeConfig["smart_scene"].items():
-                response["data"].append(smartscene.getV2Api())
-        elif resource == "light":
-            for key, light in bridgeConfig["lights"].items():
-                response["data"].append(light.getV2Api())
-        elif resource == "room":
-            for key, group in bridgeConfig["groups"].items():
-                if group.type == "Room":
-                    response["data"].append(group.getV2Room())
-        elif resource == "zone":
-            for key, group in bridgeConfig["groups"].items():
-                if group.type == "Zone":
-                    response["data"].append(group.getV2Zone())
-        elif resource == "grouped_light":
-            for key, group in bridgeConfig["groups"].items():
-                response["data"].append(group.getV2GroupedLight())
-        elif resource == "zigbee_connectivity":
-            for key, light in bridgeConfig["lights"].items():
-                zigbee = light.getZigBee()
-                if zigbee is not None:
-                    response["data"].append(zigbee)
-            for key, sensor in bridgeConfig["sensors"].items():
-                zigbee = sensor.getZigBee()
-                if zigbee is not None:
-                    response["data"].append(zigbee)
-            response["data"].append(v2BridgeZigBee())  # the bridge
-        elif resource == "entertainment":
-            for key, light in bridgeConfig["lights"].items():
-                response["data"].append(light.getV2Entertainment())
-            response["data"].append(v2BridgeEntertainment())
-        elif resource == "entertainment_configuration":
-            for key, group in bridgeConfig["groups"].items():
-                if group.type == "Entertainment":
-                    response["data"].append(group.getV2Api())
-        elif resource == "device":
-            for key, light in bridgeConfig["lights"].items():
-                response["data"].append(light.getDevice())
-            for key, sensor in bridgeConfig["sensors"].items():
-                device = sensor.getDevice()
-                if device is not None:
-                    response["data"].append(device)
-            response["data"].append(v2BridgeDevice())  # the bridge
-        elif resource == "zigbee_device_discovery":
-            response["data"].append(v2BridgeZigBeeDiscovery())
-        elif resource == "bridge":
-            response["data"].append(v2Bridge())
-        elif resource == "diyhue":
-            response["data"].append(v2DiyHueBridge())
-        elif resource == "bridge_home":
-            response["data"].append(v2BridgeHome())
-        elif resource == "homekit":
-            response["data"].append(v2HomeKit())
-        elif resource == "geolocation":
-            response["data"].append(geoLocation())
-        elif resource == "behavior_instance":
-            for key, instance in bridgeConfig["behavior_instance"].items():
-                response["data"].append(instance.getV2Api())
-        elif resource == "geofence_client":
-            response["data"].append(v2GeofenceClient())
-        elif resource == "behavior_script":
-            for script in behaviorScripts():
-                response["data"].append(script)
-        elif resource == "motion":
-            for key, sensor in bridgeConfig["sensors"].items():
-                motion = sensor.getMotion()
-                if motion is not None:
-                    response["data"].append(motion)
-        elif resource == "device_power":
-            for key, sensor in bridgeConfig["sensors"].items():
-                power = sensor.getDevicePower()
-                if power is not None:
-                    response["data"].append(power)
-        elif resource == "button":
-            for key, sensor in bridgeConfig["sensors"].items():
-                buttons = sensor.getButtons()
-                if buttons is not None:
-                    for button in buttons:
-                        response["data"].append(button)
-        elif resource == "relative_rotary":
-            for key, sensor in bridgeConfig["sensors"].items():
-                rotarys = sensor.getRotary()
-                if rotarys is not None:
-                    response["data"].append(rotarys)
-        elif resource == "temperature":
-            for key, sensor in bridgeConfig["sensors"].items():
-                temperature = sensor.getTemperature()
-                if temperature is not None:
-                    response["data"].append(temperature)
-        elif resource == "light_level":
-            for key, sensor in bridgeConfig["sensors"].items():
-                lightlevel = sensor.getLightlevel()
-                if lightlevel is not None:
-                    response["data"].append(lightlevel)
-        else:
-            response["errors"].append({"description": "Not Found"})
-            del response["data"]
-
-        return response
+        if request.args:
+            return queryV2Resource(resource, request.args)
+        if resource == "routine":
+            return buildV2Resource(resource)
+        return responseCache.respond("/clip/v2/resource/" + resource, lambda: buildV2Resource(resource))
 
     def post(self, resource):
         # logging.debug(request.headers)
@@ -618,8 +840,12 @@ class ClipV2ResourceId(Resource):
         putDict = request.get_json(force=True)
         logging.info(putDict)
         object = getObject(resource, resourceid)
+        if not object and resource not in ["geolocation", "zigbee_device_discovery"]:
+            return {"errors": [{"description": "Not Found"}], "data": []}, 404
         if resource == "light":
             putDict["controlled_service"] = "manual"
+            if putDict.get("on", {}).get("on") is False:
+                routineRunner.switchedOff([object])
             object.setV2State(putDict)
         elif resource == "entertainment_configuration":
             if "action" in putDict:
@@ -737,6 +963,13 @@ class ClipV2ResourceId(Resource):
         if "user" not in authorisation:
             return "", 403
         object = getObject(resource, resourceid)
+        if not object:
+            return {"errors": [{"description": "Not Found"}], "data": []}, 404
+        if resource in ["room", "zone"]:
+            for scene in scenesOfGroup(object):
+                del bridgeConfig["scenes"][scene.id_v1]
+        elif hasattr(object, 'getObjectPath') and object.getObjectPath()["resource"] == "lights":
+            detachLight(object)
 
         if hasattr(object, 'getObjectPath'):
             del bridgeConfig[object.getObjectPath()["resource"]
@@ -0,0 +1,44 @@
+import asyncio
+from concurrent import futures
+from threading import Lock, Thread
+from typing import Any, Awaitable, Optional
+
+loop: Optional[asyncio.AbstractEventLoop] = None  # shared by the protocols built on asyncio libraries
+loopLock = Lock()
+
+def getLoop() -> asyncio.AbstractEventLoop:
+    """
+    Return the background event loop, starting its thread on first use.
+
+    Device connections opened by coroutines on this loop stay usable for later commands, unlike the ones of
+    a loop created by asyncio.run for a single call.
+
+    Returns:
+        asyncio.AbstractEventLoop: The running loop.
+    """
+    global loop
+    if loop is None:
+        with loopLock:
+            if loop is None:
+                newLoop = asyncio.new_event_loop()
+                Thread(target=newLoop.run_forever, name="asyncLoop", daemon=True).start()
+                loop = newLoop
+    return loop
+
+def run(coroutine: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the background loop and wait for its result.
+
+    Args:
+        coroutine (Awaitable[Any]): The coroutine.
+        timeout (Optional[float]): The maximum wait in seconds.
+
+    Returns:
+        Any: The result of the coroutine.
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, getLoop())
+    try:
+        return future.result(timeout)
+    except futures.TimeoutError:
+        future.cancel()  # do not leave it running on the shared loop
+        raise
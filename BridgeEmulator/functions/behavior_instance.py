@@ -1,7 +1,10 @@
 import logManager
 import configManager
+import HueObjects
 import uuid
 import random
+import weakref
+from dataclasses import dataclass, field
 from datetime import datetime
 from threading import Thread
 from time import sleep
@@ -10,6 +13,30 @@ from typing import List, Dict, Any, Optional
 logging = logManager.logger.get_logger(__name__)
 bridgeConfig = configManager.bridgeConfig.yaml_config
 
+@dataclass
+class BehaviorHandler:
+    """
+    A behavior instance compiled for dispatch, with its `where` targets already resolved.
+    """
+    instance: weakref.ReferenceType
+    targets: List[weakref.ReferenceType] = field(default_factory=list)
+    buttonTargets: Dict[str, List[weakref.ReferenceType]] = field(default_factory=dict)
+
+    def lightsAndGroups(self, button: Optional[str] = None) -> List[Any]:
+        """
+        Return the live target objects, dropping any that were deleted since the index was built.
+
+        Args:
+            button (Optional[str]): Return the targets of this button instead of the instance wide ones.
+
+        Returns:
+            List[Any]: The groups and lights controlled by the behavior instance.
+        """
+        refs = self.buttonTargets.get(button, []) if button is not None else self.targets
+        return [ref() for ref in refs if ref() is not None]
+
+behaviorIndex: Dict[str, List[BehaviorHandler]] = {}
+
 def findTriggerTime(times: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
     Find the trigger time based on the current time.
@@ -74,6 +101,67 @@ def findLight(rid: str, rtype: str) -> Optional[Any]:
     logging.info("Light not found!!!!")
     return None
 
+def _targetIds() -> Dict[str, Any]:
+    """
+    Map every rid a behavior instance may use in its `where` list to the owning group or light.
+
+    Returns:
+        Dict[str, Any]: The rid to object mapping.
+    """
+    targets = {}
+    for obj in bridgeConfig["groups"].values():
+        for rtype in ["room", "zone", "entertainment_configuration"]:
+            targets[str(uuid.uuid5(uuid.NAMESPACE_URL, obj.id_v2 + rtype))] = obj
+    for obj in bridgeConfig["lights"].values():
+        targets[obj.id_v2] = obj
+        targets[str(uuid.uuid5(uuid.NAMESPACE_URL, obj.id_v2))] = obj
+    return targets
+
+def _resolveWhere(where: List[Dict[str, Any]], targets: Dict[str, Any]) -> List[weakref.ReferenceType]:
+    """
+    Resolve a `where` list of a behavior instance to weak references of the targets.
+
+    Args:
+        where (List[Dict[str, Any]]): The `where` list from the behavior instance configuration.
+        targets (Dict[str, Any]): The rid to object mapping built by _targetIds.
+
+    Returns:
+        List[weakref.ReferenceType]: Weak references to the resolved groups and lights.
+    """
+    resolved = []
+    for resource in where:
+        element = resource["group"] if "group" in resource else resource.get("light")
+        if element and element["rid"] in targets:
+            resolved.append(weakref.ref(targets[element["rid"]]))
+        else:
+            logging.info(f"Behavior target {element} not found")
+    return resolved
+
+def rebuildBehaviorIndex() -> None:
+    """
+    Rebuild the index from device id_v2 to the compiled handlers of the behavior instances triggered by it.
+    """
+    HueObjects.behaviorIndexDirty = False
+    targets = _targetIds()
+    index: Dict[str, List[BehaviorHandler]] = {}
+    for instance in list(bridgeConfig["behavior_instance"].values()):
+        configuration = instance.configuration
+        deviceIds = set()
+        for key in ["source", "device"]:
+            if key in configuration and configuration[key].get("rtype") == "device":
+                deviceIds.add(configuration[key]["rid"])
+        if not deviceIds:
+            continue
+        handler = BehaviorHandler(instance=weakref.ref(instance), targets=_resolveWhere(configuration.get("where", []), targets))
+        for button in ["button1", "button2", "button3", "button4"]:
+            if button in configuration and "where" in configuration[button]:
+                handler.buttonTargets[button] = _resolveWhere(configuration[button]["where"], targets)
+        for deviceId in deviceIds:
+            index.setdefault(deviceId, []).append(handler)
+    global behaviorIndex
+    behaviorIndex = index
+    logging.debug(f"Behavior index rebuilt for {len(index)} devices")
+
 def threadDelayAction(actionsToExecute: Dict[str, Any], device: Any, monitoredKey: str, monitoredValue: Any, groupsAndLights: List[Any]) -> None:
     """
     Execute actions after a delay if the monitored value remains unchanged.
@@ -127,20 +215,14 @@ def checkBehaviorInstances(device: Any) -> None:
         device (Any): The device to check behavior instances for.
     """
     logging.debug("Entering checkBehaviorInstances")
-    deviceUuid = device.id_v2 
-    matchedInstances = [
-        instance for instance in bridgeConfig["behavior_instance"].values()
-        if instance.enabled and (
-            ("source" in instance.configuration and instance.configuration["source"]["rtype"] == "device" and instance.configuration["source"]["rid"] == deviceUuid) or
-            ("device" in instance.configuration and instance.configuration["device"]["rtype"] == "device" and instance.configuration["device"]["rid"] == deviceUuid)
-        )
-    ]
-
-    for instance in matchedInstances:
-        lightsAndGroups = [
-            findGroup(resource["group"]["rid"], resource["group"]["rtype"]) if "group" in resource else findLight(resource["light"]["rid"], resource["light"]["rtype"])
-            for resource in instance.configuration["where"]
-        ]
+    if HueObjects.behaviorIndexDirty:
+        rebuildBehaviorIndex()
+
+    for handler in behaviorIndex.get(device.id_v2, []):
+        instance = handler.instance()
+        if instance is None or not instance.enabled:
+            continue
+        lightsAndGroups = handler.lightsAndGroups()
         if device.modelid in ["RWL022", "RWL021", "RWL020"]: # Hue dimmer switch
             handleDimmerSwitch(instance, device, lightsAndGroups)
         elif device.modelid == "SML001": # Motion Sensor
@@ -148,7 +230,7 @@ def checkBehaviorInstances(device: Any) -> None:
         elif device.modelid == "SOC001": # Secure contact sensor
             handleContactSensor(instance, device, lightsAndGroups)
         elif device.modelid == "RDM002": # Hue rotary switch
-            handleRotarySwitch(instance, device, lightsAndGroups)
+            handleRotarySwitch(instance, device, handler)
 
 def handleDimmerSwitch(instance: Any, device: Any, lightsAndGroups: List[Any]) -> None:
     """
@@ -356,24 +438,21 @@ def getContactSensorActions(instance: Any) -> Dict[str, Any]:
         return {"on_open": instance.configuration["when"]["always"]["on_open"], "on_close": instance.configuration["when"]["always"]["on_close"]}
     return {}
 
-def handleRotarySwitch(instance: Any, device: Any, lightsAndGroups: List[Any]) -> None:
+def handleRotarySwitch(instance: Any, device: Any, handler: BehaviorHandler) -> None:
     """
     Handle actions for a rotary switch.
 
     Args:
         instance (Any): The behavior instance.
         device (Any): The device to handle.
-        lightsAndGroups (List[Any]): List of groups and lights to control.
+        handler (BehaviorHandler): The compiled handler holding the per button targets.
     """
     buttonDevice = device.elements["ZLLSwitch"]()
     button = getRotaryButton(buttonDevice)
     if button in instance.configuration:
         buttonAction = getButtonAction(buttonDevice)
         if buttonAction in instance.configuration[button]:
-            lightsAndGroups = [
-                findGroup(resource["group"]["rid"], resource["group"]["rtype"]) if "group" in resource else findLight(resource["light"]["rid"], resource["light"]["rtype"])
-                for resource in instance.configuration[button]["where"]
-            ]
+            lightsAndGroups = handler.lightsAndGroups(button)
             if "time_based_extended" in instance.configuration[button][buttonAction]:
                 handleTimeBasedExtendedAction(instance, button, buttonAction, lightsAndGroups)
             elif "time_based" in instance.configuration[button][buttonAction]:
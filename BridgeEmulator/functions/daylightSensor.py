@@ -5,6 +5,7 @@ from datetime import datetime, timezone
 from time import sleep
 from threading import Thread
 from functions.scripts import triggerScript
+from HueObjects import bumpStateVersion
 import logManager
 import configManager
 from typing import Dict, Any
@@ -89,6 +90,7 @@ def daylightSensor(tz: str, sensor: Any) -> None:
     current_time = datetime.now(timezone.utc).replace(tzinfo=None)
 
     sensor.state["daylight"] = offsets["sunrise"] < 0 < offsets["sunset"]
+    bumpStateVersion()
     logging.info(f"set daylight sensor to {'true' if sensor.state['daylight'] else 'false'}")
 
     if 0 < offsets["sunset"] < 3600:
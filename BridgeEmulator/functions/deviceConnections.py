@@ -0,0 +1,166 @@
+import json
+import select
+import socket
+from threading import Lock, RLock
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import logManager
+
+logging = logManager.logger.get_logger(__name__)
+
+MAX_BACKOFF = 60  # seconds between reconnect attempts to an unreachable device, doubling from 1 s
+
+connections: Dict[Tuple[str, str, int], "DeviceConnection"] = {}  # (protocol, ip, port) -> connection
+connectionsLock = Lock()
+
+class DeviceConnection:
+    """
+    Persistent socket to one device, shared by every command sent to it.
+
+    The socket is checked before use and reopened when the device closed it. After a failed connect further
+    attempts are refused until the backoff expired, so an unreachable device fails fast instead of blocking
+    every command on the connect timeout. Commands are written back to back without waiting for replies.
+    """
+    def __init__(self, ip: str, port: int, kind: int = socket.SOCK_STREAM, timeout: float = 5) -> None:
+        self.address = (ip, int(port))
+        self.kind = kind
+        self.timeout = timeout
+        self.lock = RLock()  # held for a whole exchange, so replies are read by the thread that asked
+        self._socket: Optional[socket.socket] = None
+        self._buffer = b""
+        self._backoff = 1
+        self._retryAt = 0.0
+
+    def _healthy(self) -> bool:
+        if self._socket is None:
+            return False
+        if self.kind != socket.SOCK_STREAM:
+            return True
+        try:
+            readable, _, _ = select.select([self._socket], [], [], 0)
+            # a readable socket without data was closed by the device
+            return not readable or self._socket.recv(1, socket.MSG_PEEK) != b""
+        except OSError:
+            return False
+
+    def _ensure(self) -> socket.socket:
+        if self._healthy():
+            return self._socket
+        self.close()
+        if monotonic() < self._retryAt:
+            raise ConnectionError(f"{self.address[0]} is unreachable, retrying in {round(self._retryAt - monotonic())} s")
+        try:
+            sock = socket.socket(socket.AF_INET, self.kind)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address)
+        except OSError:
+            self._retryAt = monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+            raise
+        self._backoff = 1
+        self._retryAt = 0.0
+        self._socket = sock
+        return sock
+
+    def send(self, messages: List[bytes]) -> None:
+        """
+        Write messages in one go, reconnecting once if the kept connection turned out to be stale.
+        Replies to earlier commands are dropped first, so they do not pile up in the socket.
+
+        Args:
+            messages (List[bytes]): The encoded messages.
+        """
+        with self.lock:
+            self.drain()
+            self._send(b"".join(messages))
+
+    def _send(self, data: bytes) -> None:
+        for attempt in range(2):
+            sock = self._ensure()
+            try:
+                sock.sendall(data)
+                return
+            except OSError:
+                self.close()
+                if attempt:
+                    raise
+
+    def readLine(self) -> bytes:
+        """Read one line from the device, the lock must be held."""
+        while b"\n" not in self._buffer:
+            chunk = self._socket.recv(65536)
+            if not chunk:
+                self.close()
+                raise ConnectionError(f"{self.address[0]} closed the connection")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.strip()
+
+    def drain(self) -> None:
+        """Drop replies nobody waits for (pipelined commands), the lock must be held."""
+        self._buffer = b""
+        while self._socket is not None and select.select([self._socket], [], [], 0)[0]:
+            try:
+                if not self._socket.recv(65536):
+                    self.close()
+            except OSError:
+                self.close()
+
+    def request(self, message: Dict[str, Any], match: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        """
+        Send a JSON line and wait for the JSON line reply accepted by match.
+
+        Args:
+            message (Dict[str, Any]): The request.
+            match (Callable[[Dict[str, Any]], bool]): Tells the reply apart from notifications and older replies.
+
+        Returns:
+            Dict[str, Any]: The reply.
+        """
+        with self.lock:
+            self.drain()
+            self._send((json.dumps(message) + "\r\n").encode())
+            try:
+                while True:
+                    line = self.readLine()
+                    if not line:
+                        continue
+                    reply = json.loads(line)
+                    if match(reply):
+                        return reply
+            except (OSError, ValueError):
+                self.close()
+                raise
+
+    def close(self) -> None:
+        """Close the socket, the next command reconnects."""
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._buffer = b""
+
+def getConnection(protocol: str, ip: str, port: int, factory: Callable[[str, int], DeviceConnection] = DeviceConnection) -> DeviceConnection:
+    """
+    Return the persistent connection to a device, creating it on first use.
+
+    Args:
+        protocol (str): The light protocol, devices may expose several protocols on one address.
+        ip (str): The device address.
+        port (int): The device port.
+        factory (Callable[[str, int], DeviceConnection]): Builds the connection, for protocol specific subclasses.
+
+    Returns:
+        DeviceConnection: The connection.
+    """
+    key = (protocol, ip, int(port))
+    connection = connections.get(key)
+    if connection is None:
+        with connectionsLock:
+            connection = connections.get(key)
+            if connection is None:
+                connection = connections[key] = factory(ip, int(port))
+    return connection
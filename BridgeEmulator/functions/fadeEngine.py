@@ -0,0 +1,232 @@
+import weakref
+import logManager
+from concurrent.futures import Future
+from threading import RLock
+from time import monotonic
+from typing import Any, Dict, List, Tuple
+
+from HueObjects import dispatchPool
+from functions.taskScheduler import Task, TaskScheduler
+
+logging = logManager.logger.get_logger(__name__)
+
+# protocols that honour transitiontime on the device itself
+NATIVE_TRANSITION_PROTOCOLS = ["dummy", "hue", "deconz", "native", "native_single", "native_multi", "esphome", "mqtt", "tradfri", "yeelight"]
+# minimum seconds between two frames sent to the same controller, cloud and bluetooth lights can not keep up with the default rate
+PROTOCOL_INTERVALS = {"govee": 1.0, "tpkasa": 0.5, "hue_bl": 0.5, "homeassistant_ws": 0.5, "domoticz": 0.5, "jeedom": 0.5}
+DEFAULT_INTERVAL = 0.2
+# protocols taking the steps of every light behind a controller in one {"lights": {key: state}} payload, keyed by this protocol_cfg entry
+MULTI_LIGHT_PROTOCOLS = {"wled": "segmentId"}
+ORIGIN_TIMEOUT = 1
+
+def briToLightness(bri: float) -> float:
+    """
+    Convert a v1 brightness to CIE L*, so fades look linear to the eye.
+
+    Args:
+        bri (float): The brightness, 1-254.
+
+    Returns:
+        float: The lightness, 0-100.
+    """
+    y = max(bri, 0) / 254
+    return 116 * y ** (1 / 3) - 16 if y > 0.008856 else 903.3 * y
+
+def lightnessToBri(lightness: float) -> float:
+    y = ((lightness + 16) / 116) ** 3 if lightness > 8 else lightness / 903.3
+    return y * 254
+
+def xyToUv(xy: List[float]) -> Tuple[float, float]:
+    """
+    Convert CIE xy to the more perceptually uniform CIE 1976 u'v'.
+
+    Args:
+        xy (List[float]): The xy coordinates.
+
+    Returns:
+        Tuple[float, float]: The u'v' coordinates.
+    """
+    denominator = -2 * xy[0] + 12 * xy[1] + 3
+    return 4 * xy[0] / denominator, 9 * xy[1] / denominator
+
+def uvToXy(u: float, v: float) -> List[float]:
+    denominator = 6 * u - 16 * v + 12
+    return [round(9 * u / denominator, 4), round(4 * v / denominator, 4)]
+
+class Fade:
+    def __init__(self, light: Any, controller: Tuple[str, str], origin: Dict[str, Any], target: Dict[str, Any], duration: float, turnOn: bool, turnOff: bool) -> None:
+        self.light = weakref.ref(light)
+        self.controller = controller
+        self.origin = origin
+        self.target = target
+        self.begin = monotonic()
+        self.duration = duration
+        self.turnOn = turnOn
+        self.turnOff = turnOff
+        self.sent: Dict[str, Any] = {}
+
+    def position(self, now: float) -> Dict[str, Any]:
+        """
+        Return the interpolated state at a point in time.
+
+        Args:
+            now (float): The monotonic time.
+
+        Returns:
+            Dict[str, Any]: The quantized bri, ct and xy values.
+        """
+        progress = min((now - self.begin) / self.duration, 1) if self.duration > 0 else 1
+        values: Dict[str, Any] = {}
+        if "bri" in self.target:
+            start, end = briToLightness(self.origin["bri"]), briToLightness(self.target["bri"])
+            values["bri"] = min(max(round(lightnessToBri(start + (end - start) * progress)), 1), 254)
+        if "ct" in self.target:
+            values["ct"] = round(self.origin["ct"] + (self.target["ct"] - self.origin["ct"]) * progress)
+        if "xy" in self.target:
+            startU, startV = xyToUv(self.origin["xy"])
+            endU, endV = xyToUv(self.target["xy"])
+            values["xy"] = uvToXy(startU + (endU - startU) * progress, startV + (endV - startV) * progress)
+        return values
+
+class FadeEngine:
+    """
+    Interpolate transitions on the bridge for lights whose protocol ignores transitiontime.
+    All fades share one scheduler; the lights behind a controller are updated in one frame, sent as one payload
+    where the protocol allows it. Frames are sent on the dispatch pool, a controller still busy with the previous
+    frame skips the next one.
+    """
+    def __init__(self, interval: float = DEFAULT_INTERVAL) -> None:
+        self.interval = interval
+        self.fades: Dict[str, Fade] = {}
+        self.origins: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.frames: Dict[Tuple[str, str], Task] = {}
+        self.sending: Dict[Tuple[str, str], Future] = {}
+        self.scheduler = TaskScheduler("fadeEngine")
+        self._lock = RLock()
+
+    def needsFade(self, light: Any, state: Dict[str, Any]) -> bool:
+        if light.protocol in NATIVE_TRANSITION_PROTOCOLS or "lights" in state or light.streaming:
+            return False
+        return state.get("transitiontime", 0) >= 2 and any(key in state for key in ["on", "bri", "ct", "xy"])
+
+    def interrupt(self, light: Any, state: Dict[str, Any]) -> None:
+        """
+        Stop the running fade of a light because a new command arrived. Must be called before the light state
+        is overwritten, when the new command is a transition its starting point is remembered.
+
+        Args:
+            light (Any): The light receiving the command.
+            state (Dict[str, Any]): The new v1 state.
+        """
+        with self._lock:
+            fade = self.fades.pop(light.id_v1, None)
+            if not self.needsFade(light, state):
+                return
+            timestamp, _ = self.origins.get(light.id_v1, (0, None))
+            if monotonic() - timestamp < ORIGIN_TIMEOUT:
+                return
+            origin = {key: light.state[key] for key in ["on", "bri", "ct", "xy"] if key in light.state}
+            if fade is not None:
+                origin.update(fade.position(monotonic()))
+            self.origins[light.id_v1] = (monotonic(), origin)
+
+    def start(self, light: Any, state: Dict[str, Any]) -> bool:
+        """
+        Start a fade for a light, if its protocol needs one.
+
+        Args:
+            light (Any): The light, its state already holds the target values.
+            state (Dict[str, Any]): The v1 state with the transitiontime.
+
+        Returns:
+            bool: True when the engine took over sending the state to the light.
+        """
+        with self._lock:
+            timestamp, origin = self.origins.pop(light.id_v1, (0, None))
+            if not self.needsFade(light, state) or origin is None or monotonic() - timestamp > ORIGIN_TIMEOUT:
+                return False
+            turnOn = state.get("on") is True and not origin.get("on")
+            turnOff = state.get("on") is False and origin.get("on", False)
+            if state.get("on") is False and not turnOff:
+                return False
+            if not origin.get("on") and "bri" in origin:
+                origin["bri"] = 1
+            target: Dict[str, Any] = {}
+            if "bri" in origin and ("bri" in state or turnOn or turnOff):
+                target["bri"] = 1 if turnOff else light.state["bri"]
+            for key in ["ct", "xy"]:
+                if key in state and key in origin and origin[key] is not None:
+                    target[key] = state[key]
+            if not target:
+                return False
+            controller = (light.protocol, str(light.protocol_cfg.get("ip", light.id_v1)))
+            fade = Fade(light, controller, origin, target, state["transitiontime"] / 10, turnOn, turnOff)
+            self.fades[light.id_v1] = fade
+            if controller not in self.frames:
+                self.frames[controller] = self.scheduler.schedule(0, self._frame, controller)
+        return True
+
+    def cancel(self, light: Any) -> None:
+        """
+        Cancel the fade of a light, the light keeps its current level.
+
+        Args:
+            light (Any): The light.
+        """
+        with self._lock:
+            self.fades.pop(light.id_v1, None)
+
+    def fading(self) -> int:
+        """
+        Return the number of running fades.
+
+        Returns:
+            int: The number of lights being faded.
+        """
+        return len(self.fades)
+
+    def _frame(self, controller: Tuple[str, str]) -> None:
+        now = monotonic()
+        steps = []
+        interval = self.interval
+        with self._lock:
+            busy = controller in self.sending and not self.sending[controller].done()
+            for lightId, fade in list(self.fades.items()):
+                if fade.controller != controller:
+                    continue
+                if busy:
+                    break
+                light = fade.light()
+                if light is None:
+                    del self.fades[lightId]
+                    continue
+                values = fade.position(now)
+                step = {key: value for key, value in values.items() if fade.sent.get(key) != value}
+                if fade.turnOn and not fade.sent:
+                    step["on"] = True
+                if now - fade.begin >= fade.duration:
+                    if fade.turnOff:
+                        step = {"on": False}
+                    del self.fades[lightId]
+                fade.sent.update(values)
+                if step:
+                    steps.append((light, step))
+                interval = max(interval, light.protocol_cfg.get("fade_interval", PROTOCOL_INTERVALS.get(light.protocol, self.interval)))
+            if any(fade.controller == controller for fade in self.fades.values()):
+                self.frames[controller] = self.scheduler.schedule(interval - (monotonic() - now), self._frame, controller)
+            else:
+                del self.frames[controller]
+            if steps:
+                self.sending[controller] = dispatchPool.submit(self._send, steps)
+            elif not busy:
+                self.sending.pop(controller, None)
+
+    def _send(self, steps: List[Tuple[Any, Dict[str, Any]]]) -> None:
+        key = MULTI_LIGHT_PROTOCOLS.get(steps[0][0].protocol)
+        if key is not None and len(steps) > 1:
+            steps[0][0].applyProtocolState({"lights": {light.protocol_cfg[key]: step for light, step in steps}})
+            return
+        for light, step in steps:
+            light.applyProtocolState(step)
+
+fadeEngine = FadeEngine()
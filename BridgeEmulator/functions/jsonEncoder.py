@@ -0,0 +1,24 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(data: Any) -> bytes:
+    """
+    Encode data to compact UTF-8 JSON, using orjson when it is installed.
+
+    Args:
+        data (Any): The data to encode.
+
+    Returns:
+        bytes: The encoded JSON.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # types orjson refuses (e.g. int subclasses, big ints), let the standard library decide
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,113 @@
+import logManager
+from collections import deque
+from threading import Condition, Thread
+from typing import Any, Callable, Deque, Dict, List
+from functions import metrics
+
+logging = logManager.logger.get_logger(__name__)
+
+pipelines: Dict[str, "MessagePipeline"] = {}  # every pipeline by name
+
+class Shard:
+    """
+    One worker thread with its bounded queue, all messages of a key land in the same shard.
+    """
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.queue: Deque[List[Any]] = deque()
+        self.pending: Dict[str, List[Any]] = {}  # queued mergeable entries by key
+        self.condition = Condition()
+        self.maxDepth = 0
+        self.counters = {"submitted": 0, "processed": 0, "merged": 0, "dropped": 0, "errors": 0}
+
+class MessagePipeline:
+    """
+    Bounded, keyed worker pipeline keeping message order per key.
+
+    Producers (network threads) only enqueue. A mergeable message replaces the payload of a queued message
+    with the same key, as only the latest state matters. When a shard is full the new message is dropped,
+    or with blocking the producer waits for room, pushing back on the connection instead of losing events.
+    """
+    def __init__(self, name: str, handler: Callable[[Any], None], workers: int = 4, maxsize: int = 1000, blocking: bool = False) -> None:
+        self.name = name
+        self.handler = handler
+        self.blocking = blocking
+        self.shards = [Shard(max(1, maxsize // workers)) for _ in range(workers)]
+        for index, shard in enumerate(self.shards):
+            Thread(target=self._work, args=[shard], name=f"{name}-{index}", daemon=True).start()
+        pipelines[name] = self
+        metrics.register(name, self.metrics)
+
+    def submit(self, key: str, message: Any, mergeable: bool = False) -> bool:
+        """
+        Queue a message for the workers.
+
+        Args:
+            key (str): The ordering key, usually the device or topic.
+            message (Any): The message handed to the handler.
+            mergeable (bool): The message is a full state that supersedes a queued one with the same key.
+
+        Returns:
+            bool: False when the message was dropped because the shard is full.
+        """
+        shard = self.shards[hash(key) % len(self.shards)]
+        with shard.condition:
+            shard.counters["submitted"] += 1
+            if mergeable and key in shard.pending:
+                shard.pending[key][1] = message
+                shard.counters["merged"] += 1
+                return True
+            while self.blocking and len(shard.queue) >= shard.maxsize:
+                shard.condition.wait()
+            if len(shard.queue) >= shard.maxsize:
+                shard.counters["dropped"] += 1
+                if shard.counters["dropped"] % 100 == 1:
+                    logging.warning(f"{self.name} pipeline is full, dropped {shard.counters['dropped']} messages of a shard so far")
+                return False
+            entry = [key, message]
+            shard.queue.append(entry)
+            if mergeable:
+                shard.pending[key] = entry
+            shard.maxDepth = max(shard.maxDepth, len(shard.queue))
+            shard.condition.notify_all()
+        return True
+
+    def _work(self, shard: Shard) -> None:
+        while True:
+            with shard.condition:
+                while not shard.queue:
+                    shard.condition.wait()
+                entry = shard.queue.popleft()
+                if shard.pending.get(entry[0]) is entry:
+                    del shard.pending[entry[0]]
+                if self.blocking:
+                    shard.condition.notify_all()  # wake producers waiting for room
+            error = False
+            try:
+                self.handler(entry[1])
+            except Exception as e:
+                error = True
+                logging.info(f"{self.name} pipeline handler error | {e}")
+            with shard.condition:
+                shard.counters["processed"] += 1
+                shard.counters["errors"] += error
+
+    def depth(self) -> int:
+        """Return the number of queued messages."""
+        return sum(len(shard.queue) for shard in self.shards)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Return the queue depths and message counters.
+
+        Returns:
+            Dict[str, Any]: The current and maximum depth per shard and the counters.
+        """
+        result = {}
+        for shard in self.shards:
+            with shard.condition:
+                for counter, value in shard.counters.items():
+                    result[counter] = result.get(counter, 0) + value
+        result["depth"] = [len(shard.queue) for shard in self.shards]
+        result["max_depth"] = [shard.maxDepth for shard in self.shards]
+        return result
@@ -0,0 +1,37 @@
+from threading import Lock
+from typing import Any, Callable, Dict
+
+providers: Dict[str, Callable[[], Dict[str, Any]]] = {}  # name -> function returning the metrics of a pipeline, client or scheduler
+providersLock = Lock()
+
+def register(name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Publish the metrics of a component on the metrics endpoint.
+
+    Args:
+        name (str): The name the metrics are listed under, a later registration with the same name replaces it.
+        provider (Callable[[], Dict[str, Any]]): Returns the current metrics.
+    """
+    with providersLock:
+        providers[name] = provider
+
+def unregister(name: str) -> None:
+    """
+    Stop publishing the metrics of a component.
+
+    Args:
+        name (str): The name the metrics are listed under.
+    """
+    with providersLock:
+        providers.pop(name, None)
+
+def collect() -> Dict[str, Any]:
+    """
+    Return the metrics of every registered component.
+
+    Returns:
+        Dict[str, Any]: The metrics by name.
+    """
+    with providersLock:
+        current = list(providers.items())
+    return {name: provider() for name, provider in current}
@@ -0,0 +1,88 @@
+import logManager
+from threading import Lock
+from time import monotonic
+from typing import Dict, List
+
+logging = logManager.logger.get_logger(__name__)
+
+RATE = 25  # requests per second refilled to every API key
+BURST = 100  # requests an idle API key can make at once
+PRUNE_INTERVAL = 60  # seconds between sweeps dropping the buckets that refilled, a new bucket starts full anyway
+
+class RateLimiter:
+    """
+    In-memory token bucket per key, an API key or a device.
+    """
+    def __init__(self, rate: float = RATE, burst: float = BURST) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.buckets: Dict[str, List[float]] = {}
+        self.pruned = monotonic()
+        self._lock = Lock()
+
+    def _bucket(self, key: str, now: float) -> List[float]:
+        """Return the bucket of a key, creating it full. Called with the lock held."""
+        if now - self.pruned >= PRUNE_INTERVAL:
+            self.pruned = now
+            for other in [other for other, bucket in self.buckets.items() if bucket[0] + (now - bucket[1]) * self.rate >= self.burst]:
+                del self.buckets[other]
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.burst, now]
+        return bucket
+
+    def allow(self, key: str) -> bool:
+        """
+        Take a token from the bucket of a key.
+
+        Args:
+            key (str): The API key.
+
+        Returns:
+            bool: False when the key ran out of tokens and the request must be throttled.
+        """
+        now = monotonic()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    def tokens(self, key: str) -> float:
+        """
+        Return the tokens a key has now, without taking one.
+
+        Args:
+            key (str): The API key.
+
+        Returns:
+            float: The available tokens.
+        """
+        now = monotonic()
+        with self._lock:
+            bucket = self._bucket(key, now)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            return bucket[0]
+
+    def retryAfter(self, key: str) -> float:
+        """
+        Return the seconds until the key has a token again.
+
+        Args:
+            key (str): The API key.
+
+        Returns:
+            float: The wait in seconds.
+        """
+        with self._lock:
+            bucket = self.buckets.get(key)
+            if bucket is None or bucket[0] >= 1:
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+rateLimiter = RateLimiter()
@@ -1,10 +1,51 @@
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from time import sleep
-from typing import Union, Optional
+from typing import Any, Callable, Dict, Iterable, List, Union, Optional
 import logManager
 
 logging = logManager.logger.get_logger(__name__)
 
+PROBE_WORKERS = 64  # device probes in flight during a light scan
+
+session = requests.Session()  # shared by the discovery probes, keeps the connections to a device open between them
+session.mount("http://", HTTPAdapter(pool_connections=PROBE_WORKERS, pool_maxsize=8))
+probePool = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix="probe")
+
+def probe(probeHost: Callable[[str], List[Dict[str, Any]]], ip: str) -> List[Dict[str, Any]]:
+    """
+    Run a protocol probe on one address, an unexpected answer of the device counts as no light.
+
+    Args:
+        probeHost (Callable[[str], List[Dict[str, Any]]]): The probe of the protocol.
+        ip (str): The device address.
+
+    Returns:
+        List[Dict[str, Any]]: The lights found.
+    """
+    try:
+        return probeHost(ip)
+    except Exception as e:
+        logging.debug(f"ip {ip} is unknown device: {e!r}")
+        return []
+
+def probeAll(probeHost: Callable[[str], List[Dict[str, Any]]], device_ips: Iterable[str]) -> List[Dict[str, Any]]:
+    """
+    Run a protocol probe on several addresses at once.
+
+    Args:
+        probeHost (Callable[[str], List[Dict[str, Any]]]): The probe of the protocol.
+        device_ips (Iterable[str]): The device addresses.
+
+    Returns:
+        List[Dict[str, Any]]: The lights found, in address order.
+    """
+    lights = []
+    for found in probePool.map(lambda ip: probe(probeHost, ip), device_ips):
+        lights.extend(found)
+    return lights
+
 def sendRequest(url: str, method: str, data: Optional[Union[dict, str]] = None, timeout: int = 3, delay: int = 0, retries: int = 3, retry_delay: int = 1) -> str:
     """
     Send an HTTP request with the specified method to the given URL.
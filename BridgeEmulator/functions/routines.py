@@ -0,0 +1,260 @@
+import logManager
+import configManager
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from threading import RLock, local
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from HueObjects import derivedV2Id, groupsOfLight
+from functions.taskScheduler import Task, taskScheduler
+
+logging = logManager.logger.get_logger(__name__)
+bridgeConfig = configManager.bridgeConfig.yaml_config
+
+RESUME_GRACE = 300  # routines that ended longer ago than this while the bridge was down are not replayed
+SAVE_DELAY = 60  # seconds step progress may stay unsaved, after a crash at most the steps of this window run again
+
+# steps set lights through HueObjects.dispatchPool and wait for it, so they must not run on that pool themselves
+routinePool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="routine")
+
+StepExecutor = Callable[[Any, Dict[str, Any], float], Optional[bool]]
+
+class Routine:
+    """
+    A running behavior script. The plan is a list of steps {"at": seconds, "call": executor, "args": {...}, "duration": seconds},
+    its progress is stored on the behavior instance (`routine` attribute) so it survives a restart.
+    """
+    def __init__(self, instance: Any, progress: Dict[str, Any]) -> None:
+        self.instance = weakref.ref(instance)
+        self.progress = progress
+        self.task: Optional[Task] = None
+
+    @property
+    def plan(self) -> List[Dict[str, Any]]:
+        return self.progress["plan"]
+
+    @property
+    def end(self) -> float:
+        return self.progress["started"] + max([step["at"] + step.get("duration", 0) for step in self.plan], default=0)
+
+    def targets(self) -> Set[str]:
+        return {step["args"]["rid"] for step in self.plan if "rid" in step.get("args", {})}
+
+    def getV2Api(self) -> Dict[str, Any]:
+        instance = self.instance()
+        return {
+            "id": instance.id_v2 if instance else None,
+            "name": instance.name if instance else None,
+            "owner": {"rid": instance.id_v2 if instance else None, "rtype": "behavior_instance"},
+            "script_id": instance.script_id if instance else None,
+            "started": datetime.fromtimestamp(self.progress["started"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "ends": datetime.fromtimestamp(self.end, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "step": self.progress["step"],
+            "steps": len(self.plan),
+            "type": "routine"
+        }
+
+class RoutineRunner:
+    """
+    Run routine steps on the routine pool when they are due. The progress is saved when a routine starts, ends
+    or is cancelled; step progress is saved at most every SAVE_DELAY seconds.
+    """
+    def __init__(self) -> None:
+        self.routines: Dict[str, Routine] = {}
+        self.executors: Dict[str, StepExecutor] = {"update_instance": self._update_instance}
+        self.saveTask: Optional[Task] = None
+        self._lock = RLock()
+        self._local = local()  # the routine whose step runs on the current thread
+
+    def register(self, name: str, executor: StepExecutor) -> None:
+        """
+        Register a step executor. Executors are called with (behavior_instance, args, elapsed), where elapsed is
+        how late the step runs in seconds, and may return False to cancel the rest of the routine.
+
+        Args:
+            name (str): The name used by the `call` key of the plan steps.
+            executor (StepExecutor): The executor.
+        """
+        self.executors[name] = executor
+
+    def start(self, instance: Any, plan: List[Dict[str, Any]], delay: float = 0) -> None:
+        """
+        Start a routine for a behavior instance, pre-empting any routine of the same instance or on the same targets.
+
+        Args:
+            instance (Any): The behavior instance.
+            plan (List[Dict[str, Any]]): The routine steps.
+            delay (float): Seconds to wait before the first step.
+        """
+        progress = {"started": time() + delay, "step": 0, "plan": sorted(plan, key=lambda step: step["at"])}
+        routine = Routine(instance, progress)
+        with self._lock:
+            self.cancel(instance.id_v2, "restarted")
+            targets = routine.targets()
+            for other in list(self.routines.values()):
+                if targets & other.targets():
+                    self._stop(other, "pre-empted by " + str(instance.name))
+            self.routines[instance.id_v2] = routine
+            instance.routine = progress
+            self._schedule(routine)
+        logging.info(f"Routine {instance.name} started with {len(plan)} steps")
+        self._save()
+
+    def cancel(self, instanceId: str, reason: str = "cancelled") -> bool:
+        """
+        Cancel the routine of a behavior instance.
+
+        Args:
+            instanceId (str): The id_v2 of the behavior instance.
+            reason (str): The reason written to the log.
+
+        Returns:
+            bool: True if a routine was running.
+        """
+        with self._lock:
+            routine = self.routines.get(instanceId)
+            if routine is None:
+                return False
+            self._stop(routine, reason)
+        self._save()
+        return True
+
+    def switchedOff(self, lights: List[Any]) -> None:
+        """
+        Cancel the routines targeting a room or zone of lights that received an off command, unless the
+        command is a step of the routine itself.
+
+        Args:
+            lights (List[Any]): The lights switched off.
+        """
+        if not self.routines:
+            return
+        targets: Set[str] = set()
+        for light in lights:
+            for group in groupsOfLight(light):
+                targets.update([derivedV2Id(group, "room"), derivedV2Id(group, "zone")])
+        stopped = False
+        with self._lock:
+            for routine in list(self.routines.values()):
+                instance = routine.instance()
+                if instance is None or routine is getattr(self._local, "routine", None) or not targets & routine.targets():
+                    continue
+                self._stop(routine, "cancelled, target switched off")
+                self._finish_bookkeeping(routine, instance)
+                stopped = True
+        if stopped:
+            self._save()
+
+    def resume(self) -> None:
+        """
+        Resume the routines stored on the behavior instances, typically after a restart.
+        Steps missed while the bridge was down run immediately; fades continue with the remaining time.
+        """
+        for instance in list(bridgeConfig["behavior_instance"].values()):
+            progress = getattr(instance, "routine", None)
+            if not progress or instance.id_v2 in self.routines:
+                continue
+            routine = Routine(instance, progress)
+            if time() > routine.end + RESUME_GRACE:
+                logging.info(f"Routine {instance.name} expired while the bridge was down")
+                self._finish_bookkeeping(routine, instance)
+                instance.routine = None
+                continue
+            logging.info(f"Resume routine {instance.name} at step {progress['step']}")
+            with self._lock:
+                self.routines[instance.id_v2] = routine
+                self._schedule(routine)
+        self._save()
+
+    def activeRoutines(self) -> List[Dict[str, Any]]:
+        """
+        Return the API representation of the running routines.
+
+        Returns:
+            List[Dict[str, Any]]: The running routines.
+        """
+        with self._lock:
+            return [routine.getV2Api() for routine in self.routines.values() if routine.instance()]
+
+    def _schedule(self, routine: Routine) -> None:
+        progress = routine.progress
+        if progress["step"] < len(routine.plan):
+            due = progress["started"] + routine.plan[progress["step"]]["at"]
+        else:
+            due = routine.end
+        routine.task = taskScheduler.schedule(due - time(), routinePool.submit, self._run_step, routine)
+
+    def _run_step(self, routine: Routine) -> None:
+        instance = routine.instance()
+        with self._lock:
+            if instance is None or self.routines.get(instance.id_v2) is not routine:
+                return
+            progress = routine.progress
+            if progress["step"] >= len(routine.plan):
+                self._stop(routine, "finished")
+                self._save()
+                return
+            step = routine.plan[progress["step"]]
+            progress["step"] += 1
+        elapsed = time() - (progress["started"] + step["at"])
+        self._local.routine = routine
+        try:
+            proceed = self.executors[step["call"]](instance, step.get("args", {}), elapsed)
+        except Exception as e:
+            logging.warning(f"Routine {instance.name} step {step['call']} failed: {e}")
+            proceed = True
+        finally:
+            self._local.routine = None
+        with self._lock:
+            if self.routines.get(instance.id_v2) is not routine:
+                return
+            if proceed is False:
+                self._stop(routine, "target switched off")
+                self._finish_bookkeeping(routine, instance)
+            else:
+                self._schedule(routine)
+                self._saveLater()
+                return
+        self._save()
+
+    def _stop(self, routine: Routine, reason: str) -> None:
+        if routine.task is not None:
+            routine.task.cancel()
+        instance = routine.instance()
+        if instance is None:
+            return
+        if self.routines.get(instance.id_v2) is routine:
+            del self.routines[instance.id_v2]
+        instance.routine = None
+        logging.info(f"Routine {instance.name} {reason}")
+
+    def _finish_bookkeeping(self, routine: Routine, instance: Any) -> None:
+        for step in routine.plan[routine.progress["step"]:]:
+            if step["call"] == "update_instance":
+                self._update_instance(instance, step["args"], 0)
+
+    def _update_instance(self, instance: Any, args: Dict[str, Any], elapsed: float) -> None:
+        for key, value in args.items():
+            if key == "enabled":
+                instance.update_attr({"enabled": value})
+            else:
+                setattr(instance, key, value)
+
+    def _saveLater(self) -> None:
+        with self._lock:
+            if self.saveTask is None:
+                self.saveTask = taskScheduler.schedule(SAVE_DELAY, routinePool.submit, self._save)
+
+    def _save(self) -> None:
+        with self._lock:
+            if self.saveTask is not None:
+                self.saveTask.cancel()
+                self.saveTask = None
+        try:
+            configManager.bridgeConfig.save_config(backup=False, resource="behavior_instance")
+        except Exception as e:
+            logging.warning(f"Could not save routine progress: {e}")
+
+routineRunner = RoutineRunner()
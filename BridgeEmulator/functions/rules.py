@@ -1,5 +1,6 @@
 import logManager
 import configManager
+from HueObjects import bumpStateVersion
 
 from datetime import datetime, time
 from threading import Thread
@@ -151,6 +152,7 @@ def rulesProcessor(device: Any, current_time: datetime) -> None:
         current_time (datetime): The current time.
     """
     logging.debug(f"Processing rules for {device.name}")
+    bumpStateVersion()
     bridgeConfig["config"]["localtime"] = current_time.strftime("%Y-%m-%dT%H:%M:%S") #required for operator dx to address /config/localtime
     actionsToExecute = []
     for key, rule in bridgeConfig["rules"].items():
@@ -1,8 +1,9 @@
 import logManager
 import configManager
-from time import sleep
 from random import randrange
-from typing import Union, Dict, Any, List, Callable
+from typing import Union, Dict, Any, List, Callable, Optional
+from functions.routines import routineRunner
+from HueObjects import derivedV2Id
 
 logging = logManager.logger.get_logger(__name__)
 bridgeConfig = configManager.bridgeConfig.yaml_config
@@ -18,9 +19,9 @@ def findScene(element: Dict[str, Any]) -> Union[Dict[str, Any], bool]:
         Union[Dict[str, Any], bool]: The found scene or False if not found.
     """
     for scene, obj in bridgeConfig["scenes"].items():
-        if element["group"]["rtype"] == "room" and obj.id_v2 == element["recall"]["rid"] and obj.group().getV2Room()["id"] == element["group"]["rid"]:
+        if element["group"]["rtype"] == "room" and obj.id_v2 == element["recall"]["rid"] and derivedV2Id(obj.group(), 'room') == element["group"]["rid"]:
             return obj
-        elif element["group"]["rtype"] == "zone" and obj.id_v2 == element["recall"]["rid"] and obj.group().getV2Zone()["id"] == element["group"]["rid"]:
+        elif element["group"]["rtype"] == "zone" and obj.id_v2 == element["recall"]["rid"] and derivedV2Id(obj.group(), 'zone') == element["group"]["rid"]:
             return obj
     return False
 
@@ -35,139 +36,182 @@ def findGroup(id_v2: str) -> Union[Dict[str, Any], bool]:
         Union[Dict[str, Any], bool]: The found group or False if not found.
     """
     for group, obj in bridgeConfig["groups"].items():
-        if obj.type != "Entertainment" and (obj.getV2Room()["id"] == id_v2 or obj.getV2Zone()["id"] == id_v2):
+        if obj.type != "Entertainment" and (derivedV2Id(obj, 'room') == id_v2 or derivedV2Id(obj, 'zone') == id_v2):
             return obj
     return False
 
-def handleWakeUp(behavior_instance: Dict[str, Any]) -> None:
+def groupAction(behavior_instance: Any, args: Dict[str, Any], elapsed: float) -> Optional[bool]:
     """
-    Handle the Wake Up routine.
+    Routine step executor applying a v1 action to a room or zone.
 
     Args:
-        behavior_instance (Dict[str, Any]): The behavior instance to handle.
+        behavior_instance (Any): The behavior instance running the routine.
+        args (Dict[str, Any]): The step arguments, rid of the group, the v1 state and if_on.
+        elapsed (float): How late the step runs in seconds.
+
+    Returns:
+        Optional[bool]: False when the lights were switched off during the routine.
+    """
+    group = findGroup(args["rid"])
+    if not group:
+        logging.info("Routine " + behavior_instance.name + " target " + args["rid"] + " not found")
+        return False
+    if args.get("if_on") and not group.state["any_on"]:
+        return False
+    state = dict(args["state"])
+    if "transitiontime" in state:
+        state["transitiontime"] = max(state["transitiontime"] - int(elapsed * 10), 0)
+    group.setV1Action(state=state)
+    return None
+
+def sceneRecall(behavior_instance: Any, args: Dict[str, Any], elapsed: float) -> None:
+    """
+    Routine step executor recalling or deactivating a scene.
+
+    Args:
+        behavior_instance (Any): The behavior instance running the routine.
+        args (Dict[str, Any]): The step arguments, the configuration element and the activate payload.
+        elapsed (float): How late the step runs in seconds.
+    """
+    scene = findScene(args["element"])
+    if not scene:
+        return
+    data = dict(args["data"])
+    transition = data.pop("seconds", 0) + data.pop("minutes", 0) * 60
+    if transition > 0:
+        data["seconds"] = max(int(transition - elapsed), 0)
+    logging.info(("Deactivate" if data["recall"]["action"] == "deactivate" else "Activate") + " scene " + scene.name)
+    scene.activate(data)
+
+routineRunner.register("group_action", groupAction)
+routineRunner.register("scene_recall", sceneRecall)
+
+def handleWakeUp(behavior_instance: Any) -> List[Dict[str, Any]]:
     """
+    Plan the Wake Up routine.
+
+    Args:
+        behavior_instance (Any): The behavior instance to handle.
+
+    Returns:
+        List[Dict[str, Any]]: The routine steps.
+    """
+    plan: List[Dict[str, Any]] = []
+    groups = [element["group"]["rid"] for element in behavior_instance.configuration["where"] if "group" in element]
     if behavior_instance.active and "turn_lights_off_after" in behavior_instance.configuration:
         logging.debug("End Wake Up routine")
-        for element in behavior_instance.configuration["where"]:
-            if "group" in element:
-                group = findGroup(element["group"]["rid"])
-                sleep(1)
-                group.setV1Action(state={"on": False})
-                behavior_instance.active = False
-                logging.debug("End Wake Up")
+        for rid in groups:
+            plan.append({"at": 1, "call": "group_action", "args": {"rid": rid, "state": {"on": False}}})
+        plan.append({"at": 1, "call": "update_instance", "args": {"active": False}})
     else:
         logging.debug("Start Wake Up routine")
-        for element in behavior_instance.configuration["where"]:
-            if "group" in element:
-                group = findGroup(element["group"]["rid"])
-                group.setV1Action(state={"ct": 250, "bri": 1})
-                sleep(1)
-                group.setV1Action(state={"on": True})
-                group.setV1Action(state={"bri": 254, "transitiontime": behavior_instance.configuration["fade_in_duration"]["seconds"] * 10})
-                behavior_instance.active = "turn_lights_off_after" in behavior_instance.configuration
-                logging.debug("Finish Wake Up")
+        fade = behavior_instance.configuration["fade_in_duration"]["seconds"]
+        for rid in groups:
+            plan.append({"at": 0, "call": "group_action", "args": {"rid": rid, "state": {"ct": 250, "bri": 1}}})
+            plan.append({"at": 1, "call": "group_action", "args": {"rid": rid, "state": {"on": True}}})
+            plan.append({"at": 1, "call": "group_action", "args": {"rid": rid, "state": {"bri": 254, "transitiontime": fade * 10}, "if_on": True}, "duration": fade})
+        plan.append({"at": 1, "call": "update_instance", "args": {"active": "turn_lights_off_after" in behavior_instance.configuration}})
+    return plan
 
-def handleGoToSleep(behavior_instance: Dict[str, Any]) -> None:
+def handleGoToSleep(behavior_instance: Any) -> List[Dict[str, Any]]:
     """
-    Handle the Go to Sleep routine.
+    Plan the Go to Sleep routine.
 
     Args:
-        behavior_instance (Dict[str, Any]): The behavior instance to handle.
+        behavior_instance (Any): The behavior instance to handle.
+
+    Returns:
+        List[Dict[str, Any]]: The routine steps.
     """
     logging.debug("Start Go to Sleep " + behavior_instance.name)
+    plan: List[Dict[str, Any]] = []
+    fade = behavior_instance.configuration["fade_out_duration"]["seconds"]
     for element in behavior_instance.configuration["where"]:
         if "group" in element:
-            group = findGroup(element["group"]["rid"])
-            group.setV1Action(state={"ct": 500})
-            sleep(1)
-            group.setV1Action(state={"bri": 1, "transitiontime": behavior_instance.configuration["fade_out_duration"]["seconds"] * 10})
-            sleep(behavior_instance.configuration["fade_out_duration"]["seconds"])
+            rid = element["group"]["rid"]
+            plan.append({"at": 0, "call": "group_action", "args": {"rid": rid, "state": {"ct": 500}}})
+            plan.append({"at": 1, "call": "group_action", "args": {"rid": rid, "state": {"bri": 1, "transitiontime": fade * 10}, "if_on": True}, "duration": fade})
             if behavior_instance.configuration["end_state"] == "turn_off":
-                group.setV1Action(state={"on": False})
-            behavior_instance.active = False
-            logging.debug("Finish Go to Sleep")
+                plan.append({"at": 1 + fade, "call": "group_action", "args": {"rid": rid, "state": {"on": False}}})
+    plan.append({"at": 1 + fade, "call": "update_instance", "args": {"active": False}})
+    return plan
 
-def handleActivateScene(behavior_instance: Dict[str, Any]) -> None:
+def handleActivateScene(behavior_instance: Any) -> List[Dict[str, Any]]:
     """
-    Handle the Activate Scene routine.
+    Plan the Activate Scene routine.
 
     Args:
-        behavior_instance (Dict[str, Any]): The behavior instance to handle.
+        behavior_instance (Any): The behavior instance to handle.
+
+    Returns:
+        List[Dict[str, Any]]: The routine steps.
     """
-    if behavior_instance.active and "end_at" in behavior_instance.configuration["when_extended"]:
+    plan: List[Dict[str, Any]] = []
+    when_extended = behavior_instance.configuration.get("when_extended", {})
+    if behavior_instance.active and "end_at" in when_extended:
         logging.debug("End routine " + behavior_instance.name)
         for element in behavior_instance.configuration["what"]:
             if "group" in element:
-                scene = findScene(element)
-                if scene:
-                    logging.info("Deactivate scene " + scene.name)
-                    putDict = {"recall": {"action": "deactivate"}}
-                    scene.activate(putDict)
-                group = findGroup(element["group"]["rid"])
-                logging.info("Turn off group " + group.name)
-                group.setV1Action({"on": False})
-                behavior_instance.active = False
+                plan.append({"at": 0, "call": "scene_recall", "args": {"element": element, "data": {"recall": {"action": "deactivate"}}}})
+                plan.append({"at": 0, "call": "group_action", "args": {"rid": element["group"]["rid"], "state": {"on": False}}})
+        plan.append({"at": 0, "call": "update_instance", "args": {"active": False}})
     else:
         logging.debug("Start routine " + behavior_instance.name)
+        transition = when_extended.get("start_at", {}).get("transition")
+        minutes = transition.get("minutes", 3) if transition else 0
         for element in behavior_instance.configuration["what"]:
             if "group" in element:
-                scene = findScene(element)
-                if scene:
-                    logging.info("Activate scene " + scene.name)
-                    if "when_extended" in behavior_instance.configuration and "transition" in behavior_instance.configuration["when_extended"]["start_at"]:
-                        putDict = {"recall": {"action": "active"}, "minutes": behavior_instance.configuration["when_extended"]["start_at"]["transition"].get("minutes", 3)}
-                        scene.activate(putDict)
-                else:
-                    group = findGroup(element["group"]["rid"])
-                    if element["recall"]["rid"] == "732ff1d9-76a7-4630-aad0-c8acc499bb0b":  # Bright scene
-                        logging.info("Apply Bright scene to group " + group.name)
-                        group.setV1Action(state={"ct": 247, "bri": 1})
-                        sleep(1)
-                        group.setV1Action(state={"on": True})
-                        if "when_extended" in behavior_instance.configuration and "transition" in behavior_instance.configuration["when_extended"]["start_at"]:
-                            transition_minutes = behavior_instance.configuration["when_extended"]["start_at"]["transition"].get("minutes", 3)
-                            group.setV1Action(state={"bri": 254, "transitiontime": transition_minutes * 60 * 10})
-                behavior_instance.active = "end_at" in behavior_instance.configuration["when_extended"]
+                if findScene(element):
+                    if transition:
+                        plan.append({"at": 0, "call": "scene_recall", "args": {"element": element, "data": {"recall": {"action": "active"}, "minutes": minutes}}, "duration": minutes * 60})
+                elif element["recall"]["rid"] == "732ff1d9-76a7-4630-aad0-c8acc499bb0b":  # Bright scene
+                    rid = element["group"]["rid"]
+                    plan.append({"at": 0, "call": "group_action", "args": {"rid": rid, "state": {"ct": 247, "bri": 1}}})
+                    plan.append({"at": 1, "call": "group_action", "args": {"rid": rid, "state": {"on": True}}})
+                    if transition:
+                        plan.append({"at": 1, "call": "group_action", "args": {"rid": rid, "state": {"bri": 254, "transitiontime": minutes * 60 * 10}, "if_on": True}, "duration": minutes * 60})
+        plan.append({"at": 1, "call": "update_instance", "args": {"active": "end_at" in when_extended}})
+    return plan
 
-def handleCountdownTimer(behavior_instance: Dict[str, Any]) -> None:
+def handleCountdownTimer(behavior_instance: Any) -> List[Dict[str, Any]]:
     """
-    Handle the Countdown Timer routine.
+    Plan the Countdown Timer routine.
 
     Args:
-        behavior_instance (Dict[str, Any]): The behavior instance to handle.
+        behavior_instance (Any): The behavior instance to handle.
+
+    Returns:
+        List[Dict[str, Any]]: The routine steps.
     """
     logging.debug("Start Countdown Timer " + behavior_instance.name)
     secondsToCount = sum(
         behavior_instance.configuration["duration"].get(unit, 0) * factor
         for unit, factor in [("minutes", 60), ("seconds", 1)]
     )
-    sleep(secondsToCount)
+    plan: List[Dict[str, Any]] = []
     for element in behavior_instance.configuration["what"]:
         if "group" in element:
-            scene = findScene(element)
-            group = findGroup(element["group"]["rid"])
-            if scene:
-                logging.info("Activate scene " + scene.name + " to group " + group.name)
-                putDict = {"recall": {"action": "active"}}
-                scene.activate(putDict)
+            if findScene(element):
+                plan.append({"at": secondsToCount, "call": "scene_recall", "args": {"element": element, "data": {"recall": {"action": "active"}}}})
             else:
-                logging.info("Apply Bright scene to group " + group.name)
-                group.setV1Action(state={"on": True, "bri": 254, "ct": 247 if element["recall"]["rid"] == "732ff1d9-76a7-4630-aad0-c8acc499bb0b" else 370})
-    behavior_instance.active = False
-    behavior_instance.update_attr({"enabled": False})
-    logging.debug("Finish Countdown Timer " + behavior_instance.name)
+                state = {"on": True, "bri": 254, "ct": 247 if element["recall"]["rid"] == "732ff1d9-76a7-4630-aad0-c8acc499bb0b" else 370}
+                plan.append({"at": secondsToCount, "call": "group_action", "args": {"rid": element["group"]["rid"], "state": state}})
+    plan.append({"at": secondsToCount, "call": "update_instance", "args": {"active": False, "enabled": False}})
+    return plan
 
-def triggerScript(behavior_instance: Dict[str, Any]) -> None:
+def triggerScript(behavior_instance: Any) -> None:
     """
-    Trigger the appropriate script based on the behavior instance.
+    Trigger the appropriate script based on the behavior instance. The script runs as a routine
+    on the shared scheduler, so it can be cancelled and is resumed after a restart.
 
     Args:
-        behavior_instance (Dict[str, Any]): The behavior instance to handle.
+        behavior_instance (Any): The behavior instance to handle.
     """
+    delay = 0
     if "when_extended" in behavior_instance.configuration and "randomization" in behavior_instance.configuration["when_extended"]:
-        sleep(randrange(behavior_instance.configuration["when_extended"]["randomization"]["minutes"] * 60))
+        delay = randrange(behavior_instance.configuration["when_extended"]["randomization"]["minutes"] * 60)
 
-    script_handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+    script_handlers: Dict[str, Callable[[Any], List[Dict[str, Any]]]] = {
         "ff8957e3-2eb9-4699-a0c8-ad2cb3ede704": handleWakeUp,
         "7e571ac6-f363-42e1-809a-4cbf6523ed72": handleGoToSleep,
         "7238c707-8693-4f19-9095-ccdc1444d228": handleActivateScene,
@@ -176,7 +220,7 @@ def triggerScript(behavior_instance: Dict[str, Any]) -> None:
 
     script_id = behavior_instance.script_id
     if script_id in script_handlers:
-        script_handlers[script_id](behavior_instance)
+        routineRunner.start(behavior_instance, script_handlers[script_id](behavior_instance), delay)
 
 def behaviorScripts() -> List[Dict[str, Any]]:
     """
@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import logManager
+from threading import Condition, Thread
+from time import monotonic
+from typing import Any, Callable, List, Optional, Tuple
+
+logging = logManager.logger.get_logger(__name__)
+
+class Task:
+    def __init__(self, due: float, func: Callable[..., Any], args: Tuple[Any, ...]) -> None:
+        self.due = due
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Cancel the task. A cancelled task is dropped when it becomes due.
+        """
+        self.cancelled = True
+
+class TaskScheduler:
+    """
+    Run delayed callables on a single worker thread instead of one sleeping thread per job.
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._queue: List[Tuple[float, int, Task]] = []
+        self._counter = itertools.count()
+        self._condition = Condition()
+        self._thread: Optional[Thread] = None
+
+    def schedule(self, delay: float, func: Callable[..., Any], *args: Any) -> Task:
+        """
+        Schedule a callable to run after a delay.
+
+        Args:
+            delay (float): The delay in seconds, negative values run as soon as possible.
+            func (Callable[..., Any]): The callable to run.
+            *args (Any): The arguments passed to the callable.
+
+        Returns:
+            Task: The task handle, used to cancel it.
+        """
+        task = Task(monotonic() + max(delay, 0), func, args)
+        with self._condition:
+            heapq.heappush(self._queue, (task.due, next(self._counter), task))
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return task
+
+    def pending(self) -> int:
+        """
+        Return the number of tasks waiting to run.
+
+        Returns:
+            int: The number of pending tasks, cancelled ones included.
+        """
+        with self._condition:
+            return len(self._queue)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > monotonic():
+                    timeout = self._queue[0][0] - monotonic() if self._queue else None
+                    self._condition.wait(timeout)
+                task = heapq.heappop(self._queue)[2]
+            if task.cancelled:
+                continue
+            try:
+                task.func(*task.args)
+            except Exception as e:
+                logging.exception(f"{self.name} task {getattr(task.func, '__name__', task.func)} failed: {e}")
+
+taskScheduler = TaskScheduler("taskScheduler")
@@ -1,19 +1,29 @@
 import logManager
 import configManager
+import asyncio
 import socket
 import json
 import uuid
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Union, Generator
+from concurrent.futures import ThreadPoolExecutor, wait
+from queue import Queue
+from threading import Event, Lock
+from typing import Callable, Dict, Iterable, List, Tuple, Union, Generator
+from functions import asyncLoop
+from functions.request import probe, probePool
 from lights.protocols import tpkasa, wled, mqtt, hyperion, yeelight, hue, deconz, native_multi, tasmota, shelly, esphome, tradfri, elgato, govee
 from services import homeAssistantWS
-from HueObjects import Light, StreamEvent
+from HueObjects import Light, StreamEvent, invalidateDeviceIndex
 from functions.core import nextFreeId
 from lights.light_types import lightTypes
 
 logging = logManager.logger.get_logger(__name__)
 bridgeConfig = configManager.bridgeConfig.yaml_config
 
+SCAN_TIMEOUT = 0.5  # seconds to wait for a TCP connect, probes run in parallel so a slow host costs little
+
+scanLock = Lock()  # the discoveries run in parallel, their lights are added one at a time
+
 def pretty_json(data: Union[Dict, List]) -> str:
     """
     Convert a dictionary or list to a pretty-printed JSON string.
@@ -26,7 +36,7 @@ def pretty_json(data: Union[Dict, List]) -> str:
     """
     return json.dumps(data, sort_keys=True, indent=4, separators=(',', ': '))
 
-def scanHost(host: str, port: int) -> int:
+async def scanHost(host: str, port: int) -> bool:
     """
     Scan a host to check if a port is open.
 
@@ -35,18 +45,22 @@ def scanHost(host: str, port: int) -> int:
         port (int): The port to check.
 
     Returns:
-        int: The result of the connection attempt (0 if successful).
+        bool: True if the port accepted the connection.
     """
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        sock.settimeout(0.02)
-        return sock.connect_ex((host, port))
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (host, port)), SCAN_TIMEOUT)
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
 
-def iter_ips(port: int) -> Generator[Tuple[str, int], None, None]:
+def iter_ips(ports: List[int]) -> Generator[Tuple[str, int], None, None]:
     """
-    Generate IP addresses within the configured range.
+    Generate IP addresses within the configured range, with every port to check on them.
 
     Args:
-        port (int): The port to check.
+        ports (List[int]): The ports to check.
 
     Yields:
         Generator[Tuple[str, int], None, None]: A tuple of host and port.
@@ -60,26 +74,52 @@ def iter_ips(port: int) -> Generator[Tuple[str, int], None, None]:
     sub_ip_range_end = rangeConfig["SUB_IP_RANGE_END"]
     host = HOST_IP.split('.')
     if scan_on_host_ip:
-        yield ('127.0.0.1', port)
+        for port in ports:
+            yield ('127.0.0.1', port)
     for sub_addr in range(sub_ip_range_start, sub_ip_range_end + 1):
         host[2] = str(sub_addr)
         for addr in range(ip_range_start, ip_range_end + 1):
             host[3] = str(addr)
             test_host = '.'.join(host)
             if test_host != HOST_IP:
-                yield (test_host, port)
+                for port in ports:
+                    yield (test_host, port)
 
-def find_hosts(port: int) -> List[str]:
+async def scan(targets: Generator[Tuple[str, int], None, None], found: Queue, parallelism: int) -> None:
     """
-    Find hosts with the specified port open.
+    Probe the targets with a fixed number of concurrent connects, putting the open ones in found as they answer.
 
     Args:
-        port (int): The port to check.
+        targets (Generator[Tuple[str, int], None, None]): The hosts and ports, shared by the probing tasks.
+        found (Queue): Receives the open (host, port) tuples, then None when the scan is over.
+        parallelism (int): The maximum number of connects in flight.
+    """
+    async def probe():
+        for host, port in targets:
+            if await scanHost(host, port):
+                found.put((host, port))
+    try:
+        await asyncio.gather(*[probe() for _ in range(max(1, parallelism))])
+    finally:
+        found.put(None)
 
-    Returns:
-        List[str]: A list of hosts with the port open.
+def scan_hosts(ports: List[int]) -> Generator[Tuple[str, int], None, None]:
     """
-    return [f'{host}:{port}' for host, port in iter_ips(port) if scanHost(host, port) == 0]
+    Scan the configured range for open ports, all ports in one pass, yielding results while the scan runs.
+
+    Args:
+        ports (List[int]): The ports to check.
+
+    Yields:
+        Generator[Tuple[str, int], None, None]: A tuple of host and open port.
+    """
+    found: Queue = Queue()
+    asyncio.run_coroutine_threadsafe(scan(iter_ips(ports), found, bridgeConfig["config"]["scanparallelism"]), asyncLoop.getLoop())
+    while True:
+        result = found.get()
+        if result is None:
+            return
+        yield result
 
 def addNewLight(modelid: str, name: str, protocol: str, protocol_cfg: Dict) -> Union[int, bool]:
     """
@@ -106,6 +146,7 @@ def addNewLight(modelid: str, name: str, protocol: str, protocol_cfg: Dict) -> U
         })
         newObject = Light.Light(light)
         bridgeConfig["lights"][newLightID] = newObject
+        invalidateDeviceIndex()
         bridgeConfig["groups"]["0"].add_light(newObject)
         rooms = [obj.id_v2 for obj in bridgeConfig["groups"].values()]
         lights = [obj.id_v2 for obj in bridgeConfig["lights"].values()]
@@ -212,62 +253,115 @@ def is_light_matching(lightObj: Light.Light, light: Dict) -> bool:
                 lightObj.protocol_cfg.get("segmentedID", -1) == light["protocol_cfg"].get("segmentedID", -1))
     return False
 
-def get_device_ips() -> List[str]:
+def get_scan_ports() -> List[int]:
     """
-    Get the IP addresses of devices to scan.
+    Get the ports to scan for devices.
 
     Returns:
-        List[str]: A list of device IP addresses.
+        List[int]: The configured ports, port 80 when none are configured.
     """
     if bridgeConfig["config"]["port"]["enabled"]:
-        return [host for ports in bridgeConfig["config"]["port"]["ports"] for host in find_hosts(ports)]
-    return find_hosts(80)
+        return list(bridgeConfig["config"]["port"]["ports"])
+    return [80]
 
-def discover_lights(detectedLights: List[Dict], device_ips: List[str]) -> None:
+def add_detected_lights(lights: List[Dict]) -> None:
     """
-    Discover lights on the network.
+    Add the new lights to the bridge and to the scan result, update the address of the known ones.
 
     Args:
-        detectedLights (List[Dict]): A list to store detected lights.
-        device_ips (List[str]): A list of device IP addresses to scan.
+        lights (List[Dict]): The lights found by a discovery.
+    """
+    with scanLock:
+        for light in lights:
+            lightIsNew = True
+            for lightObj in list(bridgeConfig["lights"].values()):
+                if lightObj.protocol == light["protocol"] and is_light_matching(lightObj, light):
+                    update_light_ip(lightObj, light)
+                    lightIsNew = False
+                    break
+            if lightIsNew:
+                logging.info(f"Add new light {light['name']}")
+                lightId = addNewLight(light["modelid"], light["name"], light["protocol"], light["protocol_cfg"])
+                bridgeConfig["temp"]["scanResult"][lightId] = {"name": light["name"]}
+
+def discover_lights(addLights: Callable[[List[Dict]], None], hosts: Iterable[Tuple[str, int]], ports: List[int]) -> None:
     """
-    if bridgeConfig["config"]["mqtt"]["enabled"]:
-        # brioadcast MQTT message, lights will be added by the service
-        mqtt.discover(bridgeConfig["config"]["mqtt"])
-    if bridgeConfig["config"]["deconz"]["enabled"]:
-        deconz.discover(detectedLights, bridgeConfig["config"]["deconz"])
-    if bridgeConfig["config"]["homeassistant"]["enabled"]:
-        homeAssistantWS.discover(detectedLights)
-    if bridgeConfig["config"]["yeelight"]["enabled"]:
-        yeelight.discover(detectedLights)
+    Discover lights on the network, running the protocol discoveries in parallel.
+
+    The hosts are probed by the IP based protocols while the scan is still finding them, and the lights are
+    handed to addLights as soon as a discovery or a probe returns them.
+
+    Args:
+        addLights (Callable[[List[Dict]], None]): Receives the lights found.
+        hosts (Iterable[Tuple[str, int]]): The hosts with an open port, as they are scanned.
+        ports (List[int]): The device ports, port 9123 is probed for Elgato lights.
+    """
+    def run(discover: Callable, *args) -> None:
+        lights: List[Dict] = []
+        try:
+            discover(lights, *args)
+        finally:
+            addLights(lights)
+
+    def probeAndAdd(probeIp: Callable[[str], List[Dict]], ip: str) -> None:
+        addLights(probe(probeIp, ip))
+
+    config = bridgeConfig["config"]
+    probes = []
     # native_multi probe all esp8266 lights with firmware from diyhue repo
-    if bridgeConfig["config"]["native_multi"]["enabled"]:
-        native_multi.discover(detectedLights, device_ips)
-    if bridgeConfig["config"]["tasmota"]["enabled"]:
-        tasmota.discover(detectedLights, device_ips)
-    if bridgeConfig["config"]["wled"]["enabled"]:
-        # Most of the other discoveries are disabled by having no IP address (--disable-network-scan)
-        # But wled does an mdns discovery as well.
-        wled.discover(detectedLights, device_ips)
-    if bridgeConfig["config"]["hue"]:
-        hue.discover(detectedLights, bridgeConfig["config"]["hue"])
-    if bridgeConfig["config"]["shelly"]["enabled"]:
-        shelly.discover(detectedLights, device_ips)
-    if bridgeConfig["config"]["esphome"]["enabled"]:
-        esphome.discover(detectedLights, device_ips)
-    if bridgeConfig["config"]["tradfri"]:
-        tradfri.discover(detectedLights, bridgeConfig["config"]["tradfri"])
-    if bridgeConfig["config"]["hyperion"]["enabled"]:
-        hyperion.discover(detectedLights)
-    if bridgeConfig["config"]["tpkasa"]["enabled"]:
-        tpkasa.discover(detectedLights)
-    if bridgeConfig["config"]["elgato"]["enabled"]:
-        # Scan with port 9123 before mDNS discovery
-        elgato_ips = find_hosts(9123)
-        logging.info(pretty_json(elgato_ips))
-        elgato.discover(detectedLights, elgato_ips)
-    if bridgeConfig["config"]["govee"]["enabled"]:
-        govee.discover(detectedLights)
+    if config["native_multi"]["enabled"]:
+        probes.append(native_multi.probe)
+    if config["tasmota"]["enabled"]:
+        probes.append(tasmota.probe)
+    if config["shelly"]["enabled"]:
+        probes.append(shelly.probe)
+    if config["esphome"]["enabled"]:
+        probes.append(esphome.probe)
+    device_ips, elgato_ips, jobs = [], [], []
+    scanned = Event()  # the mDNS discoveries browse during the scan and fall back to the scanned IPs
+    with ThreadPoolExecutor(max_workers=16, thread_name_prefix="discovery") as pool:
+        if config["wled"]["enabled"]:
+            # Most of the other discoveries are disabled by having no IP address (--disable-network-scan)
+            # But wled does an mdns discovery as well.
+            jobs.append(pool.submit(run, wled.discover, device_ips, scanned))
+        if config["elgato"]["enabled"]:
+            jobs.append(pool.submit(run, elgato.discover, elgato_ips, scanned))
+        if config["mqtt"]["enabled"]:
+            # brioadcast MQTT message, lights will be added by the service
+            jobs.append(pool.submit(mqtt.discover, config["mqtt"]))
+        if config["deconz"]["enabled"]:
+            jobs.append(pool.submit(run, deconz.discover, config["deconz"]))
+        if config["homeassistant"]["enabled"]:
+            jobs.append(pool.submit(run, homeAssistantWS.discover))
+        if config["yeelight"]["enabled"]:
+            jobs.append(pool.submit(run, yeelight.discover))
+        if config["hue"]:
+            jobs.append(pool.submit(run, hue.discover, config["hue"]))
+        if config["tradfri"]:
+            jobs.append(pool.submit(run, tradfri.discover, config["tradfri"]))
+        if config["hyperion"]["enabled"]:
+            jobs.append(pool.submit(run, hyperion.discover))
+        if config["tpkasa"]["enabled"]:
+            jobs.append(pool.submit(run, tpkasa.discover))
+        if config["govee"]["enabled"]:
+            jobs.append(pool.submit(run, govee.discover))
+        try:
+            for host, port in hosts:
+                if port in ports:
+                    ip = f'{host}:{port}'
+                    device_ips.append(ip)
+                    jobs.extend(probePool.submit(probeAndAdd, probeIp, ip) for probeIp in probes)
+                if port == 9123:
+                    elgato_ips.append(host)
+        finally:
+            scanned.set()
+        logging.info(f"Scanning for lights on\n{pretty_json(device_ips)}")
+        if config["elgato"]["enabled"]:
+            logging.info(pretty_json(elgato_ips))
+        wait(jobs)
+    for job in jobs:
+        if job.exception() is not None:
+            logging.error(f"discovery failed: {job.exception()!r}")
 
 def scanForLights() -> Dict:  # scan for ESP8266 lights and strips
     """
@@ -280,22 +374,11 @@ def scanForLights() -> Dict:  # scan for ESP8266 lights and strips
     bridgeConfig["temp"]["scanResult"] = {"lastscan": "active"}
     bridgeConfig["config"]["zigbee_device_discovery_info"]["status"] = "active"
     discoveryEvent()
-    detectedLights = []
-    device_ips = get_device_ips()
-    logging.info(f"Scanning for lights on\n{pretty_json(device_ips)}")
-    discover_lights(detectedLights, device_ips)
+    # one pass over the range for the device ports and the Elgato port
+    ports = get_scan_ports()
+    scanPorts = ports + [9123] if bridgeConfig["config"]["elgato"]["enabled"] and 9123 not in ports else ports
+    discover_lights(add_detected_lights, scan_hosts(scanPorts), ports)
     bridgeConfig["temp"]["scanResult"]["lastscan"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-    for light in detectedLights:
-        lightIsNew = True
-        for lightObj in bridgeConfig["lights"].values():
-            if lightObj.protocol == light["protocol"] and is_light_matching(lightObj, light):
-                update_light_ip(lightObj, light)
-                lightIsNew = False
-                break
-        if lightIsNew:
-            logging.info(f"Add new light {light['name']}")
-            lightId = addNewLight(light["modelid"], light["name"], light["protocol"], light["protocol_cfg"])
-            bridgeConfig["temp"]["scanResult"][lightId] = {"name": light["name"]}
     bridgeConfig["config"]["zigbee_device_discovery_info"]["status"] = "ready"
     discoveryEvent()
     return bridgeConfig["temp"]["scanResult"]
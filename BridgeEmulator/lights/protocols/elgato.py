@@ -1,6 +1,7 @@
 import socket
 import json
 import requests
+from functions.request import probeAll, probePool, session
 import logManager
 from time import sleep
 from zeroconf import IPVersion, ServiceBrowser, ServiceStateChange, Zeroconf
@@ -20,51 +21,68 @@ def on_mdns_discover(zeroconf, service_type, name, state_change):
             discovered_lights.append([addresses[0], name])
             logging.debug('<Elgato> mDNS device discovered: ' + addresses[0])
 
-def discover(detectedLights, elgato_ips):
+def accessory_light(ip, mdns_name):
+    """
+    Read the accessory info of a light, returns it as a list with the one light, empty when it did not answer.
+    """
+    try:
+        response = session.get(f"http://{ip}:9123/elgato/accessory-info", timeout=3)
+        if response.status_code == 200:
+            json_accessory_info = response.json()
+            logging.info("<Elgato> Found device: %s at IP %s" % (mdns_name, ip))
+            return [{
+                "protocol": "elgato",
+                "name": json_accessory_info["displayName"],
+                "modelid": "LTW001",  # Colortemp Bulb
+                "protocol_cfg": {
+                    "ip": ip,
+                    "mdns_name": mdns_name,
+                    "mac": json_accessory_info["macAddress"],
+                }
+            }]
+    except requests.RequestException as e:
+        logging.warning("<Elgato> EXCEPTION: " + str(e))
+    return []
+
+def probe(ip):
+    """
+    Probe one address with port 9123 open for a Key Light.
+    """
+    try:
+        response = session.get(f"http://{ip}:9123/elgato/accessory-info", timeout=3)
+        if response.status_code == 200:
+            json_resp = response.json()
+            if json_resp['productName'] in ["Elgato Key Light Mini", "Elgato Key Light Air", "Elgato Key Light"]:
+                return accessory_light(ip, json_resp['displayName'])
+    except requests.RequestException:
+        logging.warning("<Elgato> ip %s is unknown device", ip)
+    return []
+
+def discover(detectedLights, elgato_ips, scanned=None):
     """
     Discover Elgato lights using mDNS and fallback to IP addresses if necessary.
+
+    elgato_ips may still be filled by a running network scan, which sets scanned once it is done.
     """
     mdns_string = "_elgo._tcp.local."
     logging.info('<Elgato> mDNS discovery for ' + mdns_string + ' started')
+    discovered_lights.clear()
     zeroconf = Zeroconf(ip_version=IPVersion.V4Only)
-    ServiceBrowser(zeroconf, mdns_string, handlers=[on_mdns_discover])
+    browser = ServiceBrowser(zeroconf, mdns_string, handlers=[on_mdns_discover])
 
     sleep(2)
+    browser.cancel()
+    zeroconf.close()
 
     if not discovered_lights:
         logging.info("<Elgato> Nothing found using mDNS, trying to find lights by IP")
-        for ip in elgato_ips:
-            try:
-                response = requests.get(f"http://{ip}:9123/elgato/accessory-info", timeout=3)
-                if response.status_code == 200:
-                    json_resp = response.json()
-                    if json_resp['productName'] in ["Elgato Key Light Mini", "Elgato Key Light Air", "Elgato Key Light"]:
-                        discovered_lights.append([ip, json_resp['displayName']])
-            except requests.RequestException:
-                logging.warning("<Elgato> ip %s is unknown device", ip)
-
-    lights = []
-    for device in discovered_lights:
-        try:
-            response = requests.get(f"http://{device[0]}:9123/elgato/accessory-info", timeout=3)
-            if response.status_code == 200:
-                json_accessory_info = response.json()
-                logging.info("<Elgato> Found device: %s at IP %s" % (device[1], device[0]))
-                lights.append({
-                    "protocol": "elgato",
-                    "name": json_accessory_info["displayName"],
-                    "modelid": "LTW001",  # Colortemp Bulb
-                    "protocol_cfg": {
-                        "ip": device[0],
-                        "mdns_name": device[1],
-                        "mac": json_accessory_info["macAddress"],
-                    }
-                })
-        except requests.RequestException as e:
-            logging.warning("<Elgato> EXCEPTION: " + str(e))
-            break
-
-    detectedLights.extend(lights)
+        if scanned is not None:
+            scanned.wait()
+        detectedLights.extend(probeAll(probe, elgato_ips))
+        return
+
+    for lights in probePool.map(lambda device: accessory_light(*device), list(discovered_lights)):
+        detectedLights.extend(lights)
 
 def translate_range(value, old_min, old_max, new_min, new_max):
     """
@@ -1,5 +1,6 @@
 import json
 import requests
+from functions.request import probeAll, session
 import logManager
 from functions.colors import convert_rgb_xy, convert_xy, hsv_to_rgb, rgbBrightness
 from typing import List, Dict, Any
@@ -81,6 +82,32 @@ def is_json(content: str) -> bool:
         return False
     return True
 
+def probe(ip: str) -> List[Dict[str, Any]]:
+    """
+    Probe one address for an ESPHome device running the diyHue light configuration.
+
+    Args:
+        ip: The device address.
+
+    Returns:
+        The light of the device, empty when it is not such a device.
+    """
+    try:
+        logging.debug(f"ESPHome: probing ip {ip}")
+        response = session.get(f"http://{ip}/text_sensor/light_id", timeout=3)
+        response.raise_for_status()
+        if response.content and is_json(response.content):
+            device = response.json()['state'].split(';')
+            if device[0] != "esphome_diyhue_light":
+                raise ValueError("Invalid device type")
+            mac, device_name, ct_boost, rgb_boost = device[1:5]
+            logging.debug(f"ESPHome: Found {device_name} at ip {ip}")
+            properties, modelid = get_device_properties(ip, device_name, mac, ct_boost, rgb_boost)
+            return [{"protocol": "esphome", "name": device_name, "modelid": modelid, "protocol_cfg": properties}]
+    except requests.RequestException as e:
+        logging.info(f"ip {ip} is unknown device: {e}")
+    return []
+
 def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> None:
     """
     Discover ESPHome devices on the network.
@@ -90,21 +117,7 @@ def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> Non
         device_ips: The list of device IP addresses to probe.
     """
     logging.debug("ESPHome: <discover> invoked!")
-    for ip in device_ips:
-        try:
-            logging.debug(f"ESPHome: probing ip {ip}")
-            response = requests.get(f"http://{ip}/text_sensor/light_id", timeout=3)
-            response.raise_for_status()
-            if response.content and is_json(response.content):
-                device = response.json()['state'].split(';')
-                if device[0] != "esphome_diyhue_light":
-                    raise ValueError("Invalid device type")
-                mac, device_name, ct_boost, rgb_boost = device[1:5]
-                logging.debug(f"ESPHome: Found {device_name} at ip {ip}")
-                properties, modelid = get_device_properties(ip, device_name, mac, ct_boost, rgb_boost)
-                detectedLights.append({"protocol": "esphome", "name": device_name, "modelid": modelid, "protocol_cfg": properties})
-        except requests.RequestException as e:
-            logging.info(f"ip {ip} is unknown device: {e}")
+    detectedLights.extend(probeAll(probe, device_ips))
 
 def get_device_properties(ip: str, device_name: str, mac: str, ct_boost: str, rgb_boost: str) -> tuple[Dict[str, Any], str]:
     """
@@ -121,10 +134,10 @@ def get_device_properties(ip: str, device_name: str, mac: str, ct_boost: str, rg
         A tuple containing the device properties and model ID.
     """
     responses = {
-        "white": requests.get(f"http://{ip}/light/white_led", timeout=3),
-        "color": requests.get(f"http://{ip}/light/color_led", timeout=3),
-        "dim": requests.get(f"http://{ip}/light/dimmable_led", timeout=3),
-        "toggle": requests.get(f"http://{ip}/light/toggle_led", timeout=3)
+        "white": session.get(f"http://{ip}/light/white_led", timeout=3),
+        "color": session.get(f"http://{ip}/light/color_led", timeout=3),
+        "dim": session.get(f"http://{ip}/light/dimmable_led", timeout=3),
+        "toggle": session.get(f"http://{ip}/light/toggle_led", timeout=3)
     }
     if all(res.status_code != 200 for res in responses.values()):
         logging.debug("ESPHome: Device has improper configuration! Exiting.")
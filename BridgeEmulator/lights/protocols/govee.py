@@ -1,13 +1,239 @@
 import json
+import uuid
 import requests
 import logManager
+from threading import Condition, Lock, Thread
+from time import monotonic, time
+from HueObjects import bumpStateVersion
+from functions import metrics
 from functions.colors import convert_rgb_xy, convert_xy, hsv_to_rgb
-from typing import List, Dict, Any
+from functions.rateLimiter import RateLimiter
+from typing import List, Dict, Any, Optional, Tuple
 
 logging = logManager.logger.get_logger(__name__)
 
 BASE_URL = "https://openapi.api.govee.com/router/api/v1"
 BASE_TYPE = "devices.capabilities."
+DEVICE_RATE = 10 / 60  # requests per second Govee allows for one device (10 per minute)
+DEVICE_BURST = 10
+ACCOUNT_RATE = 10000 / 86400  # requests per second Govee allows for one API key (10000 per day)
+ACCOUNT_BURST = 100
+THROTTLE_SECONDS = 60  # pause after a 429 that does not say when the limit resets
+PRIORITIES = {"powerSwitch": 0, "brightness": 1, "segmentedBrightness": 1}  # between devices lower goes first, colours last
+
+schedulers: Dict[str, "CommandScheduler"] = {}  # API key -> scheduler
+schedulersLock = Lock()
+
+
+class GoveeThrottled(Exception):
+    """Govee refused requests of the account because its rate limit was hit."""
+
+
+class CommandScheduler:
+    """
+    Sends the control requests of one Govee account from a worker thread, within the API rate limits.
+
+    Unsent commands are kept per device, capability and segment, so a newer value replaces a queued one, and
+    segments of a device set to the same value share one request. The commands of a device are sent in the
+    order they were given, a power off drops its queued brightness and colour. Between devices, on/off goes
+    before brightness and colour. When Govee answers 429 the account pauses until the limit resets and the
+    lights are reported unreachable.
+    """
+    def __init__(self, apiKey: str) -> None:
+        self.apiKey = apiKey
+        self.pending: Dict[Tuple[str, str, int], List[Any]] = {}  # (device, instance, segment) -> [priority, order, light, request data]
+        self.order = 0
+        self.condition = Condition()
+        self.devices = RateLimiter(DEVICE_RATE, DEVICE_BURST)
+        self.account = RateLimiter(ACCOUNT_RATE, ACCOUNT_BURST)
+        self.throttledUntil = 0.0
+        self.counters = {"submitted": 0, "merged": 0, "superseded": 0, "requests": 0, "segments_batched": 0, "throttled": 0, "errors": 0}
+        Thread(target=self._work, name="govee", daemon=True).start()
+        metrics.register(f"govee {apiKey[-4:]}", self.metrics)  # per account, without exposing the key
+
+    def throttled(self) -> bool:
+        """Return True while Govee refuses the requests of the account."""
+        return monotonic() < self.throttledUntil
+
+    @staticmethod
+    def key(request_data: Dict[str, Any]) -> Tuple[str, str, int]:
+        """Return the device, capability instance and segment (-1 for the whole device) a request sets."""
+        capability = request_data["capability"]
+        segment = capability["value"]["segment"][0] if isinstance(capability["value"], dict) else -1
+        return request_data["device"], capability["instance"], segment
+
+    def submit(self, light: Any, request_data: Dict[str, Any]) -> None:
+        """
+        Queue a control request, replacing the unsent one for the same device, capability and segment.
+
+        The replaced request loses its place, the new value is sent after the commands given before it.
+
+        Args:
+            light (Any): The light the request is for.
+            request_data (Dict[str, Any]): The request payload.
+        """
+        key = self.key(request_data)
+        with self.condition:
+            self.counters["submitted"] += 1
+            self.order += 1
+            if key[1] == "powerSwitch" and not request_data["capability"]["value"]:
+                # brightness or colour sent after the power off would show stale values or turn the light on again
+                for other in [other for other in self.pending if other[0] == key[0] and other[1] != "powerSwitch"]:
+                    del self.pending[other]
+                    self.counters["superseded"] += 1
+            entry = self.pending.get(key)
+            if entry is not None:
+                self.counters["merged"] += 1
+                entry[1:] = [self.order, light, request_data]
+                return
+            self.pending[key] = [PRIORITIES.get(key[1], 2), self.order, light, request_data]
+            self.condition.notify()
+
+    def acquire(self, device: str) -> bool:
+        """
+        Take the quota for a state poll of a device, only when no command is waiting for it.
+
+        Args:
+            device (str): The device id.
+
+        Returns:
+            bool: False when the poll has to be skipped.
+        """
+        with self.condition:
+            if self.pending or self.throttled() or self.account.tokens(self.apiKey) < 1 or self.devices.tokens(device) < 1:
+                return False
+            self.account.allow(self.apiKey)
+            self.devices.allow(device)
+            return True
+
+    def throttle(self, response: requests.Response) -> None:
+        """
+        Pause the account after a 429 until the rate limit resets.
+
+        Args:
+            response (requests.Response): The 429 response.
+        """
+        pause = THROTTLE_SECONDS
+        retryAfter = response.headers.get("Retry-After", "")
+        reset = response.headers.get("API-RateLimit-Reset") or response.headers.get("X-RateLimit-Reset") or ""
+        if retryAfter.isdigit():
+            pause = int(retryAfter)
+        elif reset.isdigit():
+            pause = int(reset) - time()  # epoch seconds
+        with self.condition:
+            self.counters["throttled"] += 1
+            self.throttledUntil = monotonic() + min(max(pause, 1), 86400)
+        logging.warning(f"Govee: rate limit reached, pausing requests for {round(self.throttledUntil - monotonic())} s")
+
+    def _take(self) -> Tuple[Optional[List[List[Any]]], Optional[float]]:
+        """Pop the next command with the segments sharing its value, or return how long to wait (None: until submitted)."""
+        now = monotonic()
+        if now < self.throttledUntil:
+            return None, self.throttledUntil - now
+        if self.account.tokens(self.apiKey) < 1:
+            return None, self.account.retryAfter(self.apiKey)
+        wait = None
+        heads: Dict[str, Tuple[Tuple[str, str, int], List[Any]]] = {}  # device -> its oldest command
+        for key, entry in self.pending.items():
+            if key[0] not in heads or entry[1] < heads[key[0]][1][1]:
+                heads[key[0]] = (key, entry)
+        for key, entry in sorted(heads.values(), key=lambda item: item[1][:2]):
+            device, instance, segment = key
+            if self.devices.tokens(device) < 1:
+                retry = self.devices.retryAfter(device)
+                wait = retry if wait is None else min(wait, retry)
+                continue
+            self.account.allow(self.apiKey)
+            self.devices.allow(device)
+            batch = [self.pending.pop(key)]
+            if segment >= 0:
+                # other segments join unless an on/off given before them has to go first
+                barrier = min([other[1] for otherKey, other in self.pending.items() if otherKey[0] == device and otherKey[1] == "powerSwitch"], default=self.order + 1)
+                value = {name: field for name, field in entry[3]["capability"]["value"].items() if name != "segment"}
+                for other in [other for other in self.pending if other[:2] == (device, instance) and other[2] >= 0 and self.pending[other][1] < barrier]:
+                    otherValue = self.pending[other][3]["capability"]["value"]
+                    if {name: field for name, field in otherValue.items() if name != "segment"} == value:
+                        batch.append(self.pending.pop(other))
+            return batch, 0
+        return None, wait
+
+    def _work(self) -> None:
+        while True:
+            with self.condition:
+                batch, wait = self._take()
+                while batch is None:
+                    self.condition.wait(wait)
+                    batch, wait = self._take()
+            try:
+                self._send(batch)
+            except Exception as e:  # keep the only worker of the account alive
+                with self.condition:
+                    self.counters["errors"] += 1
+                logging.exception(f"Govee: sending {batch[0][3]['capability']['instance']} for {batch[0][3]['device']} failed: {e}")
+
+    def _send(self, batch: List[List[Any]]) -> None:
+        request_data = batch[0][3]
+        if len(batch) > 1:
+            segments = sorted(entry[3]["capability"]["value"]["segment"][0] for entry in batch)
+            request_data = dict(request_data, capability=dict(request_data["capability"], value=dict(request_data["capability"]["value"], segment=segments)))
+        with self.condition:
+            self.counters["segments_batched"] += len(batch) - 1
+            self.counters["requests"] += 1
+        try:
+            response = requests.put(f"{BASE_URL}/device/control", headers=get_headers(), data=json.dumps({"requestId": str(uuid.uuid4()), "payload": request_data}), timeout=10)
+            if response.status_code == 429:
+                self.throttle(response)
+                with self.condition:
+                    for entry in batch:  # send them once the limit resets, unless a newer value replaced them
+                        self.pending.setdefault(self.key(entry[3]), entry)
+                self._setReachable(batch, False)
+                return
+            response.raise_for_status()
+        except requests.RequestException as e:
+            with self.condition:
+                self.counters["errors"] += 1
+            logging.warning(f"Govee: {request_data['capability']['instance']} for {request_data['device']} failed: {e}")
+            self._setReachable(batch, False)
+            return
+        self._setReachable(batch, True)
+
+    def _setReachable(self, batch: List[List[Any]], reachable: bool) -> None:
+        for entry in batch:
+            light = entry[2]
+            if light.state.get("reachable") != reachable:
+                light.state["reachable"] = reachable
+                bumpStateVersion()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Return the request counters and the commands waiting for quota.
+
+        Returns:
+            Dict[str, Any]: The counters, the queued commands and the remaining pause in seconds.
+        """
+        with self.condition:
+            result: Dict[str, Any] = dict(self.counters)
+            result["queued"] = len(self.pending)
+            result["throttled_for"] = max(0, round(self.throttledUntil - monotonic()))
+        return result
+
+
+def get_scheduler() -> CommandScheduler:
+    """
+    Return the command scheduler of the configured Govee account, creating it on first use.
+
+    Returns:
+        CommandScheduler: The scheduler.
+    """
+    import configManager
+    apiKey = configManager.bridgeConfig.yaml_config["config"]["govee"].get('api_key', '')
+    scheduler = schedulers.get(apiKey)
+    if scheduler is None:
+        with schedulersLock:
+            scheduler = schedulers.get(apiKey)
+            if scheduler is None:
+                scheduler = schedulers[apiKey] = CommandScheduler(apiKey)
+    return scheduler
 
 def get_headers() -> Dict[str, str]:
     """
@@ -171,17 +397,21 @@ def get_brightness_range(device: Dict[str, Any]) -> Dict[str, Any]:
 
 def set_light(light: Any, data: Dict[str, Any]) -> None:
     """
-    Set the state of a Govee light.
+    Set the state of a Govee light, the requests are queued on the scheduler of the account.
 
     Args:
         light (Any): The light object containing protocol configuration.
         data (dict): The data containing state information to set.
     """
-    for date_type in data:
+    scheduler = get_scheduler()
+    # the commands of a device are sent in order: power on first, nothing that could turn it on after a power off
+    data_types = ["on"] if data.get("on") is False else sorted(data, key=lambda data_type: data_type != "on")
+    for date_type in data_types:
         request_data = create_request_data(light, data, date_type)
         if request_data is not None:
-            response = requests.put(f"{BASE_URL}/device/control", headers=get_headers(), data=json.dumps({"requestId": "1", "payload": request_data}))
-            response.raise_for_status()
+            scheduler.submit(light, request_data)
+    if scheduler.throttled():
+        raise GoveeThrottled("rate limit reached, the command is sent once it resets")
 
 def create_request_data(light: Any, data: Dict[str, Any], data_type: str) -> Dict[str, Any]:
     """
@@ -305,7 +535,13 @@ def get_light_state(light: Any) -> Dict[str, Any]:
     Returns:
         dict: The current state of the light.
     """
-    response = requests.get(f"{BASE_URL}/device/state", headers=get_headers(), data=json.dumps({"requestId": "uuid", "payload": {"sku": light.protocol_cfg["sku_model"], "device": light.protocol_cfg["device_id"]}}))
+    scheduler = get_scheduler()
+    if not scheduler.acquire(light.protocol_cfg["device_id"]):
+        return {"reachable": not scheduler.throttled()}  # the quota is kept for commands
+    response = requests.get(f"{BASE_URL}/device/state", headers=get_headers(), data=json.dumps({"requestId": str(uuid.uuid4()), "payload": {"sku": light.protocol_cfg["sku_model"], "device": light.protocol_cfg["device_id"]}}))
+    if response.status_code == 429:
+        scheduler.throttle(response)
+        raise GoveeThrottled("rate limit reached")
     response.raise_for_status()
     return parse_light_state(response.json().get("payload", {}).get("capabilities", {}), light)
 
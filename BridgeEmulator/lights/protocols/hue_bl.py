@@ -1,8 +1,10 @@
 import logManager
+from functions import asyncLoop
 from functions.colors import convert_xy
 import asyncio
 from typing import Dict, Tuple, Optional
 logging = logManager.logger.get_logger(__name__)
+REQUEST_TIMEOUT = 20  # seconds for a command, a BLE connection (bleak gives up after 10 s) included
 Connections: Dict[str, 'Lamp'] = {}
 
 ### libhueble ###
@@ -32,6 +34,7 @@ class Lamp(object):
         """
         self.address = address
         self.client: Optional[BleakClient] = None
+        self.lock: Optional[asyncio.Lock] = None  # created on the loop, serialises connection attempts
 
     @property
     def is_connected(self) -> bool:
@@ -60,6 +63,18 @@ class Lamp(object):
             logging.error(f"Failed to connect to {self.address}: {e}")
             self.client = None
 
+    async def ensure_connected(self) -> None:
+        """
+        Connect unless the BLE session of a previous command is still up.
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if not self.is_connected:
+                await self.connect()
+        if not self.is_connected:
+            raise ConnectionError(f"{self.address} is not connected")
+
     async def disconnect(self) -> None:
         """
         Disconnect from the BLE lamp.
@@ -163,22 +178,29 @@ class Lamp(object):
 
 def connect(light) -> Lamp:
     """
-    Connect to the lamp.
+    Get the lamp of a light, its BLE session is opened by the first command and kept for the next ones.
 
     Args:
         light: The light object containing protocol configuration.
 
     Returns:
-        Lamp: The connected Lamp object.
+        Lamp: The Lamp object.
     """
     ip = light.protocol_cfg["ip"]
-    if ip in Connections:
-        c = Connections[ip]
-    else:
-        c = Lamp(ip)
-        asyncio.run(c.connect())
-        Connections[ip] = c
-    return c
+    if ip not in Connections:
+        Connections[ip] = Lamp(ip)
+    return Connections[ip]
+
+async def apply(c: Lamp, light, data: Dict[str, any]) -> None:
+    await c.ensure_connected()
+    for key, value in data.items():
+        if key == "on":
+            await c.set_power(value)
+        if key == "bri":
+            await c.set_brightness(value / 254)
+        if key == "xy":
+            color = convert_xy(value[0], value[1], light.state["bri"])
+            await c.set_color_rgb(color[0] / 254, color[1] / 254, color[2] / 254)
 
 def set_light(light, data: Dict[str, any]) -> None:
     """
@@ -188,12 +210,5 @@ def set_light(light, data: Dict[str, any]) -> None:
         light: The light object.
         data (Dict[str, any]): A dictionary containing the light properties to set.
     """
-    c = connect(light)
-    for key, value in data.items():
-        if key == "on":
-            asyncio.run(c.set_power(value))
-        if key == "bri":
-            asyncio.run(c.set_brightness(value / 254))
-        if key == "xy":
-            color = convert_xy(value[0], value[1], light.state["bri"])
-            asyncio.run(c.set_color_rgb(color[0] / 254, color[1] / 254, color[2] / 254))
+    # the shared loop keeps the BleakClient usable, a loop per call would drop the connection
+    asyncLoop.run(apply(connect(light), light, data), REQUEST_TIMEOUT)
@@ -4,13 +4,24 @@ import socket
 from typing import List, Dict, Any, Union
 import logManager
 from functions.colors import convert_rgb_xy, convert_xy, hsv_to_rgb
+from functions.deviceConnections import DeviceConnection, getConnection
 
 logging = logManager.logger.get_logger(__name__)
 
-Connections: Dict[str, 'HyperionConnection'] = {}
-
 PRIORITY = 75
 
+def connect(light: Any) -> DeviceConnection:
+    """
+    Return the persistent JSON server connection to a Hyperion instance.
+
+    Args:
+        light: The light object containing protocol configuration.
+
+    Returns:
+        DeviceConnection: The connection.
+    """
+    return getConnection("hyperion", light.protocol_cfg["ip"], light.protocol_cfg["jss_port"])
+
 def discover(detectedLights: List[Dict[str, Any]]) -> None:
     """
     Discover Hyperion lights on the network.
@@ -63,13 +74,6 @@ def set_light(light: Dict[str, Any], data: Dict[str, Any]) -> None:
         light: The light object containing protocol configuration.
         data: A dictionary containing the state data to set (e.g., on, bri).
     """
-    ip = light.protocol_cfg["ip"]
-    if ip in Connections:
-        c = Connections[ip]
-    else:
-        c = HyperionConnection(ip, light.protocol_cfg["jss_port"])
-        Connections[ip] = c
-
     if "on" in data and not data["on"]:
         request_data = {"command": "clear", "priority": PRIORITY}
     else:
@@ -83,7 +87,8 @@ def set_light(light: Dict[str, Any], data: Dict[str, Any]) -> None:
             color = convert_xy(light["state"]["xy"][0], light["state"]["xy"][1], light["state"]["bri"])
         request_data["color"] = color
 
-    c.command(request_data)
+    # the reply is not awaited, it is dropped before the next request
+    connect(light).send([(json.dumps(request_data) + "\r\n").encode()])
 
 def get_light_state(light: Dict[str, Any]) -> Dict[str, Union[bool, Dict[str, Any]]]:
     """
@@ -95,109 +100,20 @@ def get_light_state(light: Dict[str, Any]) -> Dict[str, Union[bool, Dict[str, An
     Returns:
         A dictionary containing the current state of the light (e.g., on, bri).
     """
-    ip = light.protocol_cfg["ip"]
-    if ip in Connections:
-        c = Connections[ip]
-    else:
-        c = HyperionConnection(ip, light.protocol_cfg["jss_port"])
-        Connections[ip] = c
-
     state = {"on": False}
 
-    c.command({"command": "serverinfo"})
     try:
-        response = c.recv(1024 * 1024).decode('utf-8').split("\r\n")
-        for data in response:
-            info = json.loads(data)
-            if info.get("success") and len(info["info"]["priorities"]) > 0:
-                activeColor = info["info"]["priorities"][0]
-                if activeColor["priority"] == PRIORITY:
-                    rgb = activeColor["value"]["RGB"]
-                    state["on"] = True
-                    state["xy"] = convert_rgb_xy(rgb[0], rgb[1], rgb[2])
-                    state["bri"] = max(rgb[0], rgb[1], rgb[2])
-                    state["colormode"] = "xy"
+        info = connect(light).request({"command": "serverinfo"}, lambda reply: reply.get("command") == "serverinfo")
+        if info.get("success") and len(info["info"]["priorities"]) > 0:
+            activeColor = info["info"]["priorities"][0]
+            if activeColor["priority"] == PRIORITY:
+                rgb = activeColor["value"]["RGB"]
+                state["on"] = True
+                state["xy"] = convert_rgb_xy(rgb[0], rgb[1], rgb[2])
+                state["bri"] = max(rgb[0], rgb[1], rgb[2])
+                state["colormode"] = "xy"
     except Exception as e:
         logging.warning(e)
         return {'reachable': False}
 
     return state
-
-class HyperionConnection:
-    _connected: bool = False
-    _socket: socket.socket = None
-    _host_ip: str = ""
-
-    def __init__(self, ip: str, port: str) -> None:
-        """
-        Initialize a Hyperion connection.
-
-        Args:
-            ip: The IP address of the Hyperion server.
-            port: The port of the Hyperion server.
-        """
-        self._ip = ip
-        self._port = port
-
-    def connect(self) -> None:
-        """Connect to the Hyperion server."""
-        self.disconnect()
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.settimeout(5)
-        self._socket.connect((self._ip, int(self._port)))
-        self._connected = True
-
-    def disconnect(self) -> None:
-        """Disconnect from the Hyperion server."""
-        self._connected = False
-        if self._socket:
-            self._socket.close()
-        self._socket = None
-
-    def send(self, data: bytes, flags: int = 0) -> None:
-        """
-        Send data to the Hyperion server.
-
-        Args:
-            data: The data to send.
-            flags: Optional flags for the send operation.
-        """
-        try:
-            if not self._connected:
-                self.connect()
-            self._socket.send(data, flags)
-        except Exception as e:
-            self._connected = False
-            raise e
-
-    def recv(self, bufsize: int, flags: int = 0) -> bytes:
-        """
-        Receive data from the Hyperion server.
-
-        Args:
-            bufsize: The maximum amount of data to receive at once.
-            flags: Optional flags for the receive operation.
-
-        Returns:
-            The received data.
-        """
-        try:
-            if not self._connected:
-                self.connect()
-            return self._socket.recv(bufsize, flags)
-        except Exception as e:
-            self._connected = False
-            raise e
-
-    def command(self, data: Dict[str, Any]) -> None:
-        """
-        Send a command to the Hyperion server.
-
-        Args:
-            data: The command data to send.
-        """
-        try:
-            msg = json.dumps(data) + "\r\n"
-            self.send(msg.encode())
-        except Exception as e:
-            logging.warning("Hyperion command error: %s", e)
@@ -1,6 +1,8 @@
 import logManager
 import json
-from typing import Dict, Any
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Dict, Any, FrozenSet, List, Set, Tuple
 
 # External
 import paho.mqtt.publish as publish
@@ -10,6 +12,146 @@ from functions.colors import hsv_to_rgb, convert_xy
 
 logging = logManager.logger.get_logger(__name__)
 
+STATE_KEYS = {"state", "brightness", "color", "color_temp", "gradient"}  # payload keys describing a state, the rest are actions
+STATE_TTL = 30  # seconds a published state is trusted for diffing
+
+class MqttPublisher:
+    """
+    Publishes light commands from a background thread.
+
+    Commands queued for a topic while a publish is in flight are merged into the latest values, keys already
+    published with the same value are left out and commands left without any change are not sent at all.
+    Topics covering every member of a zigbee2mqtt group with the same payload are sent as one group publish.
+    """
+    def __init__(self) -> None:
+        self.pending: Dict[Tuple[str, int], Dict[str, Dict[str, Any]]] = {}  # broker -> topic -> merged payload
+        self.servers: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self.published: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # topic -> (time, last published state)
+        self.groupTopics: Dict[FrozenSet[str], str] = {}  # member command topics -> group command topic
+        self.failed: Set[str] = set()  # topics whose last publish failed, their lights are reported unreachable
+        self.counters = {"queued": 0, "merged": 0, "published": 0, "suppressed": 0, "grouped": 0}
+        self._condition = Condition()
+        self._publishedLock = Lock()
+        self._worker = None
+
+    def queue(self, mqtt_server: Dict[str, Any], messages: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Queue payloads for publishing.
+
+        Args:
+            mqtt_server (Dict[str, Any]): The broker configuration.
+            messages (Dict[str, Dict[str, Any]]): The payloads by command topic.
+        """
+        server = (mqtt_server["mqttServer"], mqtt_server["mqttPort"])
+        with self._condition:
+            self.servers[server] = mqtt_server
+            pending = self.pending.setdefault(server, {})
+            for topic, payload in messages.items():
+                self.counters["queued"] += 1
+                if topic in pending:
+                    pending[topic].update(payload)
+                    self.counters["merged"] += 1
+                else:
+                    pending[topic] = dict(payload)
+            if self._worker is None:
+                self._worker = Thread(target=self._run, name="mqttPublisher", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+
+    def setGroupTopics(self, groupTopics: Dict[FrozenSet[str], str]) -> None:
+        """
+        Replace the zigbee2mqtt groups usable for publishing.
+
+        Args:
+            groupTopics (Dict[FrozenSet[str], str]): The group command topic by the command topics of its members.
+        """
+        self.groupTopics = {members: topic for members, topic in groupTopics.items() if len(members) > 1}
+
+    def observe(self, topic: str, reported: Dict[str, Any]) -> None:
+        """
+        Replace the last published state of a topic with the state reported by the device, keys the device
+        does not report are forgotten so they are sent again.
+
+        Args:
+            topic (str): The command topic of the device.
+            reported (Dict[str, Any]): The state message of the device.
+        """
+        with self._publishedLock:
+            self.failed.discard(topic)  # the broker delivers again
+            if topic in self.published:
+                state = {key: reported[key] for key in ("state", "brightness", "color_temp") if key in reported}
+                color = reported.get("color")
+                if isinstance(color, dict) and "x" in color and "y" in color:
+                    state["color"] = {"x": color["x"], "y": color["y"]}  # as published, z2m adds hue and saturation
+                self.published[topic] = (self.published[topic][0], state)
+
+    def isFailed(self, topics: List[str]) -> bool:
+        """Return True when the last publish to any of the topics failed."""
+        with self._publishedLock:
+            return not self.failed.isdisjoint(topics)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self.pending:
+                    self._condition.wait()
+                batch, self.pending = self.pending, {}
+            for server, messages in batch.items():
+                self._publish(self.servers[server], messages)
+
+    def _diff(self, topic: str, payload: Dict[str, Any], now: float) -> Dict[str, Any]:
+        last = self.published.get(topic)
+        if last is None or now - last[0] > STATE_TTL:
+            return payload
+        return {key: value for key, value in payload.items() if key not in STATE_KEYS or last[1].get(key) != value}
+
+    def _publish(self, mqtt_server: Dict[str, Any], messages: Dict[str, Dict[str, Any]]) -> None:
+        now = monotonic()
+        buckets: Dict[str, List[str]] = {}  # encoded payload -> topics
+        with self._publishedLock:
+            for topic, payload in messages.items():
+                payload = self._diff(topic, payload, now)
+                if not payload.keys() - {"transition"}:
+                    self.counters["suppressed"] += 1
+                    continue
+                buckets.setdefault(json.dumps(payload, sort_keys=True), []).append(topic)
+        publishes = []
+        for encoded, topics in buckets.items():
+            remaining = set(topics)
+            for members, groupTopic in sorted(self.groupTopics.items(), key=lambda item: -len(item[0])):
+                if members <= remaining:
+                    remaining -= members
+                    publishes.append({"topic": groupTopic, "payload": encoded})
+                    self.counters["grouped"] += len(members) - 1
+            publishes += [{"topic": topic, "payload": encoded} for topic in topics if topic in remaining]
+        if not publishes:
+            return
+        logging.debug("MQTT publish to: " + json.dumps(publishes))
+        auth = None
+        if mqtt_server["mqttUser"] and mqtt_server["mqttPassword"]:
+            auth = {'username': mqtt_server["mqttUser"], 'password': mqtt_server["mqttPassword"]}
+        try:
+            publish.multiple(publishes, hostname=mqtt_server["mqttServer"], port=mqtt_server["mqttPort"], auth=auth)
+        except Exception as e:
+            logging.warning(f"MQTT publish error, details: {e}")
+            with self._publishedLock:
+                for topic in messages:
+                    self.published.pop(topic, None)  # nothing is known about the devices now
+                self.failed.update(messages)
+            return
+        self.counters["published"] += len(publishes)
+        with self._publishedLock:
+            self.failed.difference_update(messages)
+            for encoded, topics in buckets.items():
+                state = {key: value for key, value in json.loads(encoded).items() if key in STATE_KEYS}
+                for topic in topics:
+                    last = self.published.get(topic)
+                    merged = dict(last[1]) if last is not None and now - last[0] <= STATE_TTL else {}
+                    merged.update(state)
+                    self.published[topic] = (now, merged)
+
+publisher = MqttPublisher()
+
 def create_payload(lightsData: Dict[str, Any], light: Any) -> Dict[str, Any]:
     """
     Create the payload for the MQTT message based on the light data.
@@ -52,25 +194,20 @@ def create_payload(lightsData: Dict[str, Any], light: Any) -> Dict[str, Any]:
 
 def set_light(light: Any, data: Dict[str, Any]) -> None:
     """
-    Set the light state via MQTT.
+    Set the light state via MQTT, the payloads are queued on the publisher.
 
     Args:
         light (Any): The light object.
         data (Dict[str, Any]): The data to set the light state.
+
+    Raises:
+        ConnectionError: When the previous publish to the light failed, the new payloads are queued anyway.
     """
-    messages = []
     lightsData = data.get("lights", {light.protocol_cfg["command_topic"]: data})
-
-    for topic, light_data in lightsData.items():
-        payload = create_payload(light_data, light)
-        messages.append({"topic": topic, "payload": json.dumps(payload)})
-
-    logging.debug("MQTT publish to: " + json.dumps(messages))
-    auth = None
-    mqtt_server = light.protocol_cfg["mqtt_server"]
-    if mqtt_server["mqttUser"] and mqtt_server["mqttPassword"]:
-        auth = {'username': mqtt_server["mqttUser"], 'password': mqtt_server["mqttPassword"]}
-    publish.multiple(messages, hostname=mqtt_server["mqttServer"], port=mqtt_server["mqttPort"], auth=auth)
+    messages = {topic: create_payload(light_data, light) for topic, light_data in lightsData.items()}
+    publisher.queue(light.protocol_cfg["mqtt_server"], messages)
+    if publisher.isFailed(list(messages)):
+        raise ConnectionError("the last MQTT publish failed")
 
 def discover(mqtt_config: Dict[str, Any]) -> None:
     """
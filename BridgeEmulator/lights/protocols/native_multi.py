@@ -1,6 +1,7 @@
 import json
 import logManager
 import requests
+from functions.request import probeAll, session
 from typing import Dict, List, Any
 
 logging = logManager.logger.get_logger(__name__)
@@ -73,6 +74,55 @@ def is_json(content: str) -> bool:
         return False
     return True
 
+def probe(ip: str) -> List[Dict[str, Any]]:
+    """
+    Probe one address for a light with the diyHue firmware.
+
+    Args:
+        ip (str): The device address.
+
+    Returns:
+        List[Dict[str, Any]]: The lights of the device.
+    """
+    detectedLights = []
+    try:
+        response = session.get(f"http://{ip}/detect", timeout=3)
+        response.raise_for_status()
+        if response.content and is_json(response.content):  # Check if response content is valid JSON
+            device_data = response.json()
+            logging.debug(json.dumps(device_data))
+
+            if "modelid" in device_data:
+                logging.info(f"{ip} is {device_data['name']}")
+                protocol = device_data.get("protocol", "native")
+                lights = device_data.get("lights", 1)
+
+                logging.info(f"Detected light : {device_data['name']}")
+                for x in range(1, lights + 1):
+                    lightName = generate_light_name(device_data['name'], x)
+                    protocol_cfg = {
+                        "ip": ip,
+                        "version": device_data["version"],
+                        "type": device_data["type"],
+                        "light_nr": x,
+                        "mac": device_data["mac"]
+                    }
+                    if device_data["modelid"] in ["LCX002", "915005987201", "LCX004", "LCX006"]:
+                        protocol_cfg["points_capable"] = 5
+                    detectedLights.append({
+                        "protocol": protocol,
+                        "name": lightName,
+                        "modelid": device_data["modelid"],
+                        "protocol_cfg": protocol_cfg
+                    })
+        else:
+            logging.info(f"ip {ip} returned empty or invalid JSON response")
+
+    except requests.RequestException as e:
+        logging.info(f"ip {ip} is unknown device: {e}")
+
+    return detectedLights
+
 def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> List[Dict[str, Any]]:
     """
     Discover lights on the network.
@@ -85,41 +135,5 @@ def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> Lis
         List[Dict[str, Any]]: The updated list of detected lights.
     """
     logging.debug("native: <discover> invoked!")
-    for ip in device_ips:
-        try:
-            response = requests.get(f"http://{ip}/detect", timeout=3)
-            response.raise_for_status()
-            if response.content and is_json(response.content):  # Check if response content is valid JSON
-                device_data = response.json()
-                logging.debug(json.dumps(device_data))
-
-                if "modelid" in device_data:
-                    logging.info(f"{ip} is {device_data['name']}")
-                    protocol = device_data.get("protocol", "native")
-                    lights = device_data.get("lights", 1)
-
-                    logging.info(f"Detected light : {device_data['name']}")
-                    for x in range(1, lights + 1):
-                        lightName = generate_light_name(device_data['name'], x)
-                        protocol_cfg = {
-                            "ip": ip,
-                            "version": device_data["version"],
-                            "type": device_data["type"],
-                            "light_nr": x,
-                            "mac": device_data["mac"]
-                        }
-                        if device_data["modelid"] in ["LCX002", "915005987201", "LCX004", "LCX006"]:
-                            protocol_cfg["points_capable"] = 5
-                        detectedLights.append({
-                            "protocol": protocol,
-                            "name": lightName,
-                            "modelid": device_data["modelid"],
-                            "protocol_cfg": protocol_cfg
-                        })
-            else:
-                logging.info(f"ip {ip} returned empty or invalid JSON response")
-
-        except requests.RequestException as e:
-            logging.info(f"ip {ip} is unknown device: {e}")
-
+    detectedLights.extend(probeAll(probe, device_ips))
     return detectedLights
@@ -1,6 +1,7 @@
 import json
 import logManager
 import requests
+from functions.request import probeAll, session
 from typing import List, Dict, Any
 
 logging = logManager.logger.get_logger(__name__)
@@ -25,6 +26,61 @@ def is_json(content: str) -> bool:
     return True
 
 
+def probe(ip: str) -> List[Dict[str, Any]]:
+    """
+    Probe one address for a supported Shelly device.
+
+    Args:
+        ip (str): The device address.
+
+    Returns:
+        List[Dict[str, Any]]: The light of the device, empty when it is not a supported Shelly device.
+    """
+    try:
+        logging.debug('shelly: probing ip ' + ip)
+        response = session.get('http://' + ip + '/shelly', timeout = 5)
+        response.raise_for_status()
+        if response.content and is_json(response.content):  # Check if response content is valid JSON
+            logging.debug('Shelly: ' + ip + ' is a shelly device ')
+            device_data = json.loads(response.text)
+
+            device_model = ''
+            if (not 'gen' in device_data) and ('type' in device_data):
+                device_model = device_data['type']
+            elif ('gen' in device_data) and ('model' in device_data):
+                device_model = device_data['model']
+            else:
+                logging.info('Shelly: <discover> not implemented api version!')
+
+            if (device_model == 'SHSW-1') or (device_model == 'SHSW-PM'):
+                shelly_data = request_api_v1(ip, 'status')
+                logging.debug('Shelly: IP: ' + shelly_data['wifi_sta']['ip'])
+                logging.debug('Shelly: MAC: ' + shelly_data['mac'])
+
+                config = {'ip': ip, 'mac': shelly_data['mac'], 'gen': 1}
+
+                shelly_data = request_api_v1(ip, 'settings')
+                name = shelly_data['name'] if 'name' in shelly_data else ip
+                name = name.strip() if name.strip() != '' else ip
+                return [{'protocol': 'shelly', 'name': name, 'modelid': 'LOM001', 'protocol_cfg': config}]
+            elif (device_model == 'SNSW-001P8EU'):
+                shelly_data = request_api_v2(ip, 'WiFi.GetStatus')
+                logging.debug('Shelly: IP: ' + shelly_data['sta_ip'])
+                shelly_data = request_api_v2(ip, 'Shelly.GetDeviceInfo')
+                logging.debug('Shelly: MAC: ' + shelly_data['mac'])
+
+                config = {'ip': ip, 'mac': shelly_data['mac'], 'gen': device_data['gen'] }
+
+                name = shelly_data['name'] if 'name' in shelly_data else ip
+                name = name.strip() if name.strip() != '' else ip
+                return [{'protocol': 'shelly', 'name': name, 'modelid': 'LOM001', 'protocol_cfg': config}]
+            else:
+                logging.info('Shelly: ' + ip + ' is not supported ')
+    except requests.RequestException as e:
+        logging.info(f"ip {ip} is unknown device: {e}")
+    return []
+
+
 def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> None:
     """
     Discover Shelly devices on the provided IP addresses and add them to detectedLights.
@@ -34,49 +90,7 @@ def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> Non
         device_ips (List[str]): List of device IP addresses to probe.
     """
     logging.debug('shelly: <discover> invoked!')
-    for ip in device_ips:
-        try:
-            logging.debug('shelly: probing ip ' + ip)
-            response = requests.get('http://' + ip + '/shelly', timeout = 5)
-            response.raise_for_status()
-            if response.content and is_json(response.content):  # Check if response content is valid JSON
-                logging.debug('Shelly: ' + ip + ' is a shelly device ')
-                device_data = json.loads(response.text)
-
-                device_model = ''
-                if (not 'gen' in device_data) and ('type' in device_data):
-                    device_model = device_data['type']
-                elif ('gen' in device_data) and ('model' in device_data):
-                    device_model = device_data['model']
-                else:
-                    logging.info('Shelly: <discover> not implemented api version!')
-
-                if (device_model == 'SHSW-1') or (device_model == 'SHSW-PM'):
-                    shelly_data = request_api_v1(ip, 'status')
-                    logging.debug('Shelly: IP: ' + shelly_data['wifi_sta']['ip'])
-                    logging.debug('Shelly: MAC: ' + shelly_data['mac'])
-
-                    config = {'ip': ip, 'mac': shelly_data['mac'], 'gen': 1}
-
-                    shelly_data = request_api_v1(ip, 'settings')
-                    name = shelly_data['name'] if 'name' in shelly_data else ip
-                    name = name.strip() if name.strip() != '' else ip
-                    detectedLights.append({'protocol': 'shelly', 'name': name, 'modelid': 'LOM001', 'protocol_cfg': config})
-                elif (device_model == 'SNSW-001P8EU'):
-                    shelly_data = request_api_v2(ip, 'WiFi.GetStatus')
-                    logging.debug('Shelly: IP: ' + shelly_data['sta_ip'])
-                    shelly_data = request_api_v2(ip, 'Shelly.GetDeviceInfo')
-                    logging.debug('Shelly: MAC: ' + shelly_data['mac'])
-
-                    config = {'ip': ip, 'mac': shelly_data['mac'], 'gen': device_data['gen'] }
-
-                    name = shelly_data['name'] if 'name' in shelly_data else ip
-                    name = name.strip() if name.strip() != '' else ip
-                    detectedLights.append({'protocol': 'shelly', 'name': name, 'modelid': 'LOM001', 'protocol_cfg': config})
-                else:
-                    logging.info('Shelly: ' + ip + ' is not supported ')
-        except requests.RequestException as e:
-            logging.info(f"ip {ip} is unknown device: {e}")
+    detectedLights.extend(probeAll(probe, device_ips))
 
 def set_light(light: Any, data: Dict[str, Any]) -> None:
     """
@@ -133,7 +147,7 @@ def request_api_v1(ip: str, request: str) -> Dict[str, Any]:
         Dict[str, Any]: The response data from the API.
     """
     head = {'Content-type': 'application/json'}
-    response = requests.get('http://' + ip + '/' + request, timeout = 5, headers = head)
+    response = session.get('http://' + ip + '/' + request, timeout = 5, headers = head)
     return json.loads(response.text) if response.status_code == 200 else {}
 
 def request_api_v2(ip: str, request: str) -> Dict[str, Any]:
@@ -148,5 +162,5 @@ def request_api_v2(ip: str, request: str) -> Dict[str, Any]:
         Dict[str, Any]: The response data from the API.
     """
     head = {'Content-type': 'application/json'}
-    response = requests.get('http://' + ip + '/rpc/' + request, timeout = 5, headers = head)
+    response = session.get('http://' + ip + '/rpc/' + request, timeout = 5, headers = head)
     return json.loads(response.text) if response.status_code == 200 else {}
@@ -1,6 +1,7 @@
 import json
 import logManager
 import requests
+from functions.request import probeAll, session
 from functions.colors import convert_rgb_xy, convert_xy, rgbBrightness
 from typing import List, Dict, Any, Union
 
@@ -42,6 +43,34 @@ def is_json(content: str) -> bool:
         return False
     return True
 
+def probe(ip: str) -> List[Dict[str, Any]]:
+    """
+    Probe one address for a Tasmota device.
+
+    Args:
+        ip (str): The device address.
+
+    Returns:
+        List[Dict[str, Any]]: The light of the device, empty when it is not a Tasmota device.
+    """
+    try:
+        #logging.debug(f"tasmota: probing ip {ip}")
+        response = session.get(f"http://{ip}/cm?cmnd=Status%200", timeout=3)
+        response.raise_for_status()
+        if response.content and is_json(response.content):
+            device_data = response.json()
+            #logging.debug(pretty_json(device_data))
+            if "StatusSTS" in device_data:
+                logging.debug(f'tasmota: {ip} is a Tasmota device')
+                logging.debug(f'tasmota: Hostname: {device_data["StatusNET"]["Hostname"]}')
+                logging.debug(f'tasmota: Mac:      {device_data["StatusNET"]["Mac"]}')
+
+                return [{"protocol": "tasmota", "name": device_data["StatusNET"]["Hostname"], "modelid": "LCT015", "protocol_cfg": {"ip": ip, "id": device_data["StatusNET"]["Mac"]}}]
+
+    except requests.RequestException as e:
+        logging.info(f"ip {ip} is unknown device: {e}")
+    return []
+
 def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> None:
     """
     Discover Tasmota devices on the network.
@@ -51,24 +80,7 @@ def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> Non
         device_ips (List[str]): The list of device IPs to probe.
     """
     logging.debug("tasmota: <discover> invoked!")
-    for ip in device_ips:
-        try:
-            #logging.debug(f"tasmota: probing ip {ip}")
-            response = requests.get(f"http://{ip}/cm?cmnd=Status%200", timeout=3)
-            response.raise_for_status()
-            if response.content and is_json(response.content):
-                device_data = response.json()
-                #logging.debug(pretty_json(device_data))
-                if "StatusSTS" in device_data:
-                    logging.debug(f'tasmota: {ip} is a Tasmota device')
-                    logging.debug(f'tasmota: Hostname: {device_data["StatusNET"]["Hostname"]}')
-                    logging.debug(f'tasmota: Mac:      {device_data["StatusNET"]["Mac"]}')
-
-                    properties = {"rgb": True, "ct": False, "ip": ip, "name": device_data["StatusNET"]["Hostname"], "id": device_data["StatusNET"]["Mac"], "mac": device_data["StatusNET"]["Mac"]}
-                    detectedLights.append({"protocol": "tasmota", "name": device_data["StatusNET"]["Hostname"], "modelid": "LCT015", "protocol_cfg": {"ip": ip, "id": device_data["StatusNET"]["Mac"]}})
-
-        except requests.RequestException as e:
-            logging.info(f"ip {ip} is unknown device: {e}")
+    detectedLights.extend(probeAll(probe, device_ips))
 
 def set_light(light: Dict[str, Any], data: Dict[str, Any], rgb: Union[List[int], None] = None) -> None:
     """
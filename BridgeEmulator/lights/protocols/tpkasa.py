@@ -2,9 +2,11 @@ import asyncio
 import colorsys
 import json
 import socket
+from typing import Dict
 
 from kasa import SmartLightStrip, Discover, TPLinkSmartHomeProtocol
 
+from functions import asyncLoop
 from functions.colors import convert_xy
 
 import logManager
@@ -16,6 +18,7 @@ was_off = None
 
 logging = logManager.logger.get_logger(__name__)
 
+protocols: Dict[str, TPLinkSmartHomeProtocol] = {}  # ip -> protocol keeping the connection to the device open
 
 
 # takes up to 10sec. Tested with KL430(have no other device to test)
@@ -110,14 +113,20 @@ def generate_light_name(base_name, light_nr):
     return '%s%s' % (base_name[:32 - len(suffix)], suffix)
 
 
+async def discover_devices():
+    devices: dict = await Discover.discover(target="192.168.0.255")
+    await asyncio.gather(*[device.update() for device in devices.values()])
+    return devices
+
+
 # Detects only Kl430 but other Kasa devices should work to
 def discover(detectedLights):
     logging.debug('Kasa discovery started')
-    devices: dict = asyncio.run(Discover.discover(target="192.168.0.255"))
+    devices: dict = asyncLoop.run(discover_devices())
 
     for device in list(devices.keys()):
         x: KL430LightStrip = devices[device]
-        asyncio.run(x.update())
+        protocols[device] = x.protocol  # already connected by the update
 
         if x.model.startswith("KL430"):
             ip = device
@@ -160,9 +169,7 @@ def build_request(command, state, protocol=None):
     request = {protocol: {command: state}}
 
     #send_debug("192.168.0.201", json.dumps(request).encode())
-    bytestream = TPLinkSmartHomeProtocol.encrypt(json.dumps(request))
-
-    return bytestream
+    return json.dumps(request)
 
 
 def send_request(target, request):
@@ -172,12 +179,11 @@ def send_request(target, request):
     else:
         old_request = request
 
-    port = 9999  # Std KAsaPort
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.connect((target, port))
-    s.sendall(request)
-    # print(TPLinkSmartHomeProtocol.decrypt(s.recv(1024)))
-    s.close()
+    protocol = protocols.get(target)
+    if protocol is None:
+        protocol = protocols[target] = TPLinkSmartHomeProtocol(target)
+    # the protocol keeps its connection open as long as it is used from the same event loop
+    asyncLoop.run(protocol.query(request, retry_count=1))
 
 
 def send_debug(target, request):
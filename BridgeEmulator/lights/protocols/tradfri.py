@@ -1,7 +1,7 @@
-import json
 import logManager
-from subprocess import check_output
+from aiocoap import GET, PUT
 from functions.colors import convert_rgb_xy, hsv_to_rgb
+from services.tradfri import getGateway, lightState
 from typing import Dict, Any, List
 
 logging = logManager.logger.get_logger(__name__)
@@ -15,7 +15,6 @@ def set_light(light: Any, data: Dict[str, Any]) -> None:
         data (Dict[str, Any]): The data to set on the light.
     """
     payload = {}
-    url = "coaps://" + light.protocol_cfg["ip"] + ":5684/15001/" + str(light.protocol_cfg["id"])
     for key, value in data.items():
         if key == "on":
             payload["5850"] = int(value)
@@ -60,8 +59,8 @@ def set_light(light: Any, data: Dict[str, Any]) -> None:
 
     if "5712" not in payload:
         payload["5712"] = 4 #If no transition add one, might also add check to prevent large transitiontimes
-    cmd = ["coap-client-gnutls", "-B", "2", "-m", "put", "-u", light.protocol_cfg["identity"], "-k", light.protocol_cfg["psk"], "-e", "{ \"3311\": [" + json.dumps(payload) + "] }", url]
-    check_output(cmd)
+    gateway = getGateway(light.protocol_cfg["ip"], light.protocol_cfg["identity"], light.protocol_cfg["psk"])
+    gateway.request(PUT, "15001/" + str(light.protocol_cfg["id"]), {"3311": [payload]})
 
 def get_light_state(light: Any) -> Dict[str, Any]:
     """
@@ -73,22 +72,11 @@ def get_light_state(light: Any) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: The current state of the light.
     """
-    state ={}
-    cmd = ["coap-client-gnutls", "-B", "5", "-m", "get", "-u", light.protocol_cfg["identity"], "-k", light.protocol_cfg["psk"], "coaps://" + light.protocol_cfg["ip"] + ":5684/15001/" + str(light.protocol_cfg["id"])]
-    light_data = json.loads(check_output(cmd).decode('utf-8').rstrip('\n').split("\n")[-1])
-    state["on"] = bool(light_data["3311"][0]["5850"])
-    state["bri"] = light_data["3311"][0]["5851"]
-    if "5706" in light_data["3311"][0]:
-        if light_data["3311"][0]["5706"] == "f5faf6":
-            state["ct"] = 170
-        elif light_data["3311"][0]["5706"] == "f1e0b5":
-            state["ct"] = 320
-        elif light_data["3311"][0]["5706"] == "efd275":
-            state["ct"] = 470
-    else:
-        state["ct"] = 470
-
-    return state
+    gateway = getGateway(light.protocol_cfg["ip"], light.protocol_cfg["identity"], light.protocol_cfg["psk"])
+    state = gateway.states.get(int(light.protocol_cfg["id"]))
+    if state is not None:
+        return dict(state)  # observed, the gateway pushes every change
+    return lightState(gateway.request(GET, "15001/" + str(light.protocol_cfg["id"])))
 
 def discover(detectedLights: List[Dict[str, Any]], tradfriConfig: Dict[str, Any]) -> List[Dict[str, Any]]:
     """
@@ -104,12 +92,13 @@ def discover(detectedLights: List[Dict[str, Any]], tradfriConfig: Dict[str, Any]
     if "psk" in tradfriConfig:
         logging.debug("tradfri: <discover> invoked!")
         try:
-            cmd = ["coap-client-gnutls", "-B", "5", "-m", "get", "-u", tradfriConfig["identity"], "-k", tradfriConfig["psk"], "coaps://" + tradfriConfig["tradfriGwIp"] + ":5684/15001"]
-            tradriDevices = json.loads(check_output(cmd).decode('utf-8').rstrip('\n').split("\n")[-1])
+            gateway = getGateway(tradfriConfig["tradfriGwIp"], tradfriConfig["identity"], tradfriConfig["psk"])
+            tradriDevices = gateway.request(GET, "15001")
             logging.debug(tradriDevices)
-            for device in tradriDevices:
-                cmd = ["coap-client-gnutls", "-B", "5", "-m", "get", "-u", tradfriConfig["identity"], "-k", tradfriConfig["psk"], "coaps://" + tradfriConfig["tradfriGwIp"] + ":5684/15001/" + str(device)]
-                deviceParameters = json.loads(check_output(cmd).decode('utf-8').rstrip('\n').split("\n")[-1])
+            for device, deviceParameters in zip(tradriDevices, gateway.requestAll(["15001/" + str(device) for device in tradriDevices])):
+                if isinstance(deviceParameters, Exception):
+                    logging.warning(f"tradfri: device {device} | {deviceParameters!r}")
+                    continue
                 if "3311" in deviceParameters:
                     logging.debug("found tradfi light " + deviceParameters["9001"])
                     detectedLights.append({"protocol": "tradfri", "name": deviceParameters["9001"], "modelid": "LCT015", "protocol_cfg": {"ip": tradfriConfig["tradfriGwIp"], "id": device, "identity": tradfriConfig["identity"], "psk":  tradfriConfig["psk"]}})
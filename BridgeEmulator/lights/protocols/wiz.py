@@ -2,10 +2,13 @@ import json
 import socket
 import logManager
 from functions.colors import convert_xy, hsv_to_rgb
+from functions.deviceConnections import DeviceConnection, getConnection
 from typing import Dict, Any
 
 logging = logManager.logger.get_logger(__name__)
 
+PORT = 38899
+
 def set_light(light: Any, data: Dict[str, Any]) -> None:
     """
     Set the light state based on the provided data.
@@ -45,8 +48,7 @@ def set_light(light: Any, data: Dict[str, Any]) -> None:
             payload["dimming"] = 100
     logging.debug(json.dumps({"method": "setPilot", "params": payload}))
     udpmsg = bytes(json.dumps({"method": "setPilot", "params": payload}), "utf8")
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) # UDP
-    sock.sendto(udpmsg, (ip, 38899))
+    getConnection("wiz", ip, PORT, lambda ip, port: DeviceConnection(ip, port, socket.SOCK_DGRAM)).send([udpmsg])
 
 def translateRange(value: float, leftMin: float, leftMax: float, rightMin: float, rightMax: float) -> float:
     """
@@ -3,11 +3,12 @@ import urllib.request
 import json
 import math
 import logManager
-import requests
+from functions.request import probeAll, probePool, session
 from functions.colors import convert_rgb_xy, convert_xy
+from threading import Event
 from time import sleep
 from zeroconf import IPVersion, ServiceBrowser, ServiceStateChange, Zeroconf
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 logging = logManager.logger.get_logger(__name__)
 
@@ -34,59 +35,93 @@ def on_mdns_discover(zeroconf: Zeroconf, service_type: str, name: str, state_cha
             discovered_lights.append([addresses[0], name])
 
 
-def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str]) -> None:
+def device_lights(ip: str, mdns_name: str) -> List[Dict[str, Any]]:
+    """
+    Read the segments of a WLED device, each one is a light.
+
+    Args:
+        ip: IP address of the device
+        mdns_name: mDNS name of the device
+
+    Returns:
+        The lights of the device
+    """
+    lights = []
+    try:
+        wled_device = WledDevice(ip, mdns_name)
+        logging.info("<WLED> Found device: %s with %d segments",
+                     mdns_name, wled_device.segmentCount)
+        modelid = "LST002"  # Gradient Strip
+        for segment_id in range(wled_device.segmentCount):
+            lights.append({
+                "protocol": "wled",
+                "name": f"{wled_device.name}_seg{segment_id}",
+                "modelid": modelid,
+                "protocol_cfg": {
+                    "ip": wled_device.ip,
+                    "ledCount": wled_device.segments[segment_id]["len"],
+                    "mdns_name": mdns_name,
+                    "mac": wled_device.mac,
+                    "segmentId": segment_id,
+                    "segment_start": wled_device.segments[segment_id]["start"],
+                    "udp_port": wled_device.udpPort
+                }
+            })
+    except Exception as e:
+        logging.error("<WLED> Error discovering device: %s", e)
+    return lights
+
+
+def probe(ip: str) -> List[Dict[str, Any]]:
+    """
+    Probe one address for a WLED device.
+
+    Args:
+        ip: IP address to probe
+
+    Returns:
+        The lights of the device, empty when it is not a WLED device
+    """
+    try:
+        response = session.get(
+            f"http://{ip}/json/info", timeout=3)
+        if response.status_code == 200:
+            json_resp = response.json()
+            if json_resp['brand'] == "WLED":
+                return device_lights(ip, json_resp['name'])
+    except Exception:
+        logging.debug("<WLED> ip %s is unknown device", ip)
+    return []
+
+
+def discover(detectedLights: List[Dict[str, Any]], device_ips: List[str], scanned: Optional[Event] = None) -> None:
     """
     Discover WLED devices using mDNS and fallback to device IPs if necessary.
     
     Args:
         detectedLights: List to store detected lights
-        device_ips: List of device IPs to fallback to
+        device_ips: List of device IPs to fallback to, may still be filled by a running network scan
+        scanned: Set once the scan filled device_ips, the mDNS browse runs meanwhile
     """
     logging.info('<WLED> discovery started')
+    discovered_lights.clear()
     ip_version = IPVersion.V4Only
     zeroconf = Zeroconf(ip_version=ip_version)
     services = "_http._tcp.local."
     browser = ServiceBrowser(zeroconf, services, handlers=[on_mdns_discover])
     sleep(2)
+    browser.cancel()
+    zeroconf.close()
     if not discovered_lights:
         logging.info(
             "<WLED> Nothing found using mDNS, trying device_ips method...")
-        for ip in device_ips:
-            try:
-                response = requests.get(
-                    f"http://{ip}/json/info", timeout=3)
-                if response.status_code == 200:
-                    json_resp = response.json()
-                    if json_resp['brand'] == "WLED":
-                        discovered_lights.append([ip, json_resp['name']])
-            except Exception as e:
-                logging.debug("<WLED> ip %s is unknown device", ip)
+        if scanned is not None:
+            scanned.wait()
+        detectedLights.extend(probeAll(probe, device_ips))
+        return
 
-    lights = []
-    for device in discovered_lights:
-        try:
-            wled_device = WledDevice(device[0], device[1])
-            logging.info("<WLED> Found device: %s with %d segments",
-                         device[1], wled_device.segmentCount)
-            modelid = "LST002"  # Gradient Strip
-            for segment_id in range(wled_device.segmentCount):
-                lights.append({
-                    "protocol": "wled",
-                    "name": f"{wled_device.name}_seg{segment_id}",
-                    "modelid": modelid,
-                    "protocol_cfg": {
-                        "ip": wled_device.ip,
-                        "ledCount": wled_device.segments[segment_id]["len"],
-                        "mdns_name": device[1],
-                        "mac": wled_device.mac,
-                        "segmentId": segment_id,
-                        "segment_start": wled_device.segments[segment_id]["start"],
-                        "udp_port": wled_device.udpPort
-                    }
-                })
-            detectedLights.extend(lights)
-        except Exception as e:
-            logging.error("<WLED> Error discovering device: %s", e)
+    for lights in probePool.map(lambda device: device_lights(*device), list(discovered_lights)):
+        detectedLights.extend(lights)
 
 
 def set_light(light: Dict[str, Any], data: Dict[str, Any]) -> None:
@@ -105,8 +140,11 @@ def set_light(light: Dict[str, Any], data: Dict[str, Any]) -> None:
         Connections[ip] = wled_device
 
     if "lights" in data:
-        destructured_data = data["lights"][list(data["lights"].keys())[0]]
-        send_light_data(wled_device, light, destructured_data)
+        # the segments of the device keyed by segment id, all sent in one request
+        segments = [build_segment(wled_device, segmentId, segmentData) for segmentId, segmentData in data["lights"].items()]
+        segments = [seg for seg in segments if seg is not None]
+        if segments:
+            wled_device.send_json({"seg": segments})
     else:
         send_light_data(wled_device, light, data)
 
@@ -120,9 +158,25 @@ def send_light_data(wled_device: 'WledDevice', light: Dict[str, Any], data: Dict
         light: Light configuration
         data: Data to send to the light
     """
-    state = {}
+    seg = build_segment(wled_device, light.protocol_cfg['segmentId'], data)
+    if seg is not None:
+        wled_device.send_json({"seg": [seg]})
+
+
+def build_segment(wled_device: 'WledDevice', segmentId: int, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Build the WLED segment state for a v1 light state.
+    
+    Args:
+        wled_device: WledDevice instance
+        segmentId: The segment of the light
+        data: Data to send to the light
+        
+    Returns:
+        The segment state, None when the state was handled already (alert)
+    """
     seg = {
-        "id": light.protocol_cfg['segmentId'],
+        "id": segmentId,
         "on": True
     }
     for key, value in data.items():
@@ -138,13 +192,12 @@ def send_light_data(wled_device: 'WledDevice', light: Dict[str, Any], data: Dict
             color = convert_xy(value[0], value[1], 255)
             seg["col"] = [[color[0], color[1], color[2]]]
         elif key == "alert" and value != "none":
-            state = wled_device.get_seg_state(light.protocol_cfg['segmentId'])
-            wled_device.set_bri_seg(0, light.protocol_cfg['segmentId'])
+            state = wled_device.get_seg_state(segmentId)
+            wled_device.set_bri_seg(0, segmentId)
             sleep(0.6)
-            wled_device.set_bri_seg(state["bri"], light.protocol_cfg['segmentId'])
-            return
-    state["seg"] = [seg]
-    wled_device.send_json(state)
+            wled_device.set_bri_seg(state["bri"], segmentId)
+            return None
+    return seg
 
 
 def get_light_state(light: Dict[str, Any]) -> Dict[str, Any]:
@@ -268,7 +321,7 @@ class WledDevice:
         Returns:
             Current state of the device
         """
-        with urllib.request.urlopen(f"{self.url}/json") as resp:
+        with urllib.request.urlopen(f"{self.url}/json", timeout=3) as resp:
             return json.loads(resp.read())
 
     def get_seg_state(self, seg: int) -> Dict[str, Any]:
@@ -1,11 +1,103 @@
+import json
 import logManager
 import yeelight
+from collections import deque
 from functions.colors import convert_rgb_xy, convert_xy
-from time import sleep
-from typing import List, Dict, Any
+from functions.deviceConnections import DeviceConnection, getConnection
+from threading import Timer
+from time import monotonic, sleep
+from typing import Deque, List, Dict, Any, Optional
 
 logging = logManager.logger.get_logger(__name__)
-Connections = {}
+
+PORT = 55443
+QUOTA = 60  # commands a bulb accepts per minute
+PROPERTIES = ["power", "bright", "ct", "rgb", "hue", "sat", "color_mode", "bg_power", "bg_bright", "bg_ct", "bg_rgb", "bg_hue", "bg_sat"]
+
+
+class YeelightConnection(DeviceConnection):
+    """
+    Persistent control connection to a bulb, keeping the bulb's command quota.
+
+    Commands over the quota are kept, only the latest parameters per method, and sent by a timer once the
+    quota frees up, so callers never wait on the quota.
+    """
+    def __init__(self, ip: str, port: int) -> None:
+        super().__init__(ip, port)
+        self.sent: Deque[float] = deque()  # times of the commands sent in the last minute
+        self.nextId = 1
+        self.pending: Dict[str, List[Any]] = {}  # method -> latest parameters not sent yet
+        self.timer: Optional[Timer] = None
+
+    def _quotaWait(self) -> float:
+        now = monotonic()
+        while self.sent and now - self.sent[0] >= 60:
+            self.sent.popleft()
+        return 0 if len(self.sent) < QUOTA else 60 - (now - self.sent[0])
+
+    def _nextId(self) -> int:
+        self.sent.append(monotonic())
+        commandId = self.nextId
+        self.nextId += 1
+        return commandId
+
+    def commands(self, commands: Dict[str, List[Any]]) -> None:
+        """
+        Send commands back to back as far as the bulb quota allows, the rest is sent later.
+
+        Args:
+            commands (Dict[str, List[Any]]): The parameters by method.
+        """
+        with self.lock:
+            for method, params in commands.items():
+                self.pending.pop(method, None)  # the newest command goes last
+                self.pending[method] = params
+            self._flush()
+
+    def _flush(self) -> None:
+        """Send the pending commands the quota allows and arm the timer for the rest, the lock must be held."""
+        messages = []
+        while self.pending:
+            wait = self._quotaWait()
+            if wait > 0:
+                if self.timer is None:
+                    logging.debug(f"Yeelight {self.address[0]} quota used up, sending {len(self.pending)} commands in {round(wait, 1)} s")
+                    self.timer = Timer(wait, self._flushLater)
+                    self.timer.daemon = True
+                    self.timer.start()
+                break
+            method = next(iter(self.pending))
+            messages.append((json.dumps({"id": self._nextId(), "method": method, "params": self.pending.pop(method)}) + "\r\n").encode())
+        if messages:
+            self.drain()
+            self._send(b"".join(messages))
+
+    def _flushLater(self) -> None:
+        with self.lock:
+            self.timer = None
+            try:
+                self._flush()
+            except OSError as e:
+                logging.warning(f"Yeelight {self.address[0]} delayed commands failed: {e}")
+
+    def getProperties(self) -> Dict[str, Optional[str]]:
+        """
+        Read the bulb properties, waiting outside the lock when the quota is used up.
+
+        Returns:
+            Dict[str, Optional[str]]: The property values, None when the bulb does not have the property.
+        """
+        while True:
+            with self.lock:
+                wait = self._quotaWait()
+                if wait <= 0:
+                    commandId = self._nextId()
+                    reply = self.request({"id": commandId, "method": "get_prop", "params": PROPERTIES}, lambda reply: reply.get("id") == commandId)
+                    break
+            sleep(wait)
+        if "error" in reply:
+            raise ConnectionError(f"Yeelight error: {reply['error']}")
+        return {name: value if value != "" else None for name, value in zip(PROPERTIES, reply["result"])}
 
 
 def discover(detectedLights: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -39,23 +131,17 @@ def discover(detectedLights: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return detectedLights
 
 
-def connect(light: Dict[str, Any]) -> yeelight.Bulb:
+def connect(light: Any) -> YeelightConnection:
     """
-    Connect to a Yeelight bulb.
+    Return the persistent connection to a Yeelight bulb.
 
     Args:
-        light (Dict[str, Any]): Light configuration dictionary.
+        light (Any): The light object.
 
     Returns:
-        yeelight.Bulb: Connected Yeelight bulb object.
+        YeelightConnection: The connection, shared by the main and background light of a bulb.
     """
-    ip = light["protocol_cfg"]["ip"]
-    if ip in Connections:
-        c = Connections[ip]
-    else:
-        c = yeelight.Bulb(ip)
-        Connections[ip] = c
-    return c
+    return getConnection("yeelight", light.protocol_cfg["ip"], PORT, YeelightConnection)
 
 def set_light(light: Dict[str, Any], data: Dict[str, Any]) -> None:
     """
@@ -98,10 +184,7 @@ def set_light(light: Dict[str, Any], data: Dict[str, Any]) -> None:
 
     # yeelight uses different functions for each action, so it has to check for each function
     # see page 9 http://www.yeelight.com/download/Yeelight_Inter-Operation_Spec.pdf
-    # check if hue wants to change brightness
-    for key, value in payload.items():
-        c.send_command(key, value)
-        sleep(0.4)
+    c.commands(payload)
 
 def hex_to_rgb(value: str) -> List[int]:
     """
@@ -143,7 +226,7 @@ def get_light_state(light: Dict[str, Any]) -> Dict[str, Any]:
     """
     c = connect(light)
     state = {}
-    light_data = c.get_properties()
+    light_data = c.getProperties()
     prefix = ''
     if light.protocol_cfg["backlight"]:
         prefix = "bg_"
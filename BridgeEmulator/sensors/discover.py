@@ -1,6 +1,6 @@
 import logManager
 import configManager
-from HueObjects import Sensor
+from HueObjects import Sensor, invalidateDeviceIndex
 import random
 from functions.core import nextFreeId
 from typing import Dict, Any, Optional
@@ -46,6 +46,7 @@ def addHueMotionSensor(name: str, protocol: str, protocol_cfg: Dict[str, Any]) -
                 "uniqueid": uniqueid + sensor_suffix
             }
             bridgeConfig["sensors"][sensor_id] = Sensor.Sensor(sensor_data)
+        invalidateDeviceIndex()
         logging.info(f"Successfully added Hue motion sensor '{name}' with unique ID '{uniqueid}'.")
     except KeyError as e:
         logging.error(f"Key error when adding Hue motion sensor '{name}': {e}")
@@ -79,6 +80,7 @@ def addHueSwitch(uniqueid: str, sensorsType: str) -> Optional[Sensor.Sensor]:
             "uniqueid": uniqueid
         }
         bridgeConfig["sensors"][new_sensor_id] = Sensor.Sensor(deviceData)
+        invalidateDeviceIndex()
         logging.info(f"Successfully added Hue switch '{deviceData['name']}' with unique ID '{uniqueid}'.")
         return bridgeConfig["sensors"][new_sensor_id]
     except KeyError as e:
@@ -111,6 +113,7 @@ def addHueRotarySwitch(protocol_cfg: Dict[str, Any]) -> None:
                 "uniqueid": uniqueid + sensor_suffix
             }
             bridgeConfig["sensors"][sensor_id] = Sensor.Sensor(sensor_data)
+        invalidateDeviceIndex()
         logging.info(f"Successfully added Hue rotary switch with unique ID '{uniqueid}'.")
     except KeyError as e:
         logging.error(f"Key error when adding Hue rotary switch: {e}")
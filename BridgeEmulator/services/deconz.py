@@ -1,28 +1,56 @@
 import json
 import weakref
 from datetime import datetime, timezone
-from threading import Thread
+from threading import Lock, Thread
 from time import sleep
-from typing import Union, Dict, Any
+from typing import Union, Dict, Any, Optional, Tuple
 
 import requests
 from ws4py.client.threadedclient import WebSocketClient
 
 import configManager
+import HueObjects
 import logManager
 from HueObjects import Sensor
 from functions.core import nextFreeId
+from functions.messagePipeline import MessagePipeline
 from functions.rules import rulesProcessor
 from sensors.discover import addHueMotionSensor
 
 bridgeConfig = configManager.bridgeConfig.yaml_config
 logging = logManager.logger.get_logger(__name__)
-devicesIds: Dict[str, Dict[str, weakref.ReferenceType]] = {"sensors": {}, "lights": {}}
+devicesIds: Dict[str, Dict[str, weakref.ReferenceType]] = {"sensors": {}, "lights": {}}  # deconzId -> device
+lightSensors: Dict[str, weakref.ReferenceType] = {}  # uniqueid -> light level sensor paired with a presence sensor
+indexVersion = -1  # HueObjects.deviceIndexVersion the indexes were built for
+indexLock = Lock()
+eventPipeline: Optional[MessagePipeline] = None  # created when the websocket client starts
+rulesPipeline: Optional[MessagePipeline] = None  # single worker applying sensor events and running the rules, which are not thread safe
 motionSensors = ["TRADFRI motion sensor", "lumi.sensor_motion", "lumi.vibration.aq1"]
 
+def refreshDeviceIndex() -> None:
+    """
+    Rebuild the deconzId and light sensor pairing indexes when lights or sensors were added, removed or readdressed.
+    """
+    global devicesIds, lightSensors, indexVersion
+    if indexVersion == HueObjects.deviceIndexVersion:
+        return
+    with indexLock:
+        version = HueObjects.deviceIndexVersion
+        if indexVersion == version:
+            return
+        devices: Dict[str, Dict[str, weakref.ReferenceType]] = {"sensors": {}, "lights": {}}
+        pairs = {}
+        for resource in devices:
+            for device in list(bridgeConfig[resource].values()):
+                if device.protocol == "deconz" and "deconzId" in device.protocol_cfg:
+                    devices[resource].setdefault(device.protocol_cfg["deconzId"], weakref.ref(device))
+                if resource == "sensors" and device.type == "ZLLLightLevel" and device.uniqueid:
+                    pairs.setdefault(device.uniqueid, weakref.ref(device))
+        devicesIds, lightSensors, indexVersion = devices, pairs, version
+
 def getObject(resource: str, id: str) -> Union[Sensor.Sensor, bool]:
     """
-    Retrieve an object from the cache or bridge configuration.
+    Retrieve an object from the deconzId index.
 
     Args:
         resource (str): The type of resource (e.g., 'sensors', 'lights').
@@ -31,17 +59,27 @@ def getObject(resource: str, id: str) -> Union[Sensor.Sensor, bool]:
     Returns:
         Union[Sensor.Sensor, bool]: The sensor object if found, otherwise False.
     """
-    if id in devicesIds[resource]:
-        logging.debug(f"Cache Hit for {resource} {id}")
-        return devicesIds[resource][id]()
-    else:
-        for key, device in bridgeConfig[resource].items():
-            if device.protocol == "deconz" and device.protocol_cfg["deconzId"] == id:
-                devicesIds[resource][id] = weakref.ref(device)
-                logging.debug(f"Cache Miss for {resource} {id}")
-                return device
+    refreshDeviceIndex()
+    device_ref = devicesIds[resource].get(id)
+    device = device_ref() if device_ref else None
+    if device is None:
         logging.debug(f"Device not found for {resource} {id}")
         return False
+    return device
+
+def findLightSensor(sensor: Sensor.Sensor) -> Optional[Sensor.Sensor]:
+    """
+    Find the light level sensor paired with a presence sensor.
+
+    Args:
+        sensor (Sensor.Sensor): The presence sensor.
+
+    Returns:
+        Optional[Sensor.Sensor]: The light level sensor, if any.
+    """
+    refreshDeviceIndex()
+    sensor_ref = lightSensors.get(sensor.uniqueid[:-1] + "0")
+    return sensor_ref() if sensor_ref else None
 
 def longPressButton(sensor: Sensor.Sensor, buttonevent: int) -> None:
     """
@@ -125,6 +163,122 @@ def scanDeconz() -> None:
                 logging.info(f"Register new sensor {sensor['name']}")
                 sensor.update({"protocol": "deconz", "protocol_cfg": {"deconzId": id}, "id_v1": new_sensor_id})
                 bridgeConfig["sensors"][new_sensor_id] = Sensor.Sensor(sensor)
+    HueObjects.invalidateDeviceIndex()
+
+def decodeMessage(m: Any) -> Optional[Dict[str, Any]]:
+    """
+    Decode a websocket frame, the only stage running on the websocket thread.
+
+    Args:
+        m (Any): The received frame.
+
+    Returns:
+        Optional[Dict[str, Any]]: The event, or None when it is not a sensor or light event.
+    """
+    logging.debug(m)
+    try:
+        message = json.loads(str(m))
+    except ValueError as e:
+        logging.error(f"Unable to decode the message: {e}")
+        return None
+    if not isinstance(message, dict) or message.get("r") not in devicesIds or "id" not in message:
+        return None
+    return message
+
+def processEvent(message: Dict[str, Any]) -> None:
+    """
+    Look up the device of an event. Light events are applied here, on the event pipeline workers, sensor
+    events are queued to the rules stage which applies them.
+
+    Args:
+        message (Dict[str, Any]): The decoded event.
+    """
+    try:
+        device = getObject(message["r"], message["id"])
+        if not device:
+            return
+        if message["r"] == "sensors":
+            rulesPipeline.submit("rules", (device, message))
+        elif "state" in message and "colormode" not in message["state"]:
+            device.state.update(message["state"])
+    except Exception as e:
+        logging.error(f"Unable to process the request: {e}")
+
+def applySensorEvent(bridgeSensor: Sensor.Sensor, message: Dict[str, Any]) -> Optional[datetime]:
+    """
+    Apply a deconz sensor event to the bridge sensor and its paired light level sensor.
+
+    Args:
+        bridgeSensor (Sensor.Sensor): The sensor the event belongs to.
+        message (Dict[str, Any]): The decoded event.
+
+    Returns:
+        Optional[datetime]: The time the state changed, None when no state was applied.
+    """
+    if not bridgeSensor.config["on"]:
+        return None
+    if "config" in message:
+        bridgeSensor.config.update(message["config"])
+        return None
+    if not message.get("state"):
+        return None
+    if bridgeSensor.modelid == "SML001" and "lightSensor" in bridgeSensor.protocol_cfg:
+        lightSensor = findLightSensor(bridgeSensor)
+        if lightSensor:
+            if lightSensor.protocol_cfg["lightSensor"] == "no":
+                lightSensor.state["dark"] = True
+            else:
+                lightSensor.state["dark"] = not bridgeConfig["sensors"]["1"].state["daylight"]
+            lightSensor.state["lightlevel"] = 6000 if lightSensor.state["dark"] else 25000
+            lightSensor.state["daylight"] = not lightSensor.state["dark"]
+            lightSensor.state["lastupdated"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            if "dark" in message["state"]:
+                del message["state"]["dark"]
+
+    if bridgeSensor.modelid == "SML001" and "lightlevel" in message["state"]:
+        message["state"]["dark"] = message["state"]["lightlevel"] <= bridgeSensor.config["tholddark"]
+
+    bridgeSensor.state.update(message["state"])
+    current_time = datetime.now()
+    for key in message["state"].keys():
+        bridgeSensor.dxState[key] = current_time
+    return current_time
+
+def dispatchRules(event: Tuple[Sensor.Sensor, Dict[str, Any]]) -> None:
+    """
+    Apply a sensor event, run the rules for it and start the long press and alarm handlers. Runs on the single
+    rules pipeline worker, the next sensor event is only applied once the rules of this one ran, so the dx
+    conditions and state values the rules compare are the ones of this event.
+
+    Args:
+        event (Tuple[Sensor.Sensor, Dict[str, Any]]): The sensor and its decoded event.
+    """
+    bridgeSensor, message = event
+    current_time = applySensorEvent(bridgeSensor, message)
+    if current_time is None:
+        return
+    state = message["state"]
+    rulesProcessor(bridgeSensor, current_time)
+
+    if "buttonevent" in state and bridgeSensor.modelid in ["TRADFRI remote control", "RWL021", "TRADFRI on/off switch"]:
+        if state["buttonevent"] in [1001, 2001, 3001, 4001, 5001]:
+            Thread(target=longPressButton, args=[bridgeSensor, state["buttonevent"]]).start()
+    if "presence" in state and state["presence"] and bridgeConfig["config"]["alarm"]["enabled"] and bridgeConfig["config"]["alarm"]["lasttriggered"] + 300 < datetime.now().timestamp():
+        logging.info("Alarm triggered, sending email...")
+        Thread(target=sendAlarm, args=[bridgeSensor.name]).start()
+        bridgeConfig["config"]["alarm"]["lasttriggered"] = int(datetime.now().timestamp())
+
+def sendAlarm(sensorName: str) -> None:
+    """
+    Send the alarm email for a sensor.
+
+    Args:
+        sensorName (str): The name of the sensor that triggered the alarm.
+    """
+    try:
+        requests.post("https://diyhue.org/cdn/mailNotify.php", json={"to": bridgeConfig["config"]["alarm"]["email"], "sensor": sensorName})
+    except requests.RequestException as e:
+        logging.error(f"Failed to send alarm email: {e}")
 
 def websocketClient() -> None:
     """
@@ -134,6 +288,12 @@ def websocketClient() -> None:
     if "websocketport" not in bridgeConfig["config"]["deconz"]:
         return
 
+    global eventPipeline, rulesPipeline
+    if eventPipeline is None:
+        # button and presence events must not be lost
+        rulesPipeline = MessagePipeline("deconz rules", dispatchRules, workers=1, blocking=True)
+        eventPipeline = MessagePipeline("deconz", processEvent, blocking=True)
+
     class EchoClient(WebSocketClient):
         def opened(self) -> None:
             self.send("hello")
@@ -143,57 +303,9 @@ def websocketClient() -> None:
             del bridgeConfig["config"]["deconz"]["websocketport"]
 
         def received_message(self, m: Any) -> None:
-            logging.info(m)
-            message = json.loads(str(m))
-            try:
-                if message["r"] == "sensors":
-                    bridgeSensor = getObject("sensors", message["id"])
-                    if bridgeSensor and "config" in message and bridgeSensor.config["on"]:
-                        bridgeSensor.config.update(message["config"])
-                    elif bridgeSensor and "state" in message and message["state"] and bridgeSensor.config["on"]:
-                        if bridgeSensor.modelid == "SML001" and "lightSensor" in bridgeSensor.protocol_cfg:
-                            lightSensor = None
-                            for key, sensor in bridgeConfig["sensors"].items():
-                                if sensor.type == "ZLLLightLevel" and sensor.uniqueid == bridgeSensor.uniqueid[:-1] + "0":
-                                    lightSensor = sensor
-                                    break
-
-                            if lightSensor:
-                                if lightSensor.protocol_cfg["lightSensor"] == "no":
-                                    lightSensor.state["dark"] = True
-                                else:
-                                    lightSensor.state["dark"] = not bridgeConfig["sensors"]["1"].state["daylight"]
-                                lightSensor.state["lightlevel"] = 6000 if lightSensor.state["dark"] else 25000
-                                lightSensor.state["daylight"] = not lightSensor.state["dark"]
-                                lightSensor.state["lastupdated"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
-                                if "dark" in message["state"]:
-                                    del message["state"]["dark"]
-
-                        if bridgeSensor.modelid == "SML001" and "lightlevel" in message["state"]:
-                            message["state"]["dark"] = message["state"]["lightlevel"] <= bridgeSensor.config["tholddark"]
-
-                        bridgeSensor.state.update(message["state"])
-                        current_time = datetime.now()
-                        for key in message["state"].keys():
-                            bridgeSensor.dxState[key] = current_time
-                        rulesProcessor(bridgeSensor, current_time)
-
-                        if "buttonevent" in message["state"] and bridgeSensor.modelid in ["TRADFRI remote control", "RWL021", "TRADFRI on/off switch"]:
-                            if message["state"]["buttonevent"] in [1001, 2001, 3001, 4001, 5001]:
-                                Thread(target=longPressButton, args=[bridgeSensor, message["state"]["buttonevent"]]).start()
-                        if "presence" in message["state"] and message["state"]["presence"] and bridgeConfig["config"]["alarm"]["enabled"] and bridgeConfig["config"]["alarm"]["lasttriggered"] + 300 < datetime.now().timestamp():
-                            logging.info("Alarm triggered, sending email...")
-                            try:
-                                requests.post("https://diyhue.org/cdn/mailNotify.php", json={"to": bridgeConfig["config"]["alarm"]["email"], "sensor": bridgeSensor.name})
-                            except requests.RequestException as e:
-                                logging.error(f"Failed to send alarm email: {e}")
-                            bridgeConfig["config"]["alarm"]["lasttriggered"] = int(datetime.now().timestamp())
-                elif message["r"] == "lights":
-                    bridgeLightId = getObject("lights", message["id"])
-                    if bridgeLightId and "state" in message and "colormode" not in message["state"]:
-                        bridgeLightId.state.update(message["state"])
-            except Exception as e:
-                logging.error(f"Unable to process the request: {e}")
+            message = decodeMessage(m)
+            if message is not None:
+                eventPipeline.submit(message["r"] + "/" + message["id"], message)
 
     try:
         ws = EchoClient(f'ws://{bridgeConfig["config"]["deconz"]["deconzHost"]}:{bridgeConfig["config"]["deconz"]["websocketport"]}')
@@ -1,7 +1,6 @@
 from time import sleep
 import socket
 import json
-import uuid
 from subprocess import Popen, PIPE
 from typing import Dict, List, Tuple, Union, Optional
 
@@ -12,6 +11,7 @@ import paho.mqtt.publish as publish
 import time
 
 from functions.colors import convert_rgb_xy, convert_xy
+from HueObjects import getV2Object, bumpStateVersion
 
 logging = logManager.logger.get_logger(__name__)
 bridgeConfig = configManager.bridgeConfig.yaml_config
@@ -54,9 +54,9 @@ def getObject(v2uuid: str) -> Optional[object]:
     Returns:
         Optional[object]: The light object if found, None otherwise.
     """
-    for key, obj in bridgeConfig["lights"].items():
-        if str(uuid.uuid5(uuid.NAMESPACE_URL, obj.id_v2 + 'entertainment')) == v2uuid:
-            return obj
+    obj = getV2Object(v2uuid)
+    if obj is not None:
+        return obj
     logging.info("Element not found!")
     return None
 
@@ -350,6 +350,7 @@ def entertainmentService(group: object, user: object) -> None:
         bridgeConfig["groups"][group.id_v1].stream["active"] = False
         for light in group.lights:
             bridgeConfig["lights"][light().id_v1].state["mode"] = "homeautomation"
+        bumpStateVersion()
         logging.info("Entertainment service stopped")
 
 def enableMusic(ip: str, host_ip: str) -> None:
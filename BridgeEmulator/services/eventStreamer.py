@@ -1,25 +1,66 @@
-import json
+from collections import deque
+from threading import Condition
 from time import sleep, time
+from typing import Deque, List, Tuple
 
 from flask import Response, stream_with_context, Blueprint
 
 import HueObjects
 import logManager
+from functions.jsonEncoder import dumps
 
 logging = logManager.logger.get_logger(__name__)
 stream = Blueprint('stream', __name__)
 
+class EventBroadcaster:
+    """
+    Encode every event once and hand the same frame to all connected event stream clients.
+    """
+    def __init__(self, size: int = 1000) -> None:
+        self.frames: Deque[Tuple[int, bytes]] = deque(maxlen=size)
+        self.sequence = 0
+        self._condition = Condition()
+
+    def publish(self) -> None:
+        """
+        Move the pending events from the HueObjects event stream to the frame buffer.
+        """
+        if len(HueObjects.eventstream) == 0:
+            return
+        events = HueObjects.eventstream
+        HueObjects.eventstream = []
+        now = int(time())
+        with self._condition:
+            for index, event in enumerate(events):
+                logging.debug(event)
+                self.sequence += 1
+                self.frames.append((self.sequence, b"id: %d:%d\ndata: " % (now, index) + dumps([event]) + b"\n\n"))
+            self._condition.notify_all()
+
+    def framesAfter(self, sequence: int, timeout: float) -> List[Tuple[int, bytes]]:
+        """
+        Return the frames newer than a sequence number, waiting for new ones up to timeout seconds.
+
+        Args:
+            sequence (int): The last sequence number the client received.
+            timeout (float): The maximum wait in seconds.
+
+        Returns:
+            List[Tuple[int, bytes]]: The sequence numbers and encoded frames.
+        """
+        with self._condition:
+            if self.sequence <= sequence:
+                self._condition.wait(timeout)
+            return [frame for frame in self.frames if frame[0] > sequence]
+
+broadcaster = EventBroadcaster()
+
 def messageBroker() -> None:
     """
-    Continuously checks for events in the HueObjects event stream and logs them.
-    Clears the event stream after processing.
+    Continuously moves the events from the HueObjects event stream to the broadcaster.
     """
     while True:
-        if len(HueObjects.eventstream) > 0:
-            for event in HueObjects.eventstream:
-                logging.debug(event)
-            sleep(0.3)  # ensure all devices connected receive the events
-            HueObjects.eventstream = []
+        broadcaster.publish()
         sleep(0.2)
 
 @stream.route('/eventstream/clip/v2')
@@ -32,19 +73,17 @@ def streamV2Events() -> Response:
     """
     def generate():
         """
-        Generator function that yields events from the HueObjects event stream.
+        Generator function that yields the encoded events published after the client connected.
 
         Yields:
-            str: Formatted event data.
+            bytes: Formatted event data.
         """
-        yield f": hi\n\n"
+        yield b": hi\n\n"
+        sequence = broadcaster.sequence
         while True:
             try:
-                if len(HueObjects.eventstream) > 0:
-                    for index, messages in enumerate(HueObjects.eventstream):
-                        yield f"id: {int(time()) }:{index}\ndata: {json.dumps([messages], separators=(',', ':'))}\n\n"
-                    HueObjects.eventstream = []
-                sleep(0.2)
+                for sequence, frame in broadcaster.framesAfter(sequence, 1):
+                    yield frame
             except GeneratorExit:
                 logging.info("Client closed the connection.")
                 break
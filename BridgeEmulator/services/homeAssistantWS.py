@@ -1,129 +1,310 @@
+import asyncio
 import json
+import ssl
 import threading
-import time
-from typing import Any, Dict, List
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
 
-from ws4py.client.threadedclient import WebSocketClient
+import websockets
 
+import HueObjects
 import logManager
+from functions import asyncLoop, metrics
 
 logging = logManager.logger.get_logger(__name__)
 
 discovery_timeout_seconds = 60
-discovery_result = threading.Event()
-next_connection_error_log = 0
-logging_backoff = 2  # 2 Second back off
+max_backoff_seconds = 60  # reconnect delay doubles from 1 s up to this
+mapping_check_seconds = 5  # how often the subscribed entities are compared with the mapped lights
 homeassistant_token = ''
 homeassistant_url = 'ws://127.0.0.1:8123/api/websocket'
 homeassistant_ws_client = None
 include_by_default = False
 use_https = False
+client_lock = threading.Lock()
 
 latest_states: Dict[str, Dict[str, Any]] = {}
 
 
-class HomeAssistantClient(WebSocketClient):
-    """
-    WebSocket client for Home Assistant integration.
+class HomeAssistantError(Exception):
+    """A request was answered with an error by Home Assistant."""
+
+
+class HomeAssistantClient:
     """
-    message_id = 1
-    id_to_type: Dict[int, str] = {}
+    WebSocket client for Home Assistant integration, running on the shared asyncio loop of functions.asyncLoop.
 
-    def opened(self) -> None:
-        """Called when the WebSocket connection is opened."""
-        logging.info("Home Assistant WebSocket Connection Opened")
+    Requests are pipelined and their results matched by id. Service calls queued for an entity before they
+    are sent are coalesced into one, state_changed events are applied to latest_states once per received frame.
+    """
+    def __init__(self, url: str, token: str) -> None:
+        self.url = url
+        self.token = token
+        self.loop = asyncLoop.getLoop()
+        self.message_id = 1
+        self.pending: Dict[int, Tuple[str, Optional[asyncio.Future], float]] = {}  # id -> (type, future, sent at)
+        self.changes: Dict[str, Dict[str, Any]] = {}  # entity_id -> service call waiting to be sent
+        self.counters = {"calls": 0, "coalesced": 0, "errors": 0, "reconnects": 0, "events_received": 0, "events_used": 0}
+        self.subscription_id: Optional[int] = None
+        self.subscribed_entities: Optional[set] = None  # None while subscribed to every state_changed event
+        self.entities_supported: Optional[bool] = None  # subscribe_entities known to work, unknown yet
+        self.mapping_version = -1
+        self.latency: Dict[str, List[float]] = {}  # request type -> [count, total ms, max ms]
+        self._websocket: Any = None
+        self._ready = asyncio.Event()  # authenticated and subscribed
+        self._changed = asyncio.Event()
+        asyncio.run_coroutine_threadsafe(self._maintain(), self.loop)
+        metrics.register("homeassistant", self.metrics)
+
+    async def _maintain(self) -> None:
+        """Keeps the connection open, reconnecting with an exponential backoff."""
+        backoff = 1
+        while True:
+            try:
+                ssl_context = None
+                if self.url.startswith("wss"):
+                    ssl_context = ssl.create_default_context()
+                    ssl_context.check_hostname = False
+                    ssl_context.verify_mode = ssl.CERT_NONE
+                async with websockets.connect(self.url, ssl=ssl_context, max_size=None) as websocket:
+                    logging.info("Home Assistant WebSocket Connection Opened")
+                    await self._authenticate(websocket)
+                    self._websocket = websocket
+                    backoff = 1
+                    await self._serve(websocket)
+            except PermissionError as e:
+                logging.error(str(e))
+                backoff = max_backoff_seconds
+            except Exception as e:
+                logging.warning(f"Home Assistant Web Socket Client disconnected, retrying in {backoff} s: {e}")
+            self._disconnected()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff_seconds)
+            self.counters["reconnects"] += 1
+
+    async def _authenticate(self, websocket: Any) -> None:
+        json.loads(await websocket.recv())  # auth_required
+        logging.info("Home Assistant Web Socket Authorisation required")
+        await websocket.send(json.dumps({'type': 'auth', 'access_token': self.token}))
+        message = json.loads(await websocket.recv())
+        if message.get('type') != "auth_ok":
+            raise PermissionError(f"Home Assistant Web Socket Authorisation invalid: {message}")
+        logging.info("Home Assistant Web Socket Authorisation complete")
 
-    def closed(self, code: int, reason: str = None) -> None:
+    async def _serve(self, websocket: Any) -> None:
+        tasks = [asyncio.ensure_future(self._reader(websocket)), asyncio.ensure_future(self._writer(websocket))]
+        try:
+            try:
+                # let Home Assistant send several messages per frame, they are handled as one batch
+                await self._request(websocket, {"type": "supported_features", "features": {"coalesce_messages": 1}})
+            except HomeAssistantError:
+                pass  # older Home Assistant, one message per frame
+            await self._refresh_states(websocket)
+            self.subscription_id = None
+            self.mapping_version = HueObjects.deviceIndexVersion
+            await self._subscribe(websocket)
+            self._ready.set()
+            tasks.append(asyncio.ensure_future(self._watch_mapping(websocket)))
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _mapped_entities(self) -> set:
+        """Returns the entity ids of the diyHue lights backed by Home Assistant."""
+        import configManager
+        lights = configManager.bridgeConfig.yaml_config["lights"]
+        return {light.protocol_cfg["entity_id"] for light in list(lights.values()) if light.protocol == "homeassistant_ws" and "entity_id" in light.protocol_cfg}
+
+    async def _subscribe(self, websocket: Any) -> None:
         """
-        Called when the WebSocket connection is closed.
-
-        Args:
-            code (int): The close code.
-            reason (str, optional): The reason for closing. Defaults to None.
+        Subscribes to the state of the mapped entities only, falling back to every state_changed event when
+        Home Assistant does not support subscribe_entities.
         """
-        logging.info(
-            "Home Assistant WebSocket Connection Closed. Code: {} Reason: {}".format(code, reason))
+        if self.subscription_id is not None:
+            previous, self.subscription_id = self.subscription_id, None
+            try:
+                await self._request(websocket, {"type": "unsubscribe_events", "subscription": previous})
+            except HomeAssistantError:
+                pass
+        if self.entities_supported is not False:
+            entity_ids = self._mapped_entities()
+            self.subscribed_entities = entity_ids
+            if not entity_ids:
+                return  # an empty filter would mean every entity, subscribe once lights are mapped
+            try:
+                self.subscription_id = self.message_id  # events can arrive before the result is awaited
+                await self._request(websocket, {"type": "subscribe_entities", "entity_ids": sorted(entity_ids)})
+                self.entities_supported = True
+                logging.info(f"Home Assistant subscribed to {len(entity_ids)} entities")
+                return
+            except HomeAssistantError:
+                self.entities_supported = False
+                logging.info("Home Assistant has no subscribe_entities, subscribing to every state change")
+        self.subscribed_entities = None
+        self.subscription_id = self.message_id
+        await self._request(websocket, {"type": "subscribe_events", "event_type": "state_changed"})
+
+    async def _watch_mapping(self, websocket: Any) -> None:
+        """Renews the subscription when lights are added, removed or remapped."""
+        while True:
+            await asyncio.sleep(mapping_check_seconds)
+            if self.mapping_version == HueObjects.deviceIndexVersion or self.subscribed_entities is None:
+                continue
+            self.mapping_version = HueObjects.deviceIndexVersion
+            if self._mapped_entities() != self.subscribed_entities:
+                await self._subscribe(websocket)
+
+    def _disconnected(self) -> None:
+        logging.info("Home Assistant WebSocket Connection Closed")
+        self._ready.clear()
+        self._websocket = None
+        self._fail_pending()
         for home_assistant_state in latest_states.values():
             if 'state' in home_assistant_state:
                 home_assistant_state['state'] = 'unavailable'
 
-    def received_message(self, m: Any) -> None:
-        """
-        Called when a message is received from the WebSocket.
+    def _fail_pending(self) -> None:
+        for message_type, future, _ in self.pending.values():
+            if future is not None and not future.done():
+                future.set_exception(ConnectionError("Home Assistant connection closed"))
+        self.pending.clear()
 
-        Args:
-            m (Any): The received message.
-        """
+    async def _reader(self, websocket: Any) -> None:
         try:
-            message_text = m.data.decode(m.encoding)
-            message = json.loads(message_text)
-            message_type = message.get('type', None)
-            if message_type == "auth_required":
-                self.do_auth_required(message)
-            elif message_type == "auth_ok":
-                self.do_auth_complete()
-            elif message_type == "auth_invalid":
-                self.do_auth_invalid(message)
-            elif message_type == "result":
-                self.do_result(message)
-            elif message_type == "event":
-                self.do_event(message)
-            elif message_type == "pong":
-                self.do_pong(message)
-            else:
-                logging.warning("Unexpected message: {}".format(message))
-        except Exception as e:
-            logging.exception("Error processing received message: {}".format(e))
-
-    def do_auth_required(self, m: Dict[str, Any]) -> None:
+            await self._read(websocket)
+        finally:
+            self._fail_pending()  # nothing will answer them anymore
+
+    async def _read(self, websocket: Any) -> None:
+        async for frame in websocket:
+            try:
+                messages = json.loads(frame)
+            except ValueError:
+                logging.warning("Unexpected message: {}".format(frame))
+                continue
+            states = {}
+            for message in messages if isinstance(messages, list) else [messages]:
+                message_type = message.get('type', None)
+                if message_type == "result":
+                    self.do_result(message)
+                elif message_type == "event":
+                    if message.get('id') == self.subscription_id:
+                        self.do_event(message.get('event', {}), states)
+                elif message_type != "pong":
+                    logging.warning("Unexpected message: {}".format(message))
+            if states:
+                logging.debug("State updates received for {}".format(", ".join(states)))
+                latest_states.update(states)
+
+    def do_event(self, event: Dict[str, Any], states: Dict[str, Dict[str, Any]]) -> None:
         """
-        Handle authentication required message.
+        Collect the states carried by an event into the batch of the current frame.
 
         Args:
-            m (Dict[str, Any]): The message.
+            event (Dict[str, Any]): A state_changed event or a subscribe_entities event.
+            states (Dict[str, Dict[str, Any]]): The new states by entity id.
         """
-        logging.info("Home Assistant Web Socket Authorisation required")
-        payload = {
-            'type': 'auth',
-            'access_token': homeassistant_token
-        }
-        self._send(payload)
+        if 'event_type' in event:
+            self.counters["events_received"] += 1
+            new_state = event.get('data', {}).get('new_state')
+            if new_state is not None and self._should_include(new_state):
+                self.counters["events_used"] += 1
+                states[new_state['entity_id']] = new_state
+            return
+        # subscribe_entities sends compressed states: a(dded), c(hanged) as +/- diffs and r(emoved)
+        for entity_id, compressed in event.get('a', {}).items():
+            self.counters["events_received"] += 1
+            self.counters["events_used"] += 1
+            states[entity_id] = {"entity_id": entity_id, "state": compressed.get('s'), "attributes": compressed.get('a', {})}
+        for entity_id, diff in event.get('c', {}).items():
+            self.counters["events_received"] += 1
+            current = states.get(entity_id) or latest_states.get(entity_id)
+            if current is None:
+                continue
+            current = dict(current, attributes=dict(current.get('attributes', {})))
+            if 's' in diff.get('+', {}):
+                current['state'] = diff['+']['s']
+            current['attributes'].update(diff.get('+', {}).get('a', {}))
+            for attribute in diff.get('-', {}).get('a', []):
+                current['attributes'].pop(attribute, None)
+            self.counters["events_used"] += 1
+            states[entity_id] = current
+        for entity_id in event.get('r', []):
+            self.counters["events_received"] += 1
+            if entity_id in latest_states or entity_id in states:
+                self.counters["events_used"] += 1
+                states[entity_id] = dict(states.get(entity_id) or latest_states[entity_id], state='unavailable')
+
+    async def _writer(self, websocket: Any) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            changes, self.changes = self.changes, {}
+            for payload in changes.values():
+                await self._send(websocket, payload, "call_service")
+
+    async def _send(self, websocket: Any, payload: Dict[str, Any], type_of_call: str, future: Optional[asyncio.Future] = None) -> None:
+        payload['id'] = self.message_id
+        self.pending[self.message_id] = (type_of_call, future, monotonic())
+        self.message_id += 1
+        await websocket.send(json.dumps(payload))
+
+    async def _request(self, websocket: Any, payload: Dict[str, Any]) -> Any:
+        future = self.loop.create_future()
+        await self._send(websocket, payload, payload["type"], future)
+        return await future
+
+    async def _refresh_states(self, websocket: Any) -> None:
+        ha_states = await self._request(websocket, {'type': 'get_states'})
+        latest_states.clear()
+        for ha_state in ha_states:
+            if self._should_include(ha_state):
+                entity_id = ha_state.get('entity_id', None)
+                logging.info(f"Found {entity_id}")
+                latest_states[entity_id] = ha_state
 
-    def do_auth_invalid(self, message: Dict[str, Any]) -> None:
+    def do_result(self, message: Dict[str, Any]) -> None:
         """
-        Handle invalid authentication message.
+        Handle result messages from Home Assistant.
 
         Args:
             message (Dict[str, Any]): The message.
         """
-        logging.error(
-            "Home Assistant Web Socket Authorisation invalid: {}".format(message))
+        entry = self.pending.pop(message.get('id'), None)
+        if entry is None:
+            return
+        message_type, future, sent = entry
+        elapsed = (monotonic() - sent) * 1000
+        latency = self.latency.setdefault(message_type, [0, 0.0, 0.0])
+        latency[0] += 1
+        latency[1] += elapsed
+        latency[2] = max(latency[2], elapsed)
+        if not message.get('success', True):
+            self.counters["errors"] += 1
+            logging.warning(f"Home Assistant {message_type} failed: {message.get('error')}")
+            if future is not None and not future.done():
+                future.set_exception(HomeAssistantError(message.get('error')))
+        elif future is not None and not future.done():
+            future.set_result(message.get('result'))
+
+    def get_all_lights(self, timeout: float = discovery_timeout_seconds) -> None:
+        """
+        Request all light states from Home Assistant and wait for them.
 
-    def do_auth_complete(self) -> None:
-        """Handle successful authentication message."""
-        logging.info("Home Assistant Web Socket Authorisation complete")
-        self.get_all_lights()
-        self.subscribe_for_updates()
-
-    def get_all_lights(self) -> None:
-        """Request all light states from Home Assistant."""
-        discovery_result.clear()
-        payload = {
-            'type': 'get_states'
-        }
-        self._send_with_id(payload, "getstates")
-
-    def subscribe_for_updates(self) -> None:
-        """Subscribe to state change events from Home Assistant."""
-        payload = {
-            "type": "subscribe_events",
-            "event_type": "state_changed"
-        }
-        self._send_with_id(payload, "subscribe")
+        Args:
+            timeout (float): The maximum wait in seconds, including a connection in progress.
+        """
+        async def refresh():
+            await asyncio.wait_for(self._ready.wait(), timeout)
+            await asyncio.wait_for(self._refresh_states(self._websocket), timeout)
+        asyncio.run_coroutine_threadsafe(refresh(), self.loop).result(timeout * 2)
 
     def change_light(self, light: Any, data: Dict[str, Any]) -> None:
         """
-        Change the state of a light in Home Assistant.
+        Change the state of a light in Home Assistant, the call is queued and coalesced with the unsent calls of the entity.
 
         Args:
             light (Any): The light object.
@@ -168,56 +349,34 @@ class HomeAssistantClient(WebSocketClient):
         if color_from_hsv:
             service_data['hs_color'] = [data['hue'], data['sat']]
 
-        self._send_with_id(payload, "service")
+        self.loop.call_soon_threadsafe(self._queue_change, service_data['entity_id'], payload)
 
-    def do_result(self, message: Dict[str, Any]) -> None:
-        """
-        Handle result messages from Home Assistant.
+    def _queue_change(self, entity_id: str, payload: Dict[str, Any]) -> None:
+        self.counters["calls"] += 1
+        queued = self.changes.get(entity_id)
+        if queued is not None:
+            self.counters["coalesced"] += 1
+            if queued["service"] == payload["service"]:
+                queued["service_data"].update(payload["service_data"])
+                return
+        self.changes[entity_id] = payload
+        self._changed.set()
 
-        Args:
-            message (Dict[str, Any]): The message.
-        """
-        if 'result' in message and message['result']:
-            message_type = self.id_to_type.pop(message['id'], None)
-            if message_type == "getstates":
-                latest_states.clear()
-                for ha_state in message['result']:
-                    if self._should_include(ha_state):
-                        entity_id = ha_state.get('entity_id', None)
-                        logging.info(f"Found {entity_id}")
-                        latest_states[entity_id] = ha_state
-                discovery_result.set()
-
-    def do_event(self, message: Dict[str, Any]) -> None:
+    def metrics(self) -> Dict[str, Any]:
         """
-        Handle event messages from Home Assistant.
+        Return the call counters and the latency per request type.
 
-        Args:
-            message (Dict[str, Any]): The message.
-        """
-        try:
-            event_type = message['event']['event_type']
-            if event_type == 'state_changed':
-                self.do_state_changed(message)
-        except KeyError:
-            logging.exception("No event_type in event")
-
-    def do_state_changed(self, message: Dict[str, Any]) -> None:
-        """
-        Handle state changed events from Home Assistant.
-
-        Args:
-            message (Dict[str, Any]): The message.
+        Returns:
+            Dict[str, Any]: The counters, queue sizes and latencies in milliseconds.
         """
-        try:
-            entity_id = message['event']['data']['entity_id']
-            new_state = message['event']['data']['new_state']
-            if self._should_include(new_state):
-                logging.debug("State update received for {}, new state {}".format(
-                    entity_id, new_state))
-                latest_states[entity_id] = new_state
-        except KeyError as e:
-            logging.exception("No state in event: {}".format(message))
+        result: Dict[str, Any] = dict(self.counters)
+        result["connected"] = self._ready.is_set()
+        result["subscribed_entities"] = "all" if self.subscribed_entities is None else len(self.subscribed_entities)
+        result["queued"] = len(self.changes)
+        result["in_flight"] = len(self.pending)
+        result["latency_ms"] = {message_type: {"count": count, "avg": round(total / count, 2), "max": round(maximum, 2)}
+                                for message_type, (count, total, maximum) in list(self.latency.items())}
+        return result
 
     def _should_include(self, ha_state: Dict[str, Any]) -> bool:
         """
@@ -242,65 +401,19 @@ class HomeAssistantClient(WebSocketClient):
                 should_include = diy_hue_flag == "include"
         return should_include
 
-    def _send_with_id(self, payload: Dict[str, Any], type_of_call: str) -> None:
-        """
-        Send a message with an ID to Home Assistant.
-
-        Args:
-            payload (Dict[str, Any]): The message payload.
-            type_of_call (str): The type of call.
-        """
-        payload['id'] = self.message_id
-        self.id_to_type[self.message_id] = type_of_call
-        self.message_id += 1
-        self._send(payload)
-
-    def _send(self, payload: Dict[str, Any]) -> None:
-        """
-        Send a message to Home Assistant.
-
-        Args:
-            payload (Dict[str, Any]): The message payload.
-        """
-        json_payload = json.dumps(payload)
-        self.send(json_payload)
-
 
 def connect_if_required() -> HomeAssistantClient:
     """
-    Connect to Home Assistant WebSocket if not already connected.
+    Create the Home Assistant WebSocket client if not already running, it keeps itself connected.
 
     Returns:
         HomeAssistantClient: The WebSocket client.
     """
-    if homeassistant_ws_client is None or homeassistant_ws_client.client_terminated:
-        create_websocket_client()
-
-    return homeassistant_ws_client
-
-
-def create_websocket_client() -> None:
-    """
-    Create a new WebSocket client for Home Assistant.
-    """
     global homeassistant_ws_client
-    global next_connection_error_log
-    global logging_backoff
-    if time.time() >= next_connection_error_log:
-        logging.warning(
-            "Home Assistant Web Socket Client disconnected trying to (re)connect")
-
-    try:
-        homeassistant_ws_client = HomeAssistantClient(
-            homeassistant_url, protocols=['http-only', 'chat'])
-        homeassistant_ws_client.connect()
-        logging.info("Home Assistant Web Socket Client connected")
-    except Exception as e:
-        if time.time() >= next_connection_error_log:
-            logging.exception("Error connecting to Home Assistant WebSocket: {}".format(e))
-            next_connection_error_log = time.time() + logging_backoff
-            logging_backoff *= 2
-        homeassistant_ws_client = None
+    with client_lock:
+        if homeassistant_ws_client is None:
+            homeassistant_ws_client = HomeAssistantClient(homeassistant_url, homeassistant_token)
+    return homeassistant_ws_client
 
 
 def create_ws_client(bridgeConfig: Dict[str, Any]) -> None:
@@ -334,14 +447,15 @@ def discover(detectedLights: List[Dict[str, Any]]) -> None:
         detectedLights (List[Dict[str, Any]]): The list to add discovered lights to.
     """
     logging.info("HomeAssistant WebSocket discovery called")
-    connect_if_required()
-    homeassistant_ws_client.get_all_lights()
+    client = connect_if_required()
     logging.info("HomeAssistant WebSocket discovery waiting for devices")
-    completed = discovery_result.wait(timeout=discovery_timeout_seconds)
-    logging.info("HomeAssistant WebSocket discovery devices received, timeout? {}".format(
-        not completed))
+    try:
+        client.get_all_lights()
+        logging.info("HomeAssistant WebSocket discovery devices received")
+    except Exception as e:
+        logging.warning(f"HomeAssistant WebSocket discovery failed, using the last known states: {e!r}")
     # This only loops over discovered devices so we have already filtered out what we don't want
-    for entity_id in latest_states.keys():
+    for entity_id in list(latest_states.keys()):
         ha_state = latest_states[entity_id]
         lightName = ha_state["attributes"].get("friendly_name", entity_id)
 
@@ -3,20 +3,23 @@ import math
 import ssl
 import weakref
 from datetime import datetime, timezone
-from threading import Thread
+from threading import Lock, Thread
 from time import sleep
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 import paho.mqtt.client as mqtt
 import requests
 
+import HueObjects
 import configManager
 import logManager
-from HueObjects import Sensor
+from HueObjects import Sensor, bumpStateVersion, groupsOfLight
 from functions.behavior_instance import checkBehaviorInstances
 from functions.core import nextFreeId
+from functions.messagePipeline import MessagePipeline
 from functions.rules import rulesProcessor
 from lights.discover import addNewLight
+from lights.protocols.mqtt import publisher
 from sensors.discover import addHueMotionSensor
 from sensors.sensor_types import sensorTypes
 
@@ -24,12 +27,20 @@ logging = logManager.logger.get_logger(__name__)
 bridgeConfig = configManager.bridgeConfig.yaml_config
 client = mqtt.Client()
 
-devices_ids: Dict[str, weakref.ReferenceType] = {}
+devices_ids: Dict[str, weakref.ReferenceType] = {}  # friendly name -> mqtt light or sensor
+sensors_uids: Dict[str, weakref.ReferenceType] = {}  # uniqueid -> sensor, resolves the companions of motion sensors
+unknown_devices: Set[str] = set()  # friendly names without a device, forgotten when the index is rebuilt
+indexVersion = -1  # HueObjects.deviceIndexVersion the index was built for
+indexLock = Lock()
+messagePipeline: Optional[MessagePipeline] = None  # created when the MQTT service starts
+rulesPipeline: Optional[MessagePipeline] = None  # single worker applying sensor messages and running the rules
 
 # Configuration stuff
 discoveryPrefix = "homeassistant"
 latestStates: Dict[str, Any] = {}
 discoveredDevices: Dict[str, Any] = {}
+z2mDevices: Dict[str, str] = {}  # zigbee2mqtt ieee address -> friendly name
+z2mGroups: List[Dict[str, Any]] = []  # last zigbee2mqtt/bridge/groups message
 
 motionSensors = ["TRADFRI motion sensor", "lumi.sensor_motion.aq2", "lumi.sensor_motion", "lumi.motion.ac02", "SML001"]
 standardSensors = {
@@ -215,33 +226,49 @@ def longPressButton(sensor: Sensor, buttonevent: int) -> None:
 
 def streamGroupEvent(device: Sensor, state: Dict[str, Any]) -> None:
     """Streams group events for a device."""
-    for id, group in bridgeConfig["groups"].items():
-        if id != "0":
-            for light in group.lights:
-                if light().id_v1 == device.id_v1:
-                    group.genStreamEvent(state)
+    for group in groupsOfLight(device):
+        if group.id_v1 != "0":
+            group.genStreamEvent(state)
+
+def refreshDeviceIndex() -> None:
+    """Rebuilds the friendly name and uniqueid indexes when lights or sensors were added, removed or readdressed."""
+    global devices_ids, sensors_uids, unknown_devices, indexVersion
+    if indexVersion == HueObjects.deviceIndexVersion:
+        return
+    with indexLock:
+        version = HueObjects.deviceIndexVersion
+        if indexVersion == version:
+            return
+        devices = {}
+        uids = {}
+        for resource in ["sensors", "lights"]:
+            for device in list(bridgeConfig[resource].values()):
+                if resource == "sensors" and device.uniqueid:
+                    uids.setdefault(device.uniqueid, weakref.ref(device))
+                if device.protocol != "mqtt":
+                    continue
+                if device.modelid == "SML001" and device.type != "ZLLPresence":
+                    continue  # motion sensors share the friendly name, messages belong to the presence sensor
+                if "friendly_name" in device.protocol_cfg:
+                    devices.setdefault(device.protocol_cfg["friendly_name"], weakref.ref(device))
+                if str(device.protocol_cfg.get("state_topic", "")).startswith("zigbee2mqtt/"):
+                    devices.setdefault(device.protocol_cfg["state_topic"][len("zigbee2mqtt/"):], weakref.ref(device))
+        devices_ids, sensors_uids, unknown_devices = devices, uids, set()
+        indexVersion = version
+        logging.debug(f"MQTT: indexed {len(devices)} devices")
 
 def getObject(friendly_name: str) -> Union[Sensor.Sensor, bool]:
     """Retrieves an object by its friendly name."""
-    if friendly_name in devices_ids:
-        logging.debug("Cache Hit for " + friendly_name)
-        return devices_ids[friendly_name]()
-    else:
-        for resource in ["sensors", "lights"]:
-            for key, device in bridgeConfig[resource].items():
-                if device.protocol == "mqtt":
-                    if "friendly_name" in device.protocol_cfg and device.protocol_cfg["friendly_name"] == friendly_name:
-                        if device.modelid == "SML001" and device.type != "ZLLPresence":
-                            continue
-                        devices_ids[friendly_name] = weakref.ref(device)
-                        logging.debug("Cache Miss " + friendly_name)
-                        return device
-                    elif "state_topic" in device.protocol_cfg and device.protocol_cfg["state_topic"] == "zigbee2mqtt/" + friendly_name:
-                        devices_ids[friendly_name] = weakref.ref(device)
-                        logging.debug("Cache Miss " + friendly_name)
-                        return device
+    refreshDeviceIndex()
+    if friendly_name in unknown_devices:
+        return False
+    device_ref = devices_ids.get(friendly_name)
+    device = device_ref() if device_ref else None
+    if device is None:
         logging.debug("Device not found for " + friendly_name)
+        unknown_devices.add(friendly_name)
         return False
+    return device
 
 def on_autodiscovery_light(msg: mqtt.MQTTMessage) -> None:
     """Handles auto-discovery messages for lights."""
@@ -255,6 +282,7 @@ def on_autodiscovery_light(msg: mqtt.MQTTMessage) -> None:
                 device_new = False
                 obj.protocol_cfg["command_topic"] = data["command_topic"]
                 obj.protocol_cfg["state_topic"] = data["state_topic"]
+                HueObjects.invalidateDeviceIndex()
                 break
 
         if device_new:
@@ -290,6 +318,15 @@ def on_autodiscovery_light(msg: mqtt.MQTTMessage) -> None:
 
             addNewLight(modelid, lightName, "mqtt", protocol_cfg)
 
+def updateGroupTopics() -> None:
+    """Hands the zigbee2mqtt groups to the light publisher so commands covering a whole group go out as one publish."""
+    groupTopics = {}
+    for group in z2mGroups:
+        members = [z2mDevices.get(member["ieee_address"]) for member in group.get("members", [])]
+        if members and None not in members:
+            groupTopics[frozenset(f"zigbee2mqtt/{member}/set" for member in members)] = f"zigbee2mqtt/{group['friendly_name']}/set"
+    publisher.setGroupTopics(groupTopics)
+
 def on_state_update(msg: mqtt.MQTTMessage) -> None:
     """Handles state update messages."""
     logging.debug("MQTT: got state message on " + msg.topic)
@@ -298,16 +335,37 @@ def on_state_update(msg: mqtt.MQTTMessage) -> None:
     logging.debug(json.dumps(data, indent=4))
 
 def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> None:
-    """Handles incoming MQTT messages."""
+    """Queues incoming MQTT messages for the worker pipeline, the paho network thread does no processing."""
+    if bridgeConfig["config"]["mqtt"]["enabled"]:
+        key, mergeable = messageKey(msg.topic)
+        messagePipeline.submit(key, msg, mergeable)
+
+def messageKey(topic: str) -> Tuple[str, bool]:
+    """Returns the ordering key of a topic and whether its messages are full light states superseding each other."""
+    if topic.startswith(discoveryPrefix + "/") or topic.startswith("zigbee2mqtt/bridge/"):
+        return "bridge", False  # discovery and bridge messages create objects, keep them on one worker
+    friendly_name = topic[topic.find("/") + 1:]
+    device_ref = devices_ids.get(friendly_name)
+    device = device_ref() if device_ref else None
+    # sensor messages carry events (button presses, occupancy) and must all be processed
+    return friendly_name, device is not None and device.getObjectPath()["resource"] == "lights"
+
+def handleMessage(msg: mqtt.MQTTMessage) -> None:
+    """Processes an MQTT message on a pipeline worker."""
     if bridgeConfig["config"]["mqtt"]["enabled"]:
         try:
-            current_time = datetime.now()
             logging.debug("MQTT: got state message on " + msg.topic)
             data = json.loads(msg.payload)
             logging.debug(msg.payload)
             if msg.topic.startswith(discoveryPrefix + "/light/"):
                 on_autodiscovery_light(msg)
+            elif msg.topic == "zigbee2mqtt/bridge/groups":
+                z2mGroups[:] = data
+                updateGroupTopics()
             elif msg.topic == "zigbee2mqtt/bridge/devices":
+                z2mDevices.clear()
+                z2mDevices.update({key["ieee_address"]: key["friendly_name"] for key in data if "ieee_address" in key})
+                updateGroupTopics()
                 for key in data:
                     if "model_id" in key and (key["model_id"] in standardSensors or key["model_id"] in motionSensors):
                         if not getObject(key["friendly_name"]):
@@ -330,6 +388,7 @@ def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> Non
                                         "id_v1": new_sensor_id
                                     }
                                     bridgeConfig["sensors"][new_sensor_id] = Sensor.Sensor(sensorData)
+                                    HueObjects.invalidateDeviceIndex()
                             elif key["model_id"] in motionSensors:
                                 logging.info("MQTT: add new motion sensor " + key["model_id"])
                                 addHueMotionSensor(key["friendly_name"], "mqtt", {"modelid": key["model_id"], "lightSensor": "on", "friendly_name": key["friendly_name"]})
@@ -345,54 +404,13 @@ def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> Non
                 elif data["type"] == "zigbee_publish_error":
                     logging.info(light.name + " is unreachable")
                     light.state["reachable"] = False
+                    bumpStateVersion()
             else:
                 device_friendlyname = msg.topic[msg.topic.index("/") + 1:]
                 device = getObject(device_friendlyname)
                 if device:
                     if device.getObjectPath()["resource"] == "sensors":
-                        if "battery" in data and isinstance(data["battery"], int):
-                            device.config["battery"] = data["battery"]
-                        if not device.config["on"]:
-                            return
-                        convertedPayload = {"lastupdated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
-                        if ("action" in data and data["action"] == "") or ("click" in data and data["click"] == ""):
-                            return
-                        if device.modelid in motionSensors:
-                            convertedPayload["presence"] = data["occupancy"]
-                            lightPayload = {"lastupdated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
-                            lightSensor = findLightSensor(device)
-                            if "temperature" in data:
-                                tempSensor = findTempSensor(device)
-                                tempSensor.state = {"temperature": int(data["temperature"] * 100), "lastupdated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
-                            if "illuminance_lux" in data:
-                                hue_lightlevel = int(10000 * math.log10(data["illuminance_lux"])) if data["illuminance_lux"] != 0 else 0
-                                lightPayload["dark"] = hue_lightlevel <= lightSensor.config["tholddark"]
-                                lightPayload["lightlevel"] = hue_lightlevel
-                            elif lightSensor.protocol_cfg["lightSensor"] == "on":
-                                lightPayload["dark"] = not bridgeConfig["sensors"]["1"].state["daylight"]
-                                lightPayload["lightlevel"] = 6000 if lightPayload["dark"] else 25000
-                            else:
-                                lightPayload["dark"] = True
-                                lightPayload["lightlevel"] = 6000
-                            lightPayload["daylight"] = not lightPayload["dark"]
-                            if lightPayload["dark"] != lightSensor.state["dark"]:
-                                lightSensor.dxState["dark"] = current_time
-                            lightSensor.state.update(lightPayload)
-                            if data["occupancy"] and bridgeConfig["config"]["alarm"]["enabled"] and bridgeConfig["config"]["alarm"]["lasttriggered"] + 300 < current_time.timestamp():
-                                logging.info("Alarm triggered, sending email...")
-                                requests.post("https://diyhue.org/cdn/mailNotify.php", json={"to": bridgeConfig["config"]["alarm"]["email"], "sensor": device.name}, timeout=10)
-                                bridgeConfig["config"]["alarm"]["lasttriggered"] = int(current_time.timestamp())
-                        elif device.modelid in standardSensors:
-                            convertedPayload.update(standardSensors[device.modelid]["dataConversion"][data[standardSensors[device.modelid]["dataConversion"]["rootKey"]]])
-                        for key in convertedPayload.keys():
-                            if device.state[key] != convertedPayload[key]:
-                                device.dxState[key] = current_time
-                        device.state.update(convertedPayload)
-                        logging.debug(convertedPayload)
-                        if "buttonevent" in convertedPayload and convertedPayload["buttonevent"] in [1001, 2001, 3001, 4001, 5001]:
-                            Thread(target=longPressButton, args=[device, convertedPayload["buttonevent"]]).start()
-                        rulesProcessor(device, current_time)
-                        checkBehaviorInstances(device)
+                        rulesPipeline.submit("rules", (device, data))
                     elif device.getObjectPath()["resource"] == "lights":
                         state = {"reachable": True}
                         v2State = {}
@@ -406,26 +424,80 @@ def on_message(client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage) -> Non
                             device.genStreamEvent(v2State)
                         device.state.update(state)
                         streamGroupEvent(device, v2State)
+                        if "command_topic" in device.protocol_cfg:
+                            publisher.observe(device.protocol_cfg["command_topic"], data)
 
                 on_state_update(msg)
         except Exception as e:
             logging.info("MQTT Exception | " + str(e))
 
+def handleSensorMessage(event: Tuple[Sensor.Sensor, Dict[str, Any]]) -> None:
+    """
+    Applies a sensor message and runs the rules and behaviors for it. Runs on the single rules pipeline worker,
+    the rules and behavior instances are not thread safe and each run sees the state of its own message.
+    """
+    device, data = event
+    try:
+        current_time = datetime.now()
+        if "battery" in data and isinstance(data["battery"], int):
+            device.config["battery"] = data["battery"]
+        if not device.config["on"]:
+            return
+        convertedPayload = {"lastupdated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+        if ("action" in data and data["action"] == "") or ("click" in data and data["click"] == ""):
+            return
+        if device.modelid in motionSensors:
+            convertedPayload["presence"] = data["occupancy"]
+            lightPayload = {"lastupdated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+            lightSensor = findLightSensor(device)
+            if "temperature" in data:
+                tempSensor = findTempSensor(device)
+                tempSensor.state = {"temperature": int(data["temperature"] * 100), "lastupdated": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+            if "illuminance_lux" in data:
+                hue_lightlevel = int(10000 * math.log10(data["illuminance_lux"])) if data["illuminance_lux"] != 0 else 0
+                lightPayload["dark"] = hue_lightlevel <= lightSensor.config["tholddark"]
+                lightPayload["lightlevel"] = hue_lightlevel
+            elif lightSensor.protocol_cfg["lightSensor"] == "on":
+                lightPayload["dark"] = not bridgeConfig["sensors"]["1"].state["daylight"]
+                lightPayload["lightlevel"] = 6000 if lightPayload["dark"] else 25000
+            else:
+                lightPayload["dark"] = True
+                lightPayload["lightlevel"] = 6000
+            lightPayload["daylight"] = not lightPayload["dark"]
+            if lightPayload["dark"] != lightSensor.state["dark"]:
+                lightSensor.dxState["dark"] = current_time
+            lightSensor.state.update(lightPayload)
+            if data["occupancy"] and bridgeConfig["config"]["alarm"]["enabled"] and bridgeConfig["config"]["alarm"]["lasttriggered"] + 300 < current_time.timestamp():
+                logging.info("Alarm triggered, sending email...")
+                Thread(target=requests.post, args=["https://diyhue.org/cdn/mailNotify.php"], kwargs={"json": {"to": bridgeConfig["config"]["alarm"]["email"], "sensor": device.name}, "timeout": 10}).start()
+                bridgeConfig["config"]["alarm"]["lasttriggered"] = int(current_time.timestamp())
+        elif device.modelid in standardSensors:
+            convertedPayload.update(standardSensors[device.modelid]["dataConversion"][data[standardSensors[device.modelid]["dataConversion"]["rootKey"]]])
+        for key in convertedPayload.keys():
+            if device.state[key] != convertedPayload[key]:
+                device.dxState[key] = current_time
+        device.state.update(convertedPayload)
+        logging.debug(convertedPayload)
+        if "buttonevent" in convertedPayload and convertedPayload["buttonevent"] in [1001, 2001, 3001, 4001, 5001]:
+            Thread(target=longPressButton, args=[device, convertedPayload["buttonevent"]]).start()
+        rulesProcessor(device, current_time)
+        checkBehaviorInstances(device)
+    except Exception as e:
+        logging.info("MQTT Exception | " + str(e))
+
+def findCompanionSensor(sensor: Sensor, suffix: str) -> Optional[Sensor.Sensor]:
+    """Finds the sensor of the same device whose uniqueid ends with suffix instead."""
+    refreshDeviceIndex()
+    sensor_ref = sensors_uids.get(sensor.uniqueid[:-1] + suffix)
+    return sensor_ref() if sensor_ref else None
+
 def findLightSensor(sensor: Sensor) -> Optional[Sensor.Sensor]:
     """Finds the light sensor associated with a given sensor."""
-    lightSensorUID = sensor.uniqueid[:-1] + "0"
-    for key, obj in bridgeConfig["sensors"].items():
-        if obj.uniqueid == lightSensorUID:
-            return obj
-    return None
+    return findCompanionSensor(sensor, "0")
 
 def findTempSensor(sensor: Sensor) -> Optional[Sensor.Sensor]:
     """Finds the temperature sensor associated with a given sensor."""
-    lightSensorUID = sensor.uniqueid[:-1] + "2"
-    for key, obj in bridgeConfig["sensors"].items():
-        if obj.uniqueid == lightSensorUID:
-            return obj
-    return None
+    return findCompanionSensor(sensor, "2")
 
 def convertHexToMac(hexValue: str) -> str:
     """Converts a hexadecimal value to a MAC address."""
@@ -440,6 +512,7 @@ def on_connect(client: mqtt.Client, userdata: Any, flags: Dict[str, int], rc: in
     client.subscribe(autodiscoveryTopic)
     client.subscribe("zigbee2mqtt/+")
     client.subscribe("zigbee2mqtt/bridge/devices")
+    client.subscribe("zigbee2mqtt/bridge/groups")
     client.subscribe("zigbee2mqtt/bridge/log")
 
 def mqttServer() -> None:
@@ -469,6 +542,10 @@ def mqttServer() -> None:
         if bridgeConfig["config"]["mqtt"]["mqttTlsInsecure"]:
             client.tls_insecure_set(bridgeConfig["config"]["mqtt"]["mqttTlsInsecure"])
 
+    global messagePipeline, rulesPipeline
+    if messagePipeline is None:
+        rulesPipeline = MessagePipeline("mqtt rules", handleSensorMessage, workers=1, blocking=True)
+        messagePipeline = MessagePipeline("mqtt", handleMessage)
     client.on_connect = on_connect
     client.on_message = on_message
     client.connect(bridgeConfig["config"]["mqtt"]["mqttServer"], bridgeConfig["config"]["mqtt"]["mqttPort"])
@@ -11,6 +11,7 @@ import logManager
 from flaskUI.v2restapi import getObject
 from functions.daylightSensor import daylightSensor
 from functions.request import sendRequest
+from functions.routines import routineRunner
 from functions.scripts import findGroup, triggerScript
 from services import updateManager
 
@@ -135,7 +136,7 @@ def process_behavior_instance(instance: str, obj: Any) -> None:
                     time_object = time_object + delta if "turn_lights_off_after" in obj.configuration and obj.active else time_object - delta
                 if check_time_match(time_object):
                     logging.info(f"execute timer: {obj.name}")
-                    Thread(target=triggerScript, args=[obj]).start()
+                    triggerScript(obj)
 
         elif "when_extended" in obj.configuration:
             if "recurrence_days" in obj.configuration["when_extended"]:
@@ -150,7 +151,7 @@ def process_behavior_instance(instance: str, obj: Any) -> None:
                         second=triggerTime.get("second", 0))
                     if check_time_match(time_object):
                         logging.info(f"end routine: {obj.name}")
-                        Thread(target=triggerScript, args=[obj]).start()
+                        triggerScript(obj)
             else:
                 if "start_at" in obj.configuration["when_extended"] and "time_point" in obj.configuration["when_extended"]["start_at"] and obj.configuration["when_extended"]["start_at"]["time_point"]["type"] == "time":
                     triggerTime = obj.configuration["when_extended"]["start_at"]["time_point"]["time"]
@@ -160,12 +161,12 @@ def process_behavior_instance(instance: str, obj: Any) -> None:
                         second=triggerTime.get("second", 0))
                     if check_time_match(time_object):
                         logging.info(f"execute routine: {obj.name}")
-                        Thread(target=triggerScript, args=[obj]).start()
+                        triggerScript(obj)
         elif "duration" in obj.configuration:
             if not obj.active and obj.enabled:
                 logging.info(f"execute timer: {obj.name}")
                 obj.active = True
-                Thread(target=triggerScript, args=[obj]).start()
+                triggerScript(obj)
 
 def process_smart_scene(smartscene: str, obj: Any) -> None:
     """
@@ -223,6 +224,7 @@ def runScheduler() -> None:
     """
     Run the scheduler to process schedules, behavior instances, and smart scenes.
     """
+    routineRunner.resume()
     while True:
         for schedule, obj in bridgeConfig["schedules"].items():
             try:
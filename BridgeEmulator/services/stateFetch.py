@@ -1,9 +1,9 @@
-from time import sleep
-from datetime import datetime, timedelta, timezone
+from time import monotonic, sleep
 from typing import Any, Dict
 
 import configManager
 from lights.protocols import protocols
+from HueObjects import bumpStateVersion
 import logManager
 
 logging = logManager.logger.get_logger(__name__)
@@ -36,18 +36,15 @@ def syncWithLights(off_if_unreachable: bool) -> None:
                             light.state["on"] = False
                         logging.warning(f"{light.name} is unreachable: {e}")
                     break
+        bumpStateVersion()
 
         sleep(10)  # wait at least 10 seconds before next sync
         i = 0
         while i < 300:  # sync with lights every 300 seconds or instant if one user is connected
-            for key, user in bridgeConfig["apiUsers"].items():
-                last_use: str = user.last_use_date
-                try:  # in case if last use is not a proper datetime
-                    last_use_dt: datetime = datetime.strptime(last_use, "%Y-%m-%dT%H:%M:%S")
-                    if abs(datetime.now(timezone.utc).replace(tzinfo=None) - last_use_dt) <= timedelta(seconds=2):
-                        i = 300
-                        break
-                except Exception as e:
-                    logging.warning(f"{user.last_use_date} is not a proper datetime: {e}")
+            now = monotonic()
+            for key, user in list(bridgeConfig["apiUsers"].items()):
+                if now - user.last_use <= 2:
+                    i = 300
+                    break
             i += 1
             sleep(1)
@@ -0,0 +1,281 @@
+import asyncio
+import json
+import threading
+import weakref
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiocoap import GET, POST, Context, Message
+
+import configManager
+import HueObjects
+import logManager
+from functions import asyncLoop, metrics
+
+logging = logManager.logger.get_logger(__name__)
+
+PORT = 5684
+REQUEST_TIMEOUT = 10  # seconds to wait for a response, DTLS handshake included
+MAX_BACKOFF = 60  # seconds between attempts to observe an unreachable light, doubling from 1 s
+MAPPING_CHECK = 5  # how often the observed lights are compared with the mapped lights
+WHITE_CT = {"f5faf6": 170, "f1e0b5": 320, "efd275": 470}  # white spectrum presets -> ct
+
+gateways: Dict[Tuple[str, str, str], "TradfriGateway"] = {}  # (ip, identity, psk) -> client
+gatewaysLock = threading.Lock()
+
+
+class TradfriError(Exception):
+    """A request was answered with an error code by the gateway."""
+
+
+def loadCredentials(context: Context, ip: str, identity: str, psk: str) -> None:
+    """Hand the DTLS pre-shared key for a gateway to a CoAP context."""
+    context.client_credentials.load_from_dict({f"coaps://{ip}:{PORT}/*": {"dtls": {"psk": psk.encode(), "client-identity": identity.encode()}}})
+
+
+async def coapRequest(context: Context, code: Any, ip: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Send a CoAP request to a gateway and decode the JSON response.
+
+    Args:
+        context (Context): The CoAP context holding the DTLS session.
+        code (Any): The request method.
+        ip (str): The gateway address.
+        path (str): The resource path, like 15001/65537.
+        payload (Optional[Dict[str, Any]]): The JSON body.
+
+    Returns:
+        Any: The decoded response, None when it is empty.
+    """
+    message = Message(code=code, uri=f"coaps://{ip}:{PORT}/{path}", payload=b"" if payload is None else json.dumps(payload).encode())
+    response = await asyncio.wait_for(context.request(message).response, REQUEST_TIMEOUT)
+    if not response.code.is_successful():
+        raise TradfriError(f"{path} answered {response.code}")
+    return json.loads(response.payload) if response.payload else None
+
+
+def lightState(device: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert the light control (3311) entry of a Tradfri device to a light state.
+
+    Args:
+        device (Dict[str, Any]): The device resource.
+
+    Returns:
+        Dict[str, Any]: The light state.
+    """
+    control = device["3311"][0]
+    state = {"on": bool(control["5850"]), "bri": control["5851"]}
+    if "5706" in control:
+        if control["5706"] in WHITE_CT:
+            state["ct"] = WHITE_CT[control["5706"]]
+    else:
+        state["ct"] = 470
+    return state
+
+
+class TradfriGateway:
+    """
+    CoAP client for one Tradfri gateway, running on the shared asyncio loop of functions.asyncLoop.
+
+    The DTLS session is set up once and shared by every request, concurrent requests are multiplexed on it by
+    CoAP token. The mapped lights are observed: the gateway pushes their state, which is applied to the lights
+    as it arrives, so they do not need to be polled.
+    """
+    def __init__(self, ip: str, identity: str, psk: str) -> None:
+        self.ip = ip
+        self.identity = identity
+        self.loop = asyncLoop.getLoop()
+        self.context: Context = asyncLoop.run(Context.create_client_context(), REQUEST_TIMEOUT)
+        loadCredentials(self.context, ip, identity, psk)
+        self.mapped: Dict[int, List[weakref.ReferenceType]] = {}  # device id -> lights
+        self.observed: Dict[int, asyncio.Task] = {}
+        self.states: Dict[int, Dict[str, Any]] = {}  # device id -> last state pushed by the gateway
+        self.mappingVersion = -1
+        self.counters = {"requests": 0, "errors": 0, "notifications": 0, "observe_failures": 0}
+        self.latency = [0, 0.0, 0.0]  # count, total ms, max ms
+        asyncio.run_coroutine_threadsafe(self._watchMapping(), self.loop)
+        metrics.register(f"tradfri {ip}", self.metrics)
+
+    async def _request(self, code: Any, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        self.counters["requests"] += 1
+        sent = monotonic()
+        try:
+            return await coapRequest(self.context, code, self.ip, path, payload)
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+        finally:
+            elapsed = (monotonic() - sent) * 1000
+            self.latency[0] += 1
+            self.latency[1] += elapsed
+            self.latency[2] = max(self.latency[2], elapsed)
+
+    def request(self, code: Any, path: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Send a request on the shared DTLS session and wait for the response.
+
+        Args:
+            code (Any): The request method.
+            path (str): The resource path, like 15001/65537.
+            payload (Optional[Dict[str, Any]]): The JSON body.
+
+        Returns:
+            Any: The decoded response.
+        """
+        return asyncLoop.run(self._request(code, path, payload), REQUEST_TIMEOUT + 1)
+
+    def requestAll(self, paths: List[str]) -> List[Any]:
+        """
+        GET several resources at once, the requests are in flight together.
+
+        Args:
+            paths (List[str]): The resource paths.
+
+        Returns:
+            List[Any]: The decoded responses, or the exception raised for a path.
+        """
+        async def gather():
+            return await asyncio.gather(*[self._request(GET, path) for path in paths], return_exceptions=True)
+        return asyncLoop.run(gather(), REQUEST_TIMEOUT + 1)
+
+    async def _watchMapping(self) -> None:
+        """Observes the lights mapped to this gateway, following lights being added, removed or readdressed."""
+        while True:
+            if self.mappingVersion != HueObjects.deviceIndexVersion:
+                self.mappingVersion = HueObjects.deviceIndexVersion
+                self._remap()
+            await asyncio.sleep(MAPPING_CHECK)
+
+    def _remap(self) -> None:
+        mapped: Dict[int, List[weakref.ReferenceType]] = {}
+        bridgeConfig = configManager.bridgeConfig.yaml_config  # read here, the light protocols import this module during config init
+        for light in list(bridgeConfig["lights"].values()):
+            if light.protocol == "tradfri" and light.protocol_cfg.get("ip") == self.ip and light.protocol_cfg.get("identity") == self.identity:
+                mapped.setdefault(int(light.protocol_cfg["id"]), []).append(weakref.ref(light))
+        self.mapped = mapped
+        for deviceId in list(self.observed):
+            if deviceId not in mapped:
+                self.observed.pop(deviceId).cancel()
+                self.states.pop(deviceId, None)
+        for deviceId in mapped:
+            if deviceId not in self.observed:
+                self.observed[deviceId] = self.loop.create_task(self._observe(deviceId))
+
+    async def _observe(self, deviceId: int) -> None:
+        """
+        Keeps an observation of a device registered, renewing it with an exponential backoff when it fails or
+        ends. The backoff is reset once the observation delivered a notification.
+        """
+        backoff = 1
+        while True:
+            request = self.context.request(Message(code=GET, uri=f"coaps://{self.ip}:{PORT}/15001/{deviceId}", observe=0))
+            try:
+                self._notify(deviceId, await asyncio.wait_for(request.response, REQUEST_TIMEOUT))
+                async for response in request.observation:
+                    self._notify(deviceId, response)
+                    backoff = 1
+                logging.debug(f"tradfri: gateway {self.ip} ended the observation of {deviceId}, renewing it in {backoff} s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["observe_failures"] += 1
+                logging.info(f"tradfri: observing {deviceId} on {self.ip} failed, retrying in {backoff} s: {e!r}")
+                self._unreachable(deviceId)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+            finally:
+                if request.observation is not None and not request.observation.cancelled:
+                    request.observation.cancel()
+
+    def _notify(self, deviceId: int, response: Message) -> None:
+        if not response.code.is_successful():
+            raise TradfriError(f"15001/{deviceId} answered {response.code}")
+        self.counters["notifications"] += 1
+        state = lightState(json.loads(response.payload))
+        self.states[deviceId] = state
+        for lightRef in self.mapped.get(deviceId, []):
+            light = lightRef()
+            if light is None:
+                continue
+            v2State: Dict[str, Any] = {}
+            if light.state.get("on") != state["on"]:
+                v2State["on"] = {"on": state["on"]}
+            if light.state.get("bri") != state["bri"]:
+                v2State["dimming"] = {"brightness": round(state["bri"] / 2.54, 2)}
+            if "ct" in state and light.state.get("ct") != state["ct"]:
+                v2State["color_temperature"] = {"mirek": state["ct"]}
+            changed = not light.state.get("reachable", True) or any(light.state.get(key) != value for key, value in state.items())
+            light.state.update(state)
+            light.state["reachable"] = True
+            if v2State:
+                light.genStreamEvent(v2State)
+            if changed:
+                HueObjects.bumpStateVersion()
+
+    def _unreachable(self, deviceId: int) -> None:
+        self.states.pop(deviceId, None)
+        for lightRef in self.mapped.get(deviceId, []):
+            light = lightRef()
+            if light is not None and light.state.get("reachable", True):
+                light.state["reachable"] = False
+                HueObjects.bumpStateVersion()
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Return the request counters, observations and latency.
+
+        Returns:
+            Dict[str, Any]: The counters, the number of observed devices and the request latency in milliseconds.
+        """
+        result: Dict[str, Any] = dict(self.counters)
+        result["observed"] = len(self.states)
+        count, total, maximum = self.latency
+        result["latency_ms"] = {"count": count, "avg": round(total / count, 2) if count else 0, "max": round(maximum, 2)}
+        return result
+
+
+def getGateway(ip: str, identity: str, psk: str) -> TradfriGateway:
+    """
+    Return the client of a gateway, creating it on first use.
+
+    Args:
+        ip (str): The gateway address.
+        identity (str): The identity registered on the gateway.
+        psk (str): The pre-shared key of the identity.
+
+    Returns:
+        TradfriGateway: The client.
+    """
+    key = (ip, identity, psk)
+    gateway = gateways.get(key)
+    if gateway is None:
+        with gatewaysLock:
+            gateway = gateways.get(key)
+            if gateway is None:
+                gateway = gateways[key] = TradfriGateway(ip, identity, psk)
+    return gateway
+
+
+def pair(ip: str, securityCode: str, identity: str) -> Dict[str, Any]:
+    """
+    Register an identity on a gateway, authenticating with the security code printed on it.
+
+    Args:
+        ip (str): The gateway address.
+        securityCode (str): The security code on the back of the gateway.
+        identity (str): The identity to register.
+
+    Returns:
+        Dict[str, Any]: The registration, the pre-shared key of the identity is in 9091.
+    """
+    async def register():
+        context = await Context.create_client_context()
+        try:
+            loadCredentials(context, ip, "Client_identity", securityCode)
+            return await coapRequest(context, POST, ip, "15011/9063", {"9090": identity})
+        finally:
+            await context.shutdown()
+    return asyncLoop.run(register(), REQUEST_TIMEOUT + 1)
@@ -0,0 +1,89 @@
+"""
+Helpers shared by the benchmarks: load the emulator on a throwaway config directory and fill it with devices.
+
+The benchmarks import the BridgeEmulator modules directly, run them from the repository root:
+
+    python benchmarks/<benchmark>.py
+"""
+import logging
+import os
+import sys
+import tempfile
+from copy import deepcopy
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Tuple
+
+BRIDGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "BridgeEmulator")
+
+def loadBridge() -> Tuple[Any, Dict[str, Any]]:
+    """
+    Import the emulator with an empty configuration in a temporary directory, the log file is written there too.
+
+    Returns:
+        Tuple[Any, Dict[str, Any]]: The Flask app and the bridge configuration.
+    """
+    workDir = tempfile.mkdtemp(prefix="diyhue-benchmark-")
+    sys.path.insert(0, os.path.abspath(BRIDGE_DIR))
+    os.chdir(workDir)
+    sys.argv = [sys.argv[0], "--config_path", workDir, "--ip", "127.0.0.1", "--mac", "aa:bb:cc:dd:ee:ff", "--no-serve-https"]
+    logging.disable(logging.WARNING)
+    import HueEmulator3
+    return HueEmulator3.app, HueEmulator3.bridgeConfig
+
+def addUser(bridgeConfig: Dict[str, Any]) -> str:
+    """
+    Register an API user.
+
+    Returns:
+        str: The username, also the hue-application-key.
+    """
+    from HueObjects import ApiUser
+    bridgeConfig["apiUsers"]["benchmark"] = ApiUser.ApiUser("benchmark", "benchmark", "benchmark#client", None)
+    return "benchmark"
+
+def addLights(count: int, roomSize: int = 10) -> List[Any]:
+    """
+    Add dummy color lights, grouped in rooms of roomSize lights. Unlike addNewLight the config is not saved
+    after every light, which would dominate the setup time.
+
+    Args:
+        count (int): The number of lights.
+        roomSize (int): The number of lights per room.
+
+    Returns:
+        List[Any]: The lights.
+    """
+    import configManager
+    from HueObjects import Group, Light, invalidateDeviceIndex
+    from functions.core import nextFreeId
+    from lights.light_types import lightTypes
+    bridgeConfig = configManager.bridgeConfig.yaml_config
+    lights = []
+    for index in range(count):
+        lightId = nextFreeId(bridgeConfig, "lights")
+        data = deepcopy(lightTypes["LCT015"])
+        data.update({"name": f"Light {lightId}", "id_v1": lightId, "modelid": "LCT015", "protocol": "dummy", "protocol_cfg": {}})
+        light = bridgeConfig["lights"][lightId] = Light.Light(data)
+        bridgeConfig["groups"]["0"].add_light(light)
+        lights.append(light)
+    invalidateDeviceIndex()
+    for start in range(0, count, roomSize):
+        groupId = nextFreeId(bridgeConfig, "groups")
+        room = Group.Group({"name": f"Room {start // roomSize}", "id_v1": groupId, "type": "Room", "class": "Living room"})
+        bridgeConfig["groups"][groupId] = room
+        for light in lights[start:start + roomSize]:
+            room.add_light(light)
+    return lights
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    """
+    Run a callable repeatedly.
+
+    Returns:
+        float: The mean duration of a call in microseconds.
+    """
+    func()  # warm up caches and lazy imports
+    begin = perf_counter()
+    for _ in range(repeat):
+        func()
+    return (perf_counter() - begin) / repeat * 1e6
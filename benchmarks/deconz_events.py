@@ -0,0 +1,107 @@
+"""
+Replay recorded deCONZ websocket events through services.deconz and report the events handled per second.
+
+A local stand-in serves the deCONZ REST config and sensor list and a websocket replaying
+fixtures/deconz_events.jsonl, the real websocket client, event pipeline and rules stage consume it.
+rulesProcessor is replaced by a sleep of --rules-ms, so the cost of the configured rules can be varied.
+
+    python benchmarks/deconz_events.py --events 20000 --rules-ms 1
+"""
+import argparse
+import asyncio
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from time import perf_counter, sleep
+
+import websockets
+
+from common import loadBridge
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def restStandIn(sensors: dict, websocketPort: int) -> ThreadingHTTPServer:
+    """Serve the deCONZ config and sensor list scanDeconz asks for."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            body = json.dumps({"websocketport": websocketPort} if self.path.endswith("/config") else sensors).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def websocketStandIn(frames: list, started: list, done: Event) -> int:
+    """Replay the frames to the first client connecting, return the port."""
+    ready = Event()
+    port = []
+
+    async def replay(websocket, *args) -> None:
+        await websocket.recv()  # the client says hello once it is ready to read
+        started.append(perf_counter())
+        for frame in frames:
+            await websocket.send(frame)
+        while not done.is_set():
+            await asyncio.sleep(0.05)
+
+    async def main() -> None:
+        async with websockets.serve(replay, "127.0.0.1", 0) as server:
+            port.append(server.sockets[0].getsockname()[1])
+            ready.set()
+            while not done.is_set():
+                await asyncio.sleep(0.05)
+
+    Thread(target=asyncio.run, args=[main()], daemon=True).start()
+    ready.wait()
+    return port[0]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--events", type=int, default=20000, help="frames replayed, the fixture is repeated as needed")
+    parser.add_argument("--rules-ms", type=float, default=1.0, help="time spent by each rules run, 0 runs the real rulesProcessor")
+    args = parser.parse_args()
+
+    _, bridgeConfig = loadBridge()
+    from functions.messagePipeline import pipelines
+    from services import deconz
+
+    with open(os.path.join(FIXTURES, "deconz_sensors.json")) as fixture:
+        sensors = json.load(fixture)
+    with open(os.path.join(FIXTURES, "deconz_events.jsonl")) as fixture:
+        recorded = [line.strip() for line in fixture if line.strip()]
+    frames = [recorded[index % len(recorded)] for index in range(args.events)]
+
+    if args.rules_ms > 0:
+        deconz.rulesProcessor = lambda sensor, current_time: sleep(args.rules_ms / 1000)
+
+    started: list = []
+    done = Event()
+    websocketPort = websocketStandIn(frames, started, done)
+    rest = restStandIn(sensors, websocketPort)
+    bridgeConfig["config"]["deconz"] = {"enabled": True, "deconzHost": "127.0.0.1", "deconzPort": rest.server_address[1], "deconzUser": "benchmark"}
+    deconz.scanDeconz()
+    for sensor in bridgeConfig["sensors"].values():
+        sensor.config["on"] = True  # new motion sensors start disabled, their events would skip the rules
+    Thread(target=deconz.websocketClient, daemon=True).start()
+
+    def counter(name: str, counter: str) -> int:
+        return pipelines[name].metrics()[counter] if name in pipelines else 0
+
+    while counter("deconz", "processed") < len(frames) or counter("deconz rules", "processed") < counter("deconz rules", "submitted"):
+        sleep(0.001)
+    elapsed = perf_counter() - started[0]
+    done.set()
+    rulesRuns = counter("deconz rules", "processed")
+    print(f"{len(frames)} events, {rulesRuns} rules runs of {args.rules_ms} ms: {elapsed:.2f} s, {len(frames) / elapsed:.0f} events/s")
+    print(json.dumps({name: pipelines[name].metrics() for name in ["deconz", "deconz rules"]}))
+
+if __name__ == "__main__":
+    main()
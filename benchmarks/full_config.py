@@ -0,0 +1,65 @@
+"""
+Time the serialisation of the full v1 config, GET /api/<user>, with the standard library and functions.jsonEncoder.
+
+The bridge holds 100 dummy lights in rooms, 200 group scenes and the default resources. jsonEncoder uses orjson
+when it is installed (see requirements.txt), the fallback row forces the standard library path it takes otherwise.
+
+    python benchmarks/full_config.py --lights 100 --rooms 30 --scenes 200
+"""
+import argparse
+import json
+import math
+import weakref
+
+from common import addLights, addUser, loadBridge, measure
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--lights", type=int, default=100, help="number of dummy lights")
+    parser.add_argument("--rooms", type=int, default=30, help="number of rooms the lights are spread over, rounded to whole rooms of equal size")
+    parser.add_argument("--scenes", type=int, default=200, help="number of group scenes, spread over the rooms")
+    parser.add_argument("--repeat", type=int, default=50, help="calls averaged per measurement")
+    args = parser.parse_args()
+
+    app, bridgeConfig = loadBridge()
+    from HueObjects import Scene
+    from flaskUI.responseCache import responseCache
+    from flaskUI.restful import buildConfig, buildV1Resources
+    from functions import jsonEncoder
+    from functions.core import nextFreeId
+    client = app.test_client()
+    username = addUser(bridgeConfig)
+    addLights(args.lights, roomSize=math.ceil(args.lights / args.rooms))
+    rooms = [group for group in bridgeConfig["groups"].values() if group.type == "Room"]
+    for index in range(args.scenes):
+        sceneId = nextFreeId(bridgeConfig, "scenes")
+        room = rooms[index % len(rooms)]
+        bridgeConfig["scenes"][sceneId] = Scene.Scene({"name": f"Scene {index}", "id_v1": sceneId, "owner": bridgeConfig["apiUsers"][username], "type": "GroupScene", "group": weakref.ref(room)})
+
+    data = {"config": buildConfig(), **buildV1Resources()}
+    orjson = jsonEncoder.orjson
+
+    def fallback() -> None:
+        jsonEncoder.orjson = None
+        try:
+            jsonEncoder.dumps(data)
+        finally:
+            jsonEncoder.orjson = orjson
+
+    def uncached() -> None:
+        responseCache.entries.clear()
+        client.get(f"/api/{username}")
+
+    print(f"{len(bridgeConfig['lights'])} lights, {len(rooms)} rooms, {len(bridgeConfig['scenes'])} scenes, {len(jsonEncoder.dumps(data)) / 1024:.0f} KiB")
+    rows = [
+        ("json.dumps", lambda: json.dumps(data)),
+        ("jsonEncoder" + (" (orjson)" if orjson else " (no orjson)"), lambda: jsonEncoder.dumps(data)),
+        ("jsonEncoder fallback", fallback),
+        ("GET miss", uncached),
+        ("GET hit", lambda: client.get(f"/api/{username}")),
+    ]
+    for name, func in rows:
+        print(f"{name:<24} {measure(func, args.repeat) / 1000:>8.2f} ms")
+
+if __name__ == "__main__":
+    main()
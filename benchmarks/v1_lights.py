@@ -0,0 +1,38 @@
+"""
+Time the v1 light list, GET /api/<user>/lights, at 50, 200 and 1000 dummy lights.
+
+Reports the rendering of the list as the handler builds it, the whole request on a response cache miss and
+the whole request answered from the response cache.
+
+    python benchmarks/v1_lights.py
+"""
+import argparse
+
+from common import addLights, addUser, loadBridge, measure
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--lights", type=int, nargs="+", default=[50, 200, 1000], help="light counts to measure")
+    args = parser.parse_args()
+
+    app, bridgeConfig = loadBridge()
+    from flaskUI.responseCache import responseCache
+    client = app.test_client()
+    username = addUser(bridgeConfig)
+    path = f"/api/{username}/lights"
+
+    def render() -> None:
+        {light: bridgeConfig["lights"][light].getV1Api().copy() for light in bridgeConfig["lights"]}
+
+    def uncached() -> None:
+        responseCache.entries.clear()
+        client.get(path)
+
+    print(f"{'lights':>8} {'render µs':>12} {'GET miss µs':>12} {'GET hit µs':>12}")
+    for count in sorted(args.lights):
+        addLights(count - len(bridgeConfig["lights"]))
+        repeat = max(5, 20000 // count)
+        print(f"{count:>8} {measure(render, repeat):>12.0f} {measure(uncached, repeat):>12.0f} {measure(lambda: client.get(path), repeat):>12.0f}")
+
+if __name__ == "__main__":
+    main()
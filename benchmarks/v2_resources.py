@@ -0,0 +1,50 @@
+"""
+Time GET /clip/v2/resource on 200 dummy lights and trace the memory it allocates.
+
+Reports the light part of the resource list (getV2Api, getDevice, getZigBee and getV2Entertainment of every
+light), the whole request on a response cache miss and the whole request answered from the response cache.
+
+    python benchmarks/v2_resources.py --lights 200
+"""
+import argparse
+import tracemalloc
+
+from common import addLights, addUser, loadBridge, measure
+
+def peakKiB(func) -> float:
+    """Return the peak traced allocation of one call in KiB."""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--lights", type=int, default=200, help="number of dummy lights")
+    parser.add_argument("--repeat", type=int, default=50, help="calls averaged per measurement")
+    args = parser.parse_args()
+
+    app, bridgeConfig = loadBridge()
+    from flaskUI.responseCache import responseCache
+    client = app.test_client()
+    headers = {"hue-application-key": addUser(bridgeConfig)}
+    lights = addLights(args.lights)
+
+    def lightResources() -> list:
+        return [(light.getV2Api(), light.getDevice(), light.getZigBee(), light.getV2Entertainment()) for light in lights]
+
+    def uncached() -> None:
+        responseCache.entries.clear()
+        client.get("/clip/v2/resource", headers=headers)
+
+    def cached() -> None:
+        client.get("/clip/v2/resource", headers=headers)
+
+    print(f"{args.lights} lights, {len(client.get('/clip/v2/resource', headers=headers).get_json()['data'])} resources")
+    print(f"{'':<16} {'µs':>10} {'peak KiB':>10}")
+    for name, func in [("light resources", lightResources), ("GET miss", uncached), ("GET hit", cached)]:
+        print(f"{name:<16} {measure(func, args.repeat):>10.0f} {peakKiB(func):>10.0f}")
+
+if __name__ == "__main__":
+    main()